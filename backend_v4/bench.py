@@ -0,0 +1,294 @@
+# bench.py - 任务 API 的可复现负载测试：进程内启动应用 + 假 LLM，输出吞吐量和延迟分位数（JSON）
+#
+# 用法示例：
+#   python bench.py --tasks 10000 --concurrency 32 --requests 5000 --output result.json
+#   python bench.py --baseline result.json   # 与上次结果比较，吞吐下降超过阈值时返回非零退出码
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, date, timedelta
+
+import httpx
+
+import main
+from fake_llm import FakeLLMClient, FakeLLMConfig, start_server
+
+# 各操作的默认权重
+DEFAULT_MIX = {
+    "create": 10,
+    "get": 30,
+    "update": 15,
+    "delete": 3,
+    "list": 1,
+    "calendar": 15,
+    "stats": 10,
+    "schedule": 3,
+    "ai_plan": 2,
+    "subtasks": 1,
+}
+
+PRIORITIES = ["low", "medium", "high"]
+TAGS = ["工作", "学习", "生活", "健康", "家庭"]
+
+def generate_tasks(n: int, seed: int, base: datetime):
+    """生成 n 个合成任务：截止日期分布在 ±60 天，部分已完成、部分带计划日期"""
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(n):
+        due = base + timedelta(days=rng.randint(-60, 60), hours=rng.randint(0, 23)) if rng.random() < 0.8 else None
+        completed = rng.random() < 0.3
+        tasks.append(main.Task(
+            id=str(uuid.UUID(int=rng.getrandbits(128))),
+            name=f"合成任务 {i}",
+            description="负载测试生成" if rng.random() < 0.5 else "",
+            completed=completed,
+            status=main.TaskStatus.COMPLETED if completed else main.TaskStatus.PENDING,
+            created_at=base - timedelta(days=rng.randint(0, 90)),
+            due_date=due,
+            priority=rng.choice(PRIORITIES),
+            estimated_hours=rng.choice([None, 0.5, 1.0, 2.0, 4.0]),
+            scheduled_date=(base + timedelta(days=rng.randint(-7, 30))).date() if rng.random() < 0.3 else None,
+            tags=rng.sample(TAGS, rng.randint(0, 2)),
+        ))
+    return tasks
+
+class Workload:
+    """混合负载：每个操作是一个协程，返回是否成功"""
+
+    def __init__(self, client: httpx.AsyncClient, task_ids, seed: int):
+        self.client = client
+        self.task_ids = list(task_ids)
+        self.rng = random.Random(seed)
+
+    def _pick_id(self):
+        return self.rng.choice(self.task_ids) if self.task_ids else str(uuid.uuid4())
+
+    async def create(self):
+        r = await self.client.post("/tasks", json={
+            "name": "新任务",
+            "priority": self.rng.choice(PRIORITIES),
+            "due_date": (datetime.now() + timedelta(days=self.rng.randint(0, 30))).isoformat(),
+        })
+        if r.status_code == 200:
+            self.task_ids.append(r.json()["id"])
+        return r.status_code == 200
+
+    async def get(self):
+        r = await self.client.get(f"/tasks/{self._pick_id()}")
+        return r.status_code in (200, 404)
+
+    async def update(self):
+        r = await self.client.put(f"/tasks/{self._pick_id()}", json={
+            "priority": self.rng.choice(PRIORITIES),
+            "completed": self.rng.random() < 0.2,
+        })
+        return r.status_code in (200, 404)
+
+    async def delete(self):
+        if not self.task_ids:
+            return True
+        task_id = self.task_ids.pop(self.rng.randrange(len(self.task_ids)))
+        r = await self.client.delete(f"/tasks/{task_id}")
+        return r.status_code in (200, 404)
+
+    async def list(self):
+        r = await self.client.get("/tasks")
+        return r.status_code == 200
+
+    async def calendar(self):
+        start = date.today() + timedelta(days=self.rng.randint(-30, 30))
+        end = start + timedelta(days=self.rng.choice([7, 31, 92]))
+        mode = self.rng.choice(["tasks", "counts"])
+        r = await self.client.get("/tasks/calendar", params={
+            "start": start.isoformat(), "end": end.isoformat(), "mode": mode,
+        })
+        return r.status_code == 200
+
+    async def stats(self):
+        r = await self.client.get("/stats")
+        return r.status_code == 200
+
+    async def schedule(self):
+        ids = self.rng.sample(self.task_ids, min(20, len(self.task_ids)))
+        r = await self.client.post("/ai/schedule-tasks", json={"task_ids": ids})
+        return r.status_code == 200
+
+    async def ai_plan(self):
+        r = await self.client.post("/ai/plan-tasks/async", json={"prompt": "准备周末的家庭聚会", "max_tasks": 3})
+        if r.status_code != 200:
+            return False
+        job = await self.client.get(f"/ai/jobs/{r.json()['job_id']}")
+        return job.status_code == 200 and job.json()["status"] != "failed"
+
+    async def subtasks(self):
+        ids = self.rng.sample(self.task_ids, min(5, len(self.task_ids)))
+        r = await self.client.post("/ai/suggest-subtasks/async", json={"task_ids": ids, "max_subtasks": 3})
+        if r.status_code != 200:
+            return False
+        job = await self.client.get(f"/ai/jobs/{r.json()['job_id']}")
+        return job.status_code == 200 and job.json()["status"] != "failed"
+
+def percentile(sorted_values, p: float) -> float:
+    """最近秩法分位数"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+async def run_workload(args, mix):
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+    ops = list(mix)
+    weights = [mix[op] for op in ops]
+    latencies = {op: [] for op in ops}
+    errors = {op: 0 for op in ops}
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    remaining = [args.requests]
+
+    async def worker(worker_id: int, workload: Workload):
+        rng = random.Random(args.seed * 1000 + worker_id)
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+            else:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            op = rng.choices(ops, weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = await getattr(workload, op)()
+            except Exception:
+                ok = False
+            latencies[op].append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors[op] += 1
+
+    task_ids = list(main.tasks_db)
+    workloads = [Workload(client, task_ids, args.seed + i) for i in range(args.concurrency)]
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i, w) for i, w in enumerate(workloads)))
+    elapsed = time.perf_counter() - started
+    await client.aclose()
+    return latencies, errors, elapsed
+
+def build_report(args, mix, latencies, errors, elapsed):
+    total = sum(len(v) for v in latencies.values())
+    operations = {}
+    for op, values in latencies.items():
+        values.sort()
+        operations[op] = {
+            "count": len(values),
+            "errors": errors[op],
+            "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0,
+            "p50_ms": round(percentile(values, 50), 3),
+            "p90_ms": round(percentile(values, 90), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+            "max_ms": round(values[-1], 3) if values else 0,
+        }
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "config": {
+            "tasks": args.tasks,
+            "concurrency": args.concurrency,
+            "requests": None if args.duration else args.requests,
+            "duration_s": args.duration,
+            "seed": args.seed,
+            "llm_latency_s": args.llm_latency,
+            "llm_error_rate": args.llm_error_rate,
+            "llm_malformed_rate": args.llm_malformed_rate,
+            "llm_server": args.llm_server,
+            "fast_json": main.FAST_JSON,
+            "mix": mix,
+        },
+        "total_requests": total,
+        "total_errors": sum(errors.values()),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+        "operations": operations,
+    }
+
+def compare(report, baseline, tolerance: float) -> bool:
+    """与基线比较，打印变化，吞吐下降超过 tolerance 时返回 False"""
+    ok = True
+    for op, current in report["operations"].items():
+        base = baseline.get("operations", {}).get(op)
+        if not base or not base["throughput_rps"] or not current["count"]:
+            continue
+        change = current["throughput_rps"] / base["throughput_rps"] - 1
+        print(f"{op:10s} rps {base['throughput_rps']:>10.1f} -> {current['throughput_rps']:>10.1f} ({change:+.1%})  "
+              f"p99 {base['p99_ms']:.2f} -> {current['p99_ms']:.2f} ms", file=sys.stderr)
+        if change < -tolerance:
+            ok = False
+    return ok
+
+def parse_mix(text: str):
+    """解析 --mix，例如 get=50,create=10"""
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in text.split(","):
+        op, weight = item.split("=")
+        if op not in DEFAULT_MIX:
+            raise SystemExit(f"未知操作: {op}")
+        mix[op] = float(weight)
+    return mix
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="任务 API 负载测试")
+    parser.add_argument("--tasks", type=int, default=10000, help="预先生成的任务数量")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发客户端数量")
+    parser.add_argument("--requests", type=int, default=5000, help="总请求数（与 --duration 二选一）")
+    parser.add_argument("--duration", type=float, default=None, help="运行秒数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mix", default="", help="操作权重，如 get=50,create=10")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="假 LLM 每次调用的耗时（秒）")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="假 LLM 返回错误的比例")
+    parser.add_argument("--llm-malformed-rate", type=float, default=0.0, help="假 LLM 返回异常内容的比例")
+    parser.add_argument("--llm-server", action="store_true",
+                        help="通过 HTTP 访问本地假 LLM 服务（经过 OpenAI SDK），而不是进程内替身")
+    parser.add_argument("--output", default="-", help="结果 JSON 输出路径，- 表示标准输出")
+    parser.add_argument("--baseline", default=None, help="用于比较的历史结果 JSON")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="允许的吞吐下降比例")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    llm_config = FakeLLMConfig(
+        latency=args.llm_latency,
+        error_rate=args.llm_error_rate,
+        malformed_rate=args.llm_malformed_rate,
+        seed=args.seed,
+    )
+    if args.llm_server:
+        _, base_url = start_server(llm_config)
+        main.client = main.create_ai_client(main.settings.model_copy(update={"llm_base_url": base_url}))
+    else:
+        main.client = FakeLLMClient(llm_config)
+    main.tasks_db.clear()
+    for task in generate_tasks(args.tasks, args.seed, datetime.now()):
+        main.save_task(task)
+
+    latencies, errors, elapsed = asyncio.run(run_workload(args, mix))
+    report = build_report(args, mix, latencies, errors, elapsed)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            if not compare(report, json.load(f), args.tolerance):
+                return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,169 @@
+# bench_journal.py - 持久化基准：日志写入吞吐、快照耗时、从日志/快照恢复的耗时
+#
+# 每个阶段在独立进程中运行（恢复阶段即冷启动），结果输出为 JSON：
+#   python bench_journal.py --tasks 1000000 --dir /tmp/todo-journal
+#   python bench_journal.py --tasks 100000 --sync always --concurrency 64
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+def _mb(size: int) -> float:
+    return round(size / 1024 / 1024, 2)
+
+def _dir_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+def _configure(args):
+    import main
+    main.configure(main.settings.model_copy(update={
+        "journal_sync": args.sync,
+        "journal_flush_ms": args.flush_ms,
+        "snapshot_every_mb": 1 << 20,  # 基准中手动触发快照
+    }))
+    return main
+
+def phase_write(args) -> dict:
+    """通过 save_task 写入 args.tasks 个任务；sync=always 时 concurrency 个协程并发写入并等待落盘"""
+    main = _configure(args)
+    import bench
+    from journal import Journal
+
+    started = time.perf_counter()
+    tasks = bench.generate_tasks(args.tasks, args.seed, datetime.now())
+    generated = time.perf_counter()
+
+    main.open_journal(args.dir)
+    journal = main.journal
+
+    async def write_all():
+        it = iter(tasks)
+
+        async def worker():
+            for task in it:
+                main.save_task(task)
+                await main.journal_barrier()
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+    begin = time.perf_counter()
+    asyncio.run(write_all())
+    main.close_journal()
+    elapsed = time.perf_counter() - begin
+
+    # 只测日志本身：预先编码好的记录直接追加
+    raw_dir = os.path.join(args.dir, "raw")
+    records = [(task.id, main.encode_task(task)) for task in tasks]
+    raw = Journal(raw_dir, sync="batch", flush_interval=args.flush_ms / 1000)
+    raw.recover()
+    raw.open()
+    raw_begin = time.perf_counter()
+    for key, value in records:
+        raw.append_put(key, value)
+    raw.close()
+    raw_elapsed = time.perf_counter() - raw_begin
+    raw_size = _dir_size(raw_dir)
+    shutil.rmtree(raw_dir)
+
+    return {
+        "generate_s": round(generated - started, 3),
+        "write_s": round(elapsed, 3),
+        "write_tasks_per_s": round(args.tasks / elapsed, 1),
+        "fsyncs": journal.fsyncs,
+        "records_per_fsync": round(journal.last_seq / max(journal.fsyncs, 1), 1),
+        "journal_mb": _mb(_dir_size(args.dir)),
+        "raw_append_s": round(raw_elapsed, 3),
+        "raw_append_records_per_s": round(len(records) / raw_elapsed, 1),
+        "raw_append_mb_per_s": round(raw_size / 1024 / 1024 / raw_elapsed, 1),
+    }
+
+def phase_recover(args) -> dict:
+    """冷启动恢复：读取（mmap 解析记录）和重建存储（模型校验 + 索引）分开计时；--snapshot 时随后写一次快照"""
+    main = _configure(args)
+    from journal import Journal
+
+    begin = time.perf_counter()
+    journal = Journal(args.dir, sync=args.sync)
+    state = journal.recover()
+    read = time.perf_counter()
+    for data in state.values():
+        main.save_task(main.decode_task(data))
+    rebuilt = time.perf_counter()
+    result = {
+        "tasks": len(main.tasks_db),
+        "read_s": round(read - begin, 3),
+        "rebuild_s": round(rebuilt - read, 3),
+        "recover_s": round(rebuilt - begin, 3),
+    }
+
+    if args.snapshot:
+        journal.open()
+        main.journal = journal
+        main.task_listeners.append(main._journal_task)
+        snap_begin = time.perf_counter()
+        main.take_snapshot()
+        result["snapshot_s"] = round(time.perf_counter() - snap_begin, 3)
+        main.close_journal()
+        result["snapshot_mb"] = _mb(os.path.getsize(journal.snapshot_path))
+    return result
+
+def run_phase(args, phase: str, extra=()) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--phase", phase, "--dir", args.dir,
+               "--tasks", str(args.tasks), "--sync", args.sync, "--flush-ms", str(args.flush_ms),
+               "--concurrency", str(args.concurrency), "--seed", str(args.seed), *extra]
+    output = subprocess.run(command, capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="持久化日志基准")
+    parser.add_argument("--tasks", type=int, default=1000000)
+    parser.add_argument("--dir", default=None, help="数据目录（默认使用临时目录，结束后删除）")
+    parser.add_argument("--sync", default="batch", choices=["always", "batch"])
+    parser.add_argument("--flush-ms", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=1, help="并发写入协程数（sync=always 时体现组提交）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="-", help="结果 JSON 输出路径，- 表示标准输出")
+    parser.add_argument("--phase", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--snapshot", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.phase == "write":
+        print(json.dumps(phase_write(args)))
+        return 0
+    if args.phase == "recover":
+        print(json.dumps(phase_recover(args)))
+        return 0
+
+    temporary = args.dir is None
+    args.dir = args.dir or tempfile.mkdtemp(prefix="todo-journal-")
+    try:
+        report = {
+            "python": platform.python_version(),
+            "config": {"tasks": args.tasks, "sync": args.sync, "flush_ms": args.flush_ms,
+                       "concurrency": args.concurrency},
+            "write": run_phase(args, "write"),
+            "recover_from_journal": run_phase(args, "recover", ["--snapshot"]),
+            "recover_from_snapshot": run_phase(args, "recover"),
+        }
+    finally:
+        if temporary:
+            shutil.rmtree(args.dir, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,162 @@
+# bench_live.py - 实时推送负载测试：大量空闲 WebSocket 连接的内存占用、写入时的分发延迟、慢连接是否拖慢写入
+#
+# 不依赖 WebSocket 客户端库和服务器，直接按 ASGI 协议在进程内建立连接：
+#   python bench_live.py --connections 5000 --events 200
+#   python bench_live.py --connections 10000 --slow 500 --output live.json
+# 慢连接的 send 永远不返回（模拟网络阻塞的客户端），它们的队列会溢出并收到 resync
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import bench
+import main
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+def percentile(values, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+class Connection:
+    """进程内的 ASGI WebSocket 客户端"""
+
+    def __init__(self, slow: bool, on_message):
+        self.slow = slow
+        self.on_message = on_message
+        self.accepted = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.received = 0
+        self.task = None
+
+    async def receive(self):
+        if not self.accepted.is_set():
+            return {"type": "websocket.connect"}
+        await self.closed.wait()
+        return {"type": "websocket.disconnect", "code": 1000}
+
+    async def send(self, message):
+        if message["type"] == "websocket.accept":
+            self.accepted.set()
+        elif message["type"] == "websocket.send":
+            if self.slow:
+                await self.closed.wait()  # 阻塞直到断开
+                return
+            self.received += 1
+            self.on_message(self, message["text"])
+
+    def open(self):
+        scope = {"type": "websocket", "asgi": {"version": "3.0"}, "path": "/tasks/live", "raw_path": b"/tasks/live",
+                 "query_string": b"", "headers": [(b"host", b"bench")], "subprotocols": [], "scheme": "ws",
+                 "client": ("127.0.0.1", 0), "server": ("bench", 80)}
+        self.task = asyncio.create_task(main.app(scope, self.receive, self.send))
+
+async def run(args) -> dict:
+    tasks = bench.generate_tasks(args.events, args.seed, datetime.now())
+    pending = {}  # 消息序号 -> [发布时间, 尚未收到的快连接数]
+    latencies = []
+    resyncs = [0]
+    done = asyncio.Event()
+
+    def on_message(connection, text):
+        if text == '{"type":"resync"}':
+            resyncs[0] += 1
+            return
+        # 只取出 version，避免逐条完整解析拖慢测量
+        start = text.index('"version":') + 10
+        version = int(text[start:text.index(",", start)])
+        entry = pending.get(version)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] == 0:
+            latencies.append(time.perf_counter() - entry[0])
+            del pending[version]
+            if not pending:
+                done.set()
+
+    gc.collect()
+    base_rss = rss_mb()
+    begin = time.perf_counter()
+    connections = [Connection(i < args.slow, on_message) for i in range(args.connections)]
+    for connection in connections:
+        connection.open()
+    await asyncio.gather(*(c.accepted.wait() for c in connections))
+    connect_s = time.perf_counter() - begin
+    gc.collect()
+    idle_rss = rss_mb()
+    fast = args.connections - args.slow
+
+    # 逐个写入任务；记录发布方（save_task）耗时和所有快连接都收到的耗时
+    publish_times = []
+    for task in tasks:
+        started = time.perf_counter()
+        main.save_task(task)
+        publish_times.append(time.perf_counter() - started)
+        pending[main.store_version] = [started, fast]
+        done.clear()
+        await asyncio.wait_for(done.wait(), timeout=60)
+
+    # 突发写入：不让出事件循环连续写入，检验有界队列的溢出处理
+    burst = bench.generate_tasks(args.burst, args.seed + 1, datetime.now())
+    started = time.perf_counter()
+    for task in burst:
+        main.save_task(task)
+    burst_publish_s = time.perf_counter() - started
+    await asyncio.sleep(0.5)
+
+    begin = time.perf_counter()
+    for connection in connections:
+        connection.closed.set()
+    await asyncio.gather(*(c.task for c in connections), return_exceptions=True)
+    disconnect_s = time.perf_counter() - begin
+
+    return {
+        "connections": args.connections,
+        "slow_connections": args.slow,
+        "connect_s": round(connect_s, 3),
+        "rss_per_connection_kb": round((idle_rss - base_rss) * 1024 / args.connections, 2),
+        "events": len(tasks),
+        "publish_p50_us": round(percentile(publish_times, 0.5) * 1e6, 1),
+        "publish_p99_us": round(percentile(publish_times, 0.99) * 1e6, 1),
+        "delivery_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "delivery_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "burst_events": args.burst,
+        "burst_publish_per_s": round(args.burst / burst_publish_s, 1),
+        "overflows": main.change_hub.overflows,
+        "resyncs_delivered": resyncs[0],
+        "disconnect_s": round(disconnect_s, 3),
+        "connections_after": len(main.change_hub),
+    }
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="实时推送负载测试")
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--slow", type=int, default=100, help="其中 send 永远阻塞的连接数")
+    parser.add_argument("--events", type=int, default=200, help="逐个写入并等待送达的任务数")
+    parser.add_argument("--burst", type=int, default=1000, help="连续写入（不等待送达）的任务数")
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="-", help="结果 JSON 输出路径，- 表示标准输出")
+    args = parser.parse_args(argv)
+
+    main.configure(main.settings.model_copy(update={"live_queue_size": args.queue_size}))
+    report = {"python": platform.python_version(), **asyncio.run(run(args))}
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,100 @@
+# bench_models.py - 模型校验/序列化吞吐：单个创建、批量导入、大列表输出（默认路径和快速路径）、日志回放时的反序列化
+#
+# 只通过 HTTP 接口和公开函数测量，可以在不同版本的代码上运行后对比：
+#   python bench_models.py --tasks 20000
+#   python bench_models.py --tasks 20000 --output models.json
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+import bench
+import main
+
+def _rate(count: int, elapsed: float) -> float:
+    return round(count / elapsed, 1)
+
+def bench_single_create(client, count: int) -> dict:
+    """POST /tasks：请求体校验 + 构造任务 + 响应序列化"""
+    body = {"name": "基准任务", "description": "单个创建", "priority": "high",
+            "due_date": "2030-01-01T09:00:00", "estimated_hours": 2, "tags": ["bench"]}
+    begin = time.perf_counter()
+    for _ in range(count):
+        client.post("/tasks", json=body)
+    return {"requests": count, "per_s": _rate(count, time.perf_counter() - begin)}
+
+def bench_import(client, tasks) -> dict:
+    """POST /tasks/import?format=ndjson：逐行校验并批量写入"""
+    lines = []
+    for task in tasks:
+        data = task.model_dump(mode="json", include={"name", "description", "priority", "due_date",
+                                                     "estimated_hours", "scheduled_date", "tags"})
+        lines.append(json.dumps(data, ensure_ascii=False))
+    payload = ("\n".join(lines) + "\n").encode("utf-8")
+    begin = time.perf_counter()
+    job_id = client.post("/tasks/import?format=ndjson", content=payload).json()["job_id"]
+    while True:
+        job = client.get(f"/tasks/import/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            break
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - begin
+    return {"rows": len(tasks), "imported": job["imported"], "rows_per_s": _rate(len(tasks), elapsed)}
+
+def bench_listing(client, rounds: int) -> dict:
+    """GET /tasks：默认路径（response_model 校验）、快速路径冷缓存和热缓存"""
+    result = {"tasks": len(main.tasks_db)}
+    for name, fast, cold in (("response_model", False, False), ("fast_cold", True, True), ("fast_warm", True, False)):
+        main.FAST_JSON = fast
+        client.get("/tasks")
+        begin = time.perf_counter()
+        for _ in range(rounds):
+            if cold:
+                main._task_json_cache.clear()
+            client.get("/tasks")
+        result[name + "_ms"] = round((time.perf_counter() - begin) / rounds * 1000, 2)
+    main.FAST_JSON = True
+    return result
+
+def bench_decode(tasks) -> dict:
+    """日志回放路径：从 JSON 字节反序列化任务"""
+    blobs = [main.encode_task(task) for task in tasks]
+    begin = time.perf_counter()
+    for blob in blobs:
+        main.Task.model_validate_json(blob)
+    return {"tasks": len(blobs), "per_s": _rate(len(blobs), time.perf_counter() - begin)}
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="模型校验/序列化吞吐基准")
+    parser.add_argument("--tasks", type=int, default=20000)
+    parser.add_argument("--creates", type=int, default=2000, help="单个创建的请求数")
+    parser.add_argument("--rounds", type=int, default=10, help="列表请求的轮数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="-", help="结果 JSON 输出路径，- 表示标准输出")
+    args = parser.parse_args(argv)
+
+    tasks = bench.generate_tasks(args.tasks, args.seed, datetime.now())
+    with TestClient(main.app) as client:
+        report = {
+            "python": platform.python_version(),
+            "config": {"tasks": args.tasks, "creates": args.creates, "rounds": args.rounds},
+            "single_create": bench_single_create(client, args.creates),
+            "import": bench_import(client, tasks),
+            "listing": bench_listing(client, args.rounds),
+            "decode": bench_decode(list(main.tasks_db.values())),
+        }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,52 @@
+# bench_serialization.py - 对比 GET /tasks 的默认序列化与快速序列化路径
+import time
+import uuid
+import random
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+import main
+
+TASK_COUNT = 10000
+ROUNDS = 20
+
+def seed_tasks(n):
+    """生成 n 个测试任务直接写入内存存储"""
+    main.tasks_db.clear()
+    main._task_json_cache.clear()
+    now = datetime.now()
+    for i in range(n):
+        task = main.Task(
+            id=str(uuid.uuid4()),
+            name=f"任务 {i}",
+            description="基准测试生成的任务描述",
+            created_at=now,
+            due_date=now + timedelta(days=random.randint(-10, 30)),
+            priority=random.choice(["low", "medium", "high"]),
+            estimated_hours=random.choice([None, 1.0, 2.5]),
+            tags=["bench"],
+        )
+        main.tasks_db[task.id] = task
+
+def run(client, fast):
+    main.FAST_JSON = fast
+    body = client.get("/tasks").content  # 预热（快速路径在这里填充缓存）
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        client.get("/tasks")
+    elapsed = time.perf_counter() - start
+    return ROUNDS / elapsed, len(body)
+
+if __name__ == "__main__":
+    random.seed(0)
+    seed_tasks(TASK_COUNT)
+    client = TestClient(main.app)
+
+    slow_rps, slow_size = run(client, fast=False)
+    fast_rps, fast_size = run(client, fast=True)
+
+    print(f"任务数量: {TASK_COUNT}")
+    print(f"默认路径: {slow_rps:.1f} req/s ({slow_size} bytes)")
+    print(f"快速路径: {fast_rps:.1f} req/s ({fast_size} bytes)")
+    print(f"提升: {fast_rps / slow_rps:.1f}x")
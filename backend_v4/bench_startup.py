@@ -0,0 +1,125 @@
+# bench_startup.py - 冷启动基准：在新进程中测量导入耗时、应用启动（lifespan）耗时和首个请求的完成时间
+#
+# 用法示例：
+#   python bench_startup.py --runs 10
+#   python bench_startup.py --runs 10 --path /stats --output startup.json
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+def _asgi_request(app, path: str):
+    """不依赖 HTTP 客户端库，直接按 ASGI 协议执行 lifespan 启动和一次 GET 请求"""
+
+    async def run():
+        startup = asyncio.Event()
+        lifespan_queue: asyncio.Queue = asyncio.Queue()
+        await lifespan_queue.put({"type": "lifespan.startup"})
+
+        async def lifespan_receive():
+            return await lifespan_queue.get()
+
+        async def lifespan_send(message):
+            if message["type"] == "lifespan.startup.complete":
+                startup.set()
+
+        lifespan = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}},
+                                           lifespan_receive, lifespan_send))
+        await startup.wait()
+        started = time.perf_counter()
+
+        status = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        path_only, _, query = path.partition("?")
+        await app({
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path_only, "raw_path": path_only.encode(), "query_string": query.encode(),
+            "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 0), "server": ("bench", 80),
+        }, receive, send)
+        responded = time.perf_counter()
+
+        await lifespan_queue.put({"type": "lifespan.shutdown"})
+        await lifespan
+        return started, responded, status[0]
+
+    return asyncio.run(run())
+
+def child(path: str):
+    """子进程：输出各阶段耗时（秒）"""
+    t0 = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    started, responded, status = _asgi_request(main.app, path)
+    print(json.dumps({
+        "import_s": imported - t0,
+        "startup_s": started - imported,
+        "first_request_s": responded - started,
+        "ready_s": responded - t0,
+        "status": status,
+        "openai_imported": "openai" in sys.modules,
+    }))
+
+def run_once(path: str) -> dict:
+    begin = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", "--path", path],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    total = time.perf_counter() - begin
+    result = json.loads(output.strip().splitlines()[-1])
+    # 进程启动到首个请求完成（包含解释器启动），近似于新实例的 time-to-first-request
+    result["time_to_first_request_s"] = total
+    return result
+
+def summarize(values):
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 2),
+        "min_ms": round(min(values) * 1000, 2),
+        "max_ms": round(max(values) * 1000, 2),
+    }
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="API 进程冷启动基准")
+    parser.add_argument("--runs", type=int, default=5, help="启动次数")
+    parser.add_argument("--path", default="/tasks", help="首个请求的路径")
+    parser.add_argument("--output", default="-", help="结果 JSON 输出路径，- 表示标准输出")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.path)
+        return 0
+
+    runs = [run_once(args.path) for _ in range(args.runs)]
+    report = {
+        "python": platform.python_version(),
+        "runs": args.runs,
+        "path": args.path,
+        "status": sorted({r["status"] for r in runs}),
+        "openai_imported": any(r["openai_imported"] for r in runs),
+    }
+    for key in ("time_to_first_request_s", "import_s", "startup_s", "first_request_s"):
+        report[key.replace("_s", "")] = summarize([r[key] for r in runs])
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
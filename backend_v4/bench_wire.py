@@ -0,0 +1,128 @@
+# bench_wire.py - 响应传输格式基准：不同任务数下各表示形式 × 压缩方式的传输字节数和服务端 CPU 耗时
+#
+# 直接按 ASGI 协议在进程内调用 GET /tasks，统计实际发送的字节（压缩后）：
+#   python bench_wire.py --sizes 10,100,1000,10000
+#   python bench_wire.py --sizes 1000 --rounds 50 --output wire.json
+# 未安装 msgpack / brotli 时跳过对应的组合
+import argparse
+import asyncio
+import gzip
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+import bench
+import main
+import wire
+
+FORMATS = {
+    "json": [],
+    "json_compact": [(b"x-compact", b"1")],
+    "msgpack": [(b"accept", b"application/msgpack")],
+    "msgpack_compact": [(b"accept", b"application/msgpack"), (b"x-compact", b"1")],
+}
+ENCODINGS = ("identity", "gzip", "br")
+
+async def request(headers) -> tuple:
+    """返回 (响应头, 响应体)"""
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "path": "/tasks", "raw_path": b"/tasks", "query_string": b"", "root_path": "",
+             "headers": [(b"host", b"bench")] + headers, "scheme": "http",
+             "client": ("127.0.0.1", 0), "server": ("bench", 80)}
+    start = {}
+    chunks = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start.update(message)
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await main.app(scope, receive, send)
+    return dict(start["headers"]), b"".join(chunks)
+
+def decode(fmt: str, encoding: str, body: bytes):
+    """客户端侧：解压并解析"""
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding == "br":
+        body = wire.brotli.decompress(body)
+    if fmt.startswith("msgpack"):
+        return wire.msgpack.unpackb(body)
+    return json.loads(body)
+
+async def measure(size: int, rounds: int) -> list:
+    rows = []
+    for fmt, fmt_headers in FORMATS.items():
+        if fmt.startswith("msgpack") and wire.msgpack is None:
+            continue
+        for encoding in ENCODINGS:
+            if encoding == "br" and wire.brotli is None:
+                continue
+            headers = fmt_headers + [(b"accept-encoding", encoding.encode())]
+            response_headers, body = await request(headers)  # 预热各表示形式的任务缓存
+            assert response_headers.get(b"content-encoding", b"identity").decode() == encoding or \
+                len(body) < main.settings.compress_min_bytes
+            cpu = time.process_time()
+            wall = time.perf_counter()
+            for _ in range(rounds):
+                await request(headers)
+            cpu = (time.process_time() - cpu) / rounds
+            wall = (time.perf_counter() - wall) / rounds
+            begin = time.perf_counter()
+            decoded = decode(fmt, response_headers.get(b"content-encoding", b"").decode(), body)
+            decode_s = time.perf_counter() - begin
+            assert len(decoded) == size
+            rows.append({
+                "tasks": size, "format": fmt, "encoding": encoding,
+                "bytes": len(body),
+                "bytes_per_task": round(len(body) / size, 1),
+                "server_cpu_ms": round(cpu * 1000, 3),
+                "server_wall_ms": round(wall * 1000, 3),
+                "client_decode_ms": round(decode_s * 1000, 3),
+            })
+    return rows
+
+async def run(args) -> list:
+    rows = []
+    for size in args.sizes:
+        main.tasks_db.clear()
+        main._task_json_cache.clear()
+        main._task_variant_cache.clear()
+        for task in bench.generate_tasks(size, args.seed, datetime.now()):
+            main.tasks_db[task.id] = task
+        rows.extend(await measure(size, args.rounds))
+    return rows
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="响应传输格式基准")
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="逗号分隔的任务数")
+    parser.add_argument("--rounds", type=int, default=20, help="每个组合的请求次数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="-", help="结果 JSON 输出路径，- 表示标准输出")
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(",")]
+
+    report = {
+        "python": platform.python_version(),
+        "config": {"sizes": args.sizes, "rounds": args.rounds,
+                   "compress_min_bytes": main.settings.compress_min_bytes,
+                   "gzip_level": main.settings.gzip_level, "brotli_quality": main.settings.brotli_quality,
+                   "msgpack": wire.msgpack is not None, "brotli": wire.brotli is not None},
+        "results": asyncio.run(run(args)),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,71 @@
+# dates.py - 时区感知的日期层：写入时把时间归一化为 UTC 时间戳和纪元日序号，
+# 查询时按用户时区算出“今天”的边界，热点循环里只做数值比较
+import time
+from datetime import date, datetime, timedelta, tzinfo
+from functools import lru_cache
+from typing import Callable, Dict, NamedTuple, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+@lru_cache(maxsize=None)
+def get_zone(name: Optional[str]) -> Optional[tzinfo]:
+    """IANA 时区名 -> tzinfo；空值表示服务器本地时区（返回 None）；未知时区抛出 ValueError"""
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"未知时区: {name}")
+
+# 时区偏移不超过一天：取值范围两端各留两天余量，范围内的时间按任何时区换算时间戳和日期都不会越界
+SUPPORTED_MIN = datetime.min + timedelta(days=2)
+SUPPORTED_MAX = datetime.max - timedelta(days=2)
+
+# 按天的查询（日历、重复任务展开）会向两侧多取两天，可查询的日期在此基础上再各留两天
+MIN_DAY = (SUPPORTED_MIN + timedelta(days=2)).date()
+MAX_DAY = (SUPPORTED_MAX - timedelta(days=2)).date()
+
+def check_range(value: datetime) -> datetime:
+    """拒绝接近 datetime 取值范围两端的时间（用作 pydantic 校验器）"""
+    if not SUPPORTED_MIN <= value.replace(tzinfo=None) <= SUPPORTED_MAX:
+        raise ValueError(f"时间超出支持的范围（{SUPPORTED_MIN.date()} 至 {SUPPORTED_MAX.date()}）")
+    return value
+
+def to_timestamp(value: datetime, zone: Optional[tzinfo] = None) -> float:
+    """无时区的时间按 zone 解释（None 为本地时区），带时区的时间直接换算"""
+    if value.tzinfo is None and zone is not None:
+        value = value.replace(tzinfo=zone)
+    return value.timestamp()
+
+def epoch_day(ts: float, zone: Optional[tzinfo] = None) -> int:
+    """时间戳在 zone 中所在的日期，表示为 1970-01-01 起的天数"""
+    return datetime.fromtimestamp(ts, zone).toordinal() - EPOCH_ORDINAL
+
+def from_epoch_day(day: int) -> date:
+    return date.fromordinal(day + EPOCH_ORDINAL)
+
+def day_start(day: date, zone: Optional[tzinfo] = None) -> float:
+    """zone 中 day 当天零点的时间戳"""
+    return to_timestamp(datetime(day.year, day.month, day.day), zone)
+
+class DayWindow(NamedTuple):
+    day: date
+    start: float  # 当天零点
+    end: float  # 次日零点
+
+class Clock:
+    """按时区缓存“今天”的边界，跨过午夜后才重新计算；请求中只需要一次 time.time()"""
+
+    def __init__(self, now: Callable[[], float] = time.time):
+        self.now = now
+        self._windows: Dict[Optional[tzinfo], DayWindow] = {}
+
+    def today(self, zone: Optional[tzinfo] = None) -> DayWindow:
+        ts = self.now()
+        window = self._windows.get(zone)
+        if window is None or not window.start <= ts < window.end:
+            day = datetime.fromtimestamp(ts, zone).date()
+            window = DayWindow(day, day_start(day, zone), day_start(day + timedelta(days=1), zone))
+            self._windows[zone] = window
+        return window
@@ -0,0 +1,107 @@
+# dedup.py - 近似重复文本检测：字符 n-gram 的 MinHash 签名 + LSH 分桶，查询只比较同桶的候选
+#
+# 中文没有空格分词，按字符 n-gram（默认二元组）切分；候选再用 n-gram 集合的 Jaccard 相似度精确核对
+import hashlib
+import re
+import struct
+import threading
+import unicodedata
+from typing import Dict, FrozenSet, Hashable, List, Tuple
+
+_DIGITS = re.compile(r"\d+")
+
+def normalize(text: str) -> str:
+    """全角转半角、转小写，去掉空白和标点"""
+    return "".join(ch for ch in unicodedata.normalize("NFKC", text).lower() if ch.isalnum())
+
+def shingles(text: str, n: int = 2) -> FrozenSet[str]:
+    """字符 n-gram 集合；不足 n 个字符时整体作为一个元素"""
+    text = normalize(text)
+    if len(text) <= n:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+def numbers(text: str) -> Tuple[str, ...]:
+    """文本中的数字序列；步骤1/步骤2、第3章/第4章 这类只差编号的文本不视为重复"""
+    return tuple(_DIGITS.findall(unicodedata.normalize("NFKC", text)))
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class MinHashIndex:
+    """近似重复检测索引
+
+    每个文本计算 num_perm 个 MinHash（每个 n-gram 用一次 SHAKE-128 生成 num_perm 个独立的 32 位哈希，
+    逐列取最小值），分成 bands 段，每段作为一个桶键；
+    至少有一段完全相同的文本才会成为候选（Jaccard 为 s 时成为候选的概率为 1 - (1 - s^rows)^bands），
+    因此查询耗时与同桶的条目数有关，而不是与索引大小成正比
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, ngram: int = 2):
+        if num_perm % bands:
+            raise ValueError("num_perm 必须是 bands 的整数倍")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ngram = ngram
+        self._hash = struct.Struct(f"<{num_perm}I")
+        self._buckets: Dict[Tuple[int, tuple], set] = {}
+        # key -> (n-gram 集合, 数字序列, 桶键)
+        self._entries: Dict[Hashable, Tuple[FrozenSet[str], Tuple[str, ...], List[tuple]]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _band_keys(self, grams: FrozenSet[str]) -> List[tuple]:
+        unpack, size = self._hash.unpack, self._hash.size
+        hashes = [unpack(hashlib.shake_128(gram.encode("utf-8")).digest(size)) for gram in grams]
+        signature = list(map(min, zip(*hashes)))
+        rows = self.rows
+        return [(band, tuple(signature[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+
+    def add(self, key: Hashable, text: str):
+        """加入或替换 key 对应的文本"""
+        grams = shingles(text, self.ngram)
+        band_keys = self._band_keys(grams) if grams else []
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (grams, numbers(text), band_keys)
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band_key in entry[2]:
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def query(self, text: str, threshold: float) -> List[Tuple[Hashable, float]]:
+        """返回 Jaccard 相似度不低于 threshold 且数字序列相同的条目 [(key, 相似度)]，按相似度从高到低排列"""
+        grams = shingles(text, self.ngram)
+        if not grams:
+            return []
+        digits = numbers(text)
+        band_keys = self._band_keys(grams)
+        with self._lock:
+            candidates = set()
+            for band_key in band_keys:
+                candidates.update(self._buckets.get(band_key, ()))
+            entries = [(key, self._entries[key]) for key in candidates]
+        scored = [(key, jaccard(grams, entry[0])) for key, entry in entries if entry[1] == digits]
+        matches = [(key, score) for key, score in scored if score >= threshold]
+        matches.sort(key=lambda item: -item[1])
+        return matches
@@ -0,0 +1,254 @@
+# fake_llm.py - 本地假 LLM：根据提示词返回模板化结果，用于离线测试和基准测试
+#
+# 两种用法：
+#   1. 进程内：main.client = FakeLLMClient(FakeLLMConfig(latency=0.2))
+#   2. 独立服务（OpenAI 兼容接口）：
+#        python fake_llm.py --port 9000 --latency 0.5 --error-rate 0.1 --malformed-rate 0.1
+#        LLM_BASE_URL=http://127.0.0.1:9000/v1 uvicorn main:app
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Optional
+
+SCHEDULE_PERIODS = ["today", "tomorrow", "this_week", "later"]
+
+def _extract_json(text: str, open_char: str, close_char: str):
+    start = text.find(open_char)
+    end = text.rfind(close_char) + 1
+    if start == -1 or end <= start:
+        return None
+    try:
+        return json.loads(text[start:end])
+    except ValueError:
+        return None
+
+def plan_reply(prompt: str, max_tasks: int) -> str:
+    """任务规划：生成 max_tasks 个依次到期的任务"""
+    now = datetime.now().replace(microsecond=0)
+    priorities = ["high", "medium", "low"]
+    tasks = []
+    for i in range(max_tasks):
+        tasks.append({
+            "name": f"{prompt[:20]} - 步骤{i + 1}",
+            "description": f"为“{prompt[:40]}”完成第 {i + 1} 步",
+            "priority": priorities[i % len(priorities)],
+            "estimated_hours": 1 + i % 3,
+            "due_date": (now + timedelta(days=i + 1)).isoformat(),
+            "depends_on": [i - 1] if i else [],
+        })
+    return json.dumps(tasks, ensure_ascii=False)
+
+def schedule_reply(tasks_info: list) -> str:
+    """时间规划：按输入顺序把任务轮流分配到各个时间段"""
+    schedule = {period: [] for period in SCHEDULE_PERIODS}
+    for i, task in enumerate(tasks_info):
+        schedule[SCHEDULE_PERIODS[i % len(SCHEDULE_PERIODS)]].append(task.get("i", task.get("id")))
+    return json.dumps(schedule, ensure_ascii=False)
+
+def subtask_reply(prompt: str, max_subtasks: int) -> str:
+    """子任务分解：取任务名称生成若干步骤"""
+    match = re.search(r"任务名称：(.*)", prompt)
+    name = match.group(1).strip() if match else prompt[:20]
+    return json.dumps([
+        {"name": f"{name} - 子任务{i + 1}", "description": f"完成“{name}”的第 {i + 1} 部分", "estimated_hours": 1}
+        for i in range(max_subtasks)
+    ], ensure_ascii=False)
+
+def fake_reply(messages: list) -> str:
+    """根据系统提示词判断调用场景，返回对应的模板结果"""
+    system = messages[0]["content"] if messages else ""
+    user = messages[-1]["content"] if messages else ""
+
+    if "时间规划" in system:
+        tasks_info = _extract_json(user, "[", "]") or []
+        return schedule_reply(tasks_info)
+    if "任务规划" in system:
+        match = re.search(r"最多生成\s*(\d+)\s*个任务", system)
+        return plan_reply(user, int(match.group(1)) if match else 3)
+    if "任务分解" in system:
+        match = re.search(r"最多\s*(\d+)\s*个子任务", system)
+        return subtask_reply(user, int(match.group(1)) if match else 3)
+    # 其他场景返回逐行文本
+    return "\n".join(f"{i + 1}. {user[:30]} 的第 {i + 1} 步" for i in range(3))
+
+@dataclass
+class FakeLLMConfig:
+    """故障注入配置，各比例取值 0~1"""
+    latency: float = 0.0  # 每次调用的基础耗时（秒）
+    jitter: float = 0.0  # 在基础耗时上随机增加 0~jitter 秒
+    error_rate: float = 0.0  # 返回服务端错误的比例
+    malformed_rate: float = 0.0  # 返回无法解析的内容的比例
+    hang_rate: float = 0.0  # 长时间不响应的比例，用于测试超时
+    hang_seconds: float = 30.0
+    seed: Optional[int] = None
+
+class FakeLLMError(Exception):
+    """假 LLM 注入的服务端错误"""
+
+MALFORMED_REPLIES = [
+    "抱歉，我暂时无法完成这个请求。",
+    '[{"name": "未闭合的任务", "priority": "high"',
+    '{"today": ["task-1", "task-2"], "tomorrow": ',
+    "```json\nnot really json\n```",
+]
+
+class FakeLLM:
+    """按配置注入延迟/错误/异常输出，并生成回复内容；线程安全，结果由 seed 决定"""
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None):
+        self.config = config or FakeLLMConfig()
+        self.rng = random.Random(self.config.seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def _draw(self):
+        with self.lock:
+            self.calls += 1
+            return self.rng.random(), self.rng.random(), self.rng.random()
+
+    def complete(self, messages: list) -> str:
+        """返回回复内容；注入错误时抛出 FakeLLMError"""
+        config = self.config
+        fault, delay, pick = self._draw()
+        time.sleep(config.latency + delay * config.jitter)
+
+        if fault < config.hang_rate:
+            time.sleep(config.hang_seconds)
+        fault -= config.hang_rate
+        if 0 <= fault < config.error_rate:
+            raise FakeLLMError("fake llm: injected server error")
+        fault -= config.error_rate
+        if 0 <= fault < config.malformed_rate:
+            return MALFORMED_REPLIES[int(pick * len(MALFORMED_REPLIES))]
+        return fake_reply(messages)
+
+def _count_tokens(text: str) -> int:
+    # 粗略估算：中文约 1 字 1 token，英文约 4 字符 1 token
+    return max(1, len(text.encode("utf-8")) // 3)
+
+def completion_payload(model: str, messages: list, content: str) -> dict:
+    """OpenAI chat.completion 格式的响应体"""
+    prompt_tokens = sum(_count_tokens(m.get("content") or "") for m in messages)
+    completion_tokens = _count_tokens(content)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+def _namespace(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_namespace(v) for v in value]
+    return value
+
+class FakeLLMClient:
+    """进程内替身，接口与 OpenAI().chat.completions.create 一致
+
+    延迟通过阻塞 sleep 实现，与同步 SDK 调用的行为相同
+    """
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None):
+        self.llm = FakeLLM(config)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @property
+    def calls(self) -> int:
+        return self.llm.calls
+
+    def create(self, model: str, messages: list, **kwargs):
+        content = self.llm.complete(messages)
+        return _namespace(completion_payload(model, messages, content))
+
+# ===== OpenAI 兼容的本地服务 =====
+def make_handler(llm: FakeLLM):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: dict):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send(200, {"object": "list", "data": [{"id": "fake-model", "object": "model"}]})
+            else:
+                self._send(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send(400, {"error": {"message": "invalid json", "type": "invalid_request_error"}})
+                return
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+                return
+
+            messages = request.get("messages") or []
+            try:
+                content = llm.complete(messages)
+            except FakeLLMError as e:
+                self._send(500, {"error": {"message": str(e), "type": "server_error"}})
+                return
+            self._send(200, completion_payload(request.get("model", "fake-model"), messages, content))
+
+        def log_message(self, format, *args):
+            pass  # 基准测试时不输出访问日志
+
+    return Handler
+
+def start_server(config: Optional[FakeLLMConfig] = None, host: str = "127.0.0.1", port: int = 0):
+    """在后台线程启动假 LLM 服务，返回 (server, base_url)；port=0 表示随机端口"""
+    server = ThreadingHTTPServer((host, port), make_handler(FakeLLM(config)))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的假 LLM 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = FakeLLMConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        malformed_rate=args.malformed_rate, hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds, seed=args.seed,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeLLM(config)))
+    print(f"假 LLM 服务已启动: http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,131 @@
+# graph.py - 任务依赖图：增量拓扑排序（Pearce-Kelly）+ 关键路径
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+class CycleError(ValueError):
+    """新增依赖会形成环"""
+
+class DependencyGraph:
+    """有向无环图，边 u -> v 表示 u 是 v 的前置任务（u 必须先完成）
+
+    维护一个始终有效的拓扑序号 ord：新增边时只调整受影响区间内的节点，
+    不需要每次全量重新排序
+    """
+
+    def __init__(self):
+        self.succ: Dict[str, Set[str]] = {}  # 前置任务 -> 依赖它的任务
+        self.pred: Dict[str, Set[str]] = {}  # 任务 -> 它的前置任务
+        self.ord: Dict[str, int] = {}
+        self._next_ord = 0
+
+    def add_node(self, node: str):
+        if node not in self.ord:
+            self.ord[node] = self._next_ord
+            self._next_ord += 1
+            self.succ[node] = set()
+            self.pred[node] = set()
+
+    def remove_node(self, node: str):
+        if node not in self.ord:
+            return
+        for p in self.pred.pop(node):
+            self.succ[p].discard(node)
+        for s in self.succ.pop(node):
+            self.pred[s].discard(node)
+        del self.ord[node]
+
+    def _reorder(self, u: str, v: str):
+        """为新边 u -> v 调整拓扑序号；会形成环时抛出 CycleError 且不修改任何状态"""
+        lower, upper = self.ord[v], self.ord[u]
+        if lower > upper:
+            return
+        if u == v:
+            raise CycleError(u)
+
+        # 前向：从 v 出发、序号不超过 ord[u] 的后继；碰到 u 说明有环
+        forward, stack, seen = [], [v], {v}
+        while stack:
+            n = stack.pop()
+            forward.append(n)
+            for s in self.succ[n]:
+                if s == u:
+                    raise CycleError(u)
+                if s not in seen and self.ord[s] <= upper:
+                    seen.add(s)
+                    stack.append(s)
+
+        # 反向：从 u 出发、序号不小于 ord[v] 的前驱
+        backward, stack, seen = [], [u], {u}
+        while stack:
+            n = stack.pop()
+            backward.append(n)
+            for p in self.pred[n]:
+                if p not in seen and self.ord[p] >= lower:
+                    seen.add(p)
+                    stack.append(p)
+
+        # 受影响节点复用原有序号：先放反向集合，再放前向集合，各自保持原相对顺序
+        backward.sort(key=self.ord.__getitem__)
+        forward.sort(key=self.ord.__getitem__)
+        pool = sorted(self.ord[n] for n in backward + forward)
+        for n, o in zip(backward + forward, pool):
+            self.ord[n] = o
+
+    def check(self, node: str, deps: Iterable[str]):
+        """检查把 node 的前置任务设为 deps 是否会形成环（会顺带调整拓扑序号）"""
+        self.add_node(node)
+        for d in deps:
+            self.add_node(d)
+            if d not in self.pred[node]:
+                self._reorder(d, node)
+
+    def set_dependencies(self, node: str, deps: Iterable[str]):
+        """替换 node 的前置任务集合；调用前应先通过 check()"""
+        deps = set(deps)
+        self.check(node, deps)
+        for d in self.pred[node] - deps:
+            self.succ[d].discard(node)
+        for d in deps - self.pred[node]:
+            self.succ[d].add(node)
+        self.pred[node] = deps
+
+    def ancestors(self, nodes: Iterable[str], include: Callable[[str], bool]) -> Set[str]:
+        """nodes 及其所有满足 include 的前置任务（传递闭包）"""
+        result = set()
+        stack = [n for n in nodes if n in self.ord]
+        while stack:
+            n = stack.pop()
+            if n in result:
+                continue
+            result.add(n)
+            stack.extend(p for p in self.pred[n] if p not in result and include(p))
+        return result
+
+    def topo_sorted(self, nodes: Iterable[str]) -> List[str]:
+        return sorted(nodes, key=self.ord.__getitem__)
+
+    def longest_tails(self, nodes: Set[str], weight: Callable[[str], float]) -> Dict[str, float]:
+        """每个节点出发到子图终点的最长加权路径（含自身），即关键路径长度"""
+        tails: Dict[str, float] = {}
+        for n in reversed(self.topo_sorted(nodes)):
+            best = 0.0
+            for s in self.succ[n]:
+                if s in nodes and tails[s] > best:
+                    best = tails[s]
+            tails[n] = weight(n) + best
+        return tails
+
+    def critical_path(self, nodes: Set[str], weight: Callable[[str], float]) -> List[str]:
+        """子图中最长的一条依赖链（按拓扑顺序）"""
+        if not nodes:
+            return []
+        tails = self.longest_tails(nodes, weight)
+        current: Optional[str] = max(
+            (n for n in nodes if not any(p in nodes for p in self.pred[n])),
+            key=tails.__getitem__,
+        )
+        path = []
+        while current is not None:
+            path.append(current)
+            next_nodes = [s for s in self.succ[current] if s in nodes]
+            current = max(next_nodes, key=tails.__getitem__) if next_nodes else None
+        return path
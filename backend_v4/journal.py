@@ -0,0 +1,312 @@
+# journal.py - 内存存储的持久化：追加写的二进制日志（组提交 fsync）+ 后台压缩快照 + 启动时 mmap 回放
+#
+# 目录结构：
+#   journal-000001.log ...  日志分段，每段以 MAGIC + 段号开头，之后是若干条记录
+#   snapshot.bin            快照：MAGIC + 回放起始段号，之后是 put 记录；先写临时文件再原子替换
+#
+# 记录格式：<长度 u32><crc32 u32> + 内容；内容为 <操作 u8><key 长度 u32> + key + value
+# 崩溃时最后一条记录可能只写了一半，回放时按长度和 CRC 校验，遇到不完整的记录即停止
+import asyncio
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+JOURNAL_MAGIC = b"TGJ1"
+SNAPSHOT_MAGIC = b"TGS1"
+OP_PUT = 1
+OP_DELETE = 2
+SYNC_MODES = ("always", "batch")
+
+_FRAME = struct.Struct("<II")
+_HEADER = struct.Struct("<BI")
+_FILE_HEADER = struct.Struct("<4sQ")
+_ROTATE = object()  # 写入队列中的分段切换标记
+
+class JournalError(Exception):
+    """日志写入失败（如磁盘已满），之后的写入不再落盘"""
+
+def encode_record(op: int, key: str, value: bytes = b"") -> bytes:
+    key_bytes = key.encode("utf-8")
+    body = _HEADER.pack(op, len(key_bytes)) + key_bytes + value
+    return _FRAME.pack(len(body), zlib.crc32(body)) + body
+
+def read_records(path: str, magic: bytes) -> Tuple[Optional[int], List[Tuple[int, str, bytes]]]:
+    """用 mmap 读取文件中所有完整的记录，返回 (文件头中的段号, [(操作, key, value)])"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _FILE_HEADER.size:
+            return None, []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            file_magic, number = _FILE_HEADER.unpack_from(mm, 0)
+            if file_magic != magic:
+                raise ValueError(f"文件格式不正确: {path}")
+            records = []
+            pos = _FILE_HEADER.size
+            while pos + _FRAME.size <= size:
+                length, crc = _FRAME.unpack_from(mm, pos)
+                start, end = pos + _FRAME.size, pos + _FRAME.size + length
+                if end > size or zlib.crc32(mm[start:end]) != crc:
+                    break  # 不完整的尾部记录
+                op, key_length = _HEADER.unpack_from(mm, start)
+                key_end = start + _HEADER.size + key_length
+                records.append((op, mm[start + _HEADER.size:key_end].decode("utf-8"), mm[key_end:end]))
+                pos = end
+            return number, records
+
+class Journal:
+    """追加写日志
+
+    append() 只把记录放进内存队列（不阻塞调用方），后台线程把队列中积累的记录一次写入并 fsync（组提交）。
+    sync="always" 时调用方可以 await durable(seq) 等到记录落盘；sync="batch" 时每隔 flush_interval 秒落盘一次。
+    自上次快照以来写入的字节数超过 snapshot_bytes 时调用 on_snapshot_due（在后台线程中）。
+    写入或 fsync 失败时后台线程记录错误后停止：之后的记录直接丢弃，durable() 和 check() 抛出 JournalError
+    """
+
+    def __init__(self, directory: str, sync: str = "batch", flush_interval: float = 0.01,
+                 snapshot_bytes: int = 64 * 1024 * 1024, on_snapshot_due: Optional[Callable[[], None]] = None):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"sync 只支持 {'/'.join(SYNC_MODES)}")
+        self.directory = directory
+        self.sync = sync
+        self.flush_interval = flush_interval
+        self.snapshot_bytes = snapshot_bytes
+        self.on_snapshot_due = on_snapshot_due
+        os.makedirs(directory, exist_ok=True)
+
+        self.segment = 0  # 当前写入的段号
+        self._last_segment = 0  # 包括已请求但尚未切换的分段
+        self.last_seq = 0  # 最后一条已入队记录的序号
+        self.durable_seq = 0  # 已落盘的最大序号
+        self.bytes_since_snapshot = 0
+        self.fsyncs = 0
+        self._pending: list = []
+        self._cond = threading.Condition()
+        self._waiters: List[tuple] = []  # (序号, 事件循环, future)
+        self._file = None
+        self._closing = False
+        self.error: Optional[BaseException] = None  # 后台线程写入失败的原因
+        self._snapshot_running = False
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- 文件 -----
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"journal-{number:06d}.log")
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, "snapshot.bin")
+
+    def _segments(self) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith("journal-") and name.endswith(".log"):
+                numbers.append(int(name[len("journal-"):-len(".log")]))
+        return sorted(numbers)
+
+    def _fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _open_segment(self, number: int):
+        self.segment = number
+        self._file = open(self._segment_path(number), "ab")
+        self._file.write(_FILE_HEADER.pack(JOURNAL_MAGIC, number))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._fsync_directory()
+
+    # ----- 回放 -----
+    def recover(self) -> Dict[str, bytes]:
+        """读取快照和其后的日志分段，返回最终状态 {key: value}（只保留每个 key 最后一次写入）"""
+        state: Dict[str, bytes] = {}
+        first_segment = 0
+        if os.path.exists(self.snapshot_path):
+            first_segment, records = read_records(self.snapshot_path, SNAPSHOT_MAGIC)
+            for _, key, value in records:
+                state[key] = value
+        for number in self._segments():
+            if number < first_segment:
+                os.remove(self._segment_path(number))  # 快照已包含，上次删除前中断
+                continue
+            _, records = read_records(self._segment_path(number), JOURNAL_MAGIC)
+            for op, key, value in records:
+                if op == OP_PUT:
+                    state[key] = value
+                else:
+                    state.pop(key, None)
+        self.segment = max(self._segments() + [first_segment - 1, 0])
+        return state
+
+    # ----- 写入 -----
+    def open(self):
+        """开始写入新的日志分段（应在 recover() 之后调用）"""
+        self._open_segment(self.segment + 1)
+        self._last_segment = self.segment
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    def _enqueue(self, record: bytes) -> int:
+        with self._cond:
+            if self.error is not None:
+                return self.last_seq  # 已经无法写入，不再积压
+            self._pending.append(record)
+            self.last_seq += 1
+            self._cond.notify()
+            return self.last_seq
+
+    def append_put(self, key: str, value: bytes) -> int:
+        return self._enqueue(encode_record(OP_PUT, key, value))
+
+    def append_delete(self, key: str) -> int:
+        return self._enqueue(encode_record(OP_DELETE, key))
+
+    def rotate(self) -> int:
+        """切换到新分段，返回新分段的段号；调用方需保证切换点与快照内容一致（例如持有存储写锁）"""
+        with self._cond:
+            self._raise_error()
+            self._pending.append(_ROTATE)
+            self._last_segment += 1
+            self._cond.notify()
+            return self._last_segment
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                batch, self._pending = self._pending, []
+                seq = self.last_seq
+                closing = self._closing
+            try:
+                self._write_batch(batch)
+            except Exception as e:  # ENOSPC、EIO 等：不能确认任何后续记录落盘，停止写入
+                self._fail(e)
+                return
+            self._resolve_waiters(seq)
+            if closing:
+                return
+            if self.bytes_since_snapshot >= self.snapshot_bytes and not self._snapshot_running \
+                    and self.on_snapshot_due is not None:
+                self.bytes_since_snapshot = 0
+                self.on_snapshot_due()
+            if self.sync == "batch" and self.flush_interval:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._closing, self.flush_interval)
+
+    def _write_batch(self, batch: list):
+        chunk = []
+        for item in batch:
+            if item is _ROTATE:
+                self._flush(chunk)
+                chunk = []
+                self._file.close()
+                self._open_segment(self.segment + 1)
+            else:
+                chunk.append(item)
+        self._flush(chunk)
+
+    def _flush(self, chunk: list):
+        if not chunk:
+            return
+        data = b"".join(chunk)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.fsyncs += 1
+        self.bytes_since_snapshot += len(data)
+
+    def _resolve_waiters(self, seq: int):
+        with self._cond:
+            self.durable_seq = seq
+            ready = [w for w in self._waiters if w[0] <= seq]
+            self._waiters = [w for w in self._waiters if w[0] > seq]
+        for _, loop, future in ready:
+            loop.call_soon_threadsafe(_set_done, future)
+
+    def _fail(self, error: BaseException):
+        with self._cond:
+            self.error = error
+            self._pending = []
+            waiters, self._waiters = self._waiters, []
+        for _, loop, future in waiters:
+            loop.call_soon_threadsafe(_set_error, future, self._journal_error())
+
+    def _journal_error(self) -> JournalError:
+        error = JournalError(f"日志写入失败: {self.error}")
+        error.__cause__ = self.error
+        return error
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self._journal_error()
+
+    def check(self):
+        """后台线程写入失败过时抛出 JournalError"""
+        with self._cond:
+            self._raise_error()
+
+    async def durable(self, seq: Optional[int] = None):
+        """等待序号 seq（默认为当前最后一条）之前的记录全部落盘；写入失败时抛出 JournalError"""
+        with self._cond:
+            self._raise_error()
+            seq = self.last_seq if seq is None else seq
+            if self.durable_seq >= seq:
+                return
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._waiters.append((seq, loop, future))
+        await future
+
+    # ----- 快照 -----
+    def write_snapshot(self, first_segment: int, items: Iterable[Tuple[str, bytes]]):
+        """写入快照（包含 first_segment 之前所有分段的内容），完成后删除这些分段"""
+        self._snapshot_running = True
+        try:
+            tmp_path = self.snapshot_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(_FILE_HEADER.pack(SNAPSHOT_MAGIC, first_segment))
+                chunk = []
+                for key, value in items:
+                    chunk.append(encode_record(OP_PUT, key, value))
+                    if len(chunk) >= 1000:
+                        f.write(b"".join(chunk))
+                        chunk = []
+                f.write(b"".join(chunk))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            self._fsync_directory()
+            for number in self._segments():
+                if number < first_segment:
+                    os.remove(self._segment_path(number))
+        finally:
+            self._snapshot_running = False
+
+    def close(self):
+        """写完队列中剩余的记录并关闭"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+        self._thread = None
+        try:
+            self._file.close()
+        except OSError:
+            if self.error is None:
+                raise  # 写入失败后缓冲区中残留的数据无法写出，忽略
+
+def _set_done(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+def _set_error(future: asyncio.Future, error: BaseException):
+    if not future.done():
+        future.set_exception(error)
@@ -0,0 +1,97 @@
+# live.py - 任务变更的实时推送：所有连接共享一个有界的消息环，每个连接只保存自己的读取位置
+#
+# 发布只是向环中追加一条消息并安排一次唤醒，耗时与连接数无关；唤醒后各连接在事件循环中自行读取积压的消息。
+# 连接落后超过环的容量（慢客户端）时不再补发，只收到一条 resync，由客户端重新拉取
+import asyncio
+import threading
+from collections import deque
+from itertools import islice
+from typing import List, Optional, Set
+
+RESYNC = '{"type":"resync"}'  # 连接积压溢出后发送，客户端应重新拉取 GET /tasks
+
+class Subscription:
+    def __init__(self, hub: "ChangeHub"):
+        self.hub = hub
+        self.cursor = hub.seq  # 已读取到的消息序号
+        self.overflows = 0
+
+    async def get(self) -> List[str]:
+        """等待并返回积压的消息（按顺序）；落后太多时返回 [RESYNC]"""
+        hub = self.hub
+        while hub.seq == self.cursor:
+            await hub.wait()
+        behind = hub.seq - self.cursor
+        self.cursor = hub.seq
+        if behind > len(hub.log):
+            self.overflows += 1
+            hub.overflows += 1
+            return [RESYNC]
+        return list(islice(hub.log, len(hub.log) - behind, None))
+
+class ChangeHub:
+    """把消息广播给所有订阅连接
+
+    publish 可以在任意线程调用：不在事件循环线程时通过 call_soon_threadsafe 转交。
+    消息是已经编码好的 JSON 字符串，所有连接共享同一个对象
+    """
+
+    def __init__(self, queue_size: int = 256):
+        self.log: deque = deque(maxlen=queue_size)
+        self.seq = 0  # 最后一条消息的序号
+        self.subscribers: Set[Subscription] = set()
+        self.overflows = 0
+        self._waiter: Optional[asyncio.Future] = None
+        self._wake_scheduled = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    @property
+    def queue_size(self) -> int:
+        return self.log.maxlen
+
+    @queue_size.setter
+    def queue_size(self, size: int):
+        self.log = deque(self.log, maxlen=size)
+
+    def subscribe(self) -> Subscription:
+        """在事件循环中调用"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        subscription = Subscription(self)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, message: str):
+        if not self.subscribers:
+            return
+        if threading.get_ident() == self._loop_thread:
+            self._append(message)
+        elif self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._append, message)
+
+    def _append(self, message: str):
+        self.log.append(message)
+        self.seq += 1
+        if not self._wake_scheduled:
+            self._wake_scheduled = True
+            self._loop.call_soon(self._wake)
+
+    def _wake(self):
+        self._wake_scheduled = False
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def wait(self):
+        """等待下一次唤醒（所有连接共享同一个 future）"""
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+        # shield：某个连接被取消时不能取消共享的 future
+        await asyncio.shield(self._waiter)
@@ -0,0 +1,143 @@
+# llm_guard.py - LLM 调用的保护：截止时间、对冲请求（超过延迟阈值后向备用端点再发一次）、熔断
+import asyncio
+import threading
+import time
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+class CircuitOpenError(Exception):
+    """所有端点都处于熔断状态"""
+
+class DeadlineExceeded(Exception):
+    """在截止时间内没有得到结果"""
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后熔断 reset_after 秒；之后放行一次试探请求，成功则恢复"""
+
+    def __init__(self, failure_threshold: int = 5, reset_after: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False  # 半开状态下是否已有试探请求在进行
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """是否放行一次请求；放行后必须调用 record_success 或 record_failure"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._trial = False
+
+class Attempt(NamedTuple):
+    name: str  # 用于指标，如 primary / secondary
+    call: Callable[[], Any]  # 同步调用，在线程中执行
+    breaker: CircuitBreaker
+
+def _record(attempt: Attempt):
+    """为已放弃等待的请求登记最终结果（保证半开状态的试探请求有结论）"""
+    def done(task: asyncio.Future):
+        if task.cancelled():  # 事件循环关闭
+            return
+        if task.exception() is None:
+            attempt.breaker.record_success()
+        else:
+            attempt.breaker.record_failure()
+    return done
+
+def _discard(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()  # 取出异常，避免 "exception was never retrieved" 警告
+
+async def hedged_call(attempts: List[Attempt], deadline: float,
+                      hedge_after: Optional[float] = None) -> Tuple[Any, str]:
+    """依次尝试各端点，返回 (结果, 端点名称)
+
+    - 先向第一个可用端点发请求；hedge_after 秒内没有结果时向下一个端点再发一次（对冲），先成功者胜出
+    - 某个端点失败时立即尝试下一个
+    - 处于熔断状态的端点直接跳过；全部熔断时抛出 CircuitOpenError
+    - deadline 秒内没有成功结果时抛出 DeadlineExceeded（超时记为失败），线程中的调用不会被中断
+    """
+    if deadline <= 0:
+        raise DeadlineExceeded("已超过截止时间")
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    deadline_at = start + deadline
+    hedge_at = start + hedge_after if hedge_after is not None else None
+    queue = list(attempts)
+    pending = {}
+    last_error: Optional[BaseException] = None
+
+    def launch() -> bool:
+        while queue:
+            attempt = queue.pop(0)
+            if attempt.breaker.allow():
+                pending[asyncio.ensure_future(asyncio.to_thread(attempt.call))] = attempt
+                return True
+        return False
+
+    if not launch():
+        raise CircuitOpenError("所有 LLM 端点都处于熔断状态")
+
+    while pending:
+        now = loop.time()
+        if now >= deadline_at:
+            break
+        timeout = deadline_at - now
+        if queue and hedge_at is not None:
+            timeout = min(timeout, max(0.0, hedge_at - now))
+        done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            if queue and hedge_at is not None and loop.time() >= hedge_at:
+                launch()
+                hedge_at = None  # 只对冲一次
+            continue
+        for task in done:
+            attempt = pending.pop(task)
+            error = task.exception()
+            if error is None:
+                attempt.breaker.record_success()
+                for other, other_attempt in pending.items():
+                    other.add_done_callback(_record(other_attempt))
+                return task.result(), attempt.name
+            attempt.breaker.record_failure()
+            last_error = error
+        if not pending:
+            launch()
+
+    for task, attempt in pending.items():
+        attempt.breaker.record_failure()
+        task.add_done_callback(_discard)
+    if last_error is not None and not pending:
+        raise last_error
+    raise DeadlineExceeded(f"{deadline:.1f} 秒内没有得到 LLM 结果")
@@ -1,28 +1,234 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import APIRouter, FastAPI, HTTPException, BackgroundTasks, Request, Header, Depends, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict
-from datetime import datetime, date
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse
+from starlette.requests import ClientDisconnect
+from pydantic import AfterValidator, BaseModel, Field, TypeAdapter, ValidationError, field_validator
+from typing import Annotated, Any, Callable, List, Optional, Dict
+from datetime import MAXYEAR, MINYEAR, datetime, date, timedelta
+import os
 import uuid
 import json
+import asyncio
+import calendar
+import csv
+import io
+import threading
+import time
+import heapq
+import itertools
+import math
+from collections import deque
+import hmac
+import logging
+from urllib.parse import parse_qs
 from enum import Enum
-from openai import OpenAI
+from contextlib import asynccontextmanager
+from metrics import Registry, MetricsMiddleware
+from profiling import ProfileStore, ProfilingMiddleware, span
+from graph import CycleError, DependencyGraph
+from recurrence import FREQUENCIES, occurrence_dates
+from reminders import MemorySink, ReminderEngine, SSESink, WebhookSink
+from journal import Journal, JournalError
+from live import ChangeHub
+from today import SECTIONS as TODAY_SECTIONS, TodayView
+from workqueue import WorkQueue
+from wire import (JSON, JSON_COMPACT, MSGPACK, MSGPACK_COMPACT, MSGPACK_MEDIA_TYPE, CompressionMiddleware,
+                  FormatMiddleware, current_format, msgpack)
+from dedup import MinHashIndex
+from schedule_prompt import SchedulePrompt, build_prompts, parse_schedule, prebucket
+from dates import MAX_DAY, MIN_DAY, Clock, check_range, day_start, epoch_day, from_epoch_day, get_zone, to_timestamp
+from llm_guard import Attempt, CircuitBreaker, CircuitOpenError, DeadlineExceeded, hedged_call
 
-app = FastAPI()
+# 所有路由注册在 router 上，由 create_app() 组装成应用（见文件末尾）
+router = APIRouter()
+logger = logging.getLogger("todo")
 
-# 配置跨域
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# ===== 指标 =====
+metrics_registry = Registry()
+http_requests = metrics_registry.counter(
+    "todo_http_requests_total", "HTTP 请求数", ("method", "route", "status"))
+http_latency = metrics_registry.histogram(
+    "todo_http_request_duration_seconds", "HTTP 请求耗时", ("method", "route"))
+llm_calls = metrics_registry.counter(
+    "todo_llm_calls_total", "LLM 调用次数", ("operation", "outcome"))
+llm_latency = metrics_registry.histogram(
+    "todo_llm_call_duration_seconds", "LLM 调用耗时", ("operation",))
+llm_tokens = metrics_registry.counter(
+    "todo_llm_tokens_total", "LLM token 用量", ("operation", "kind"))
+# path: primary/secondary 表示由该端点的模型结果完成；timeout/circuit_open/error 表示改为本地规则处理
+llm_served = metrics_registry.counter(
+    "todo_llm_served_total", "受保护的 LLM 调用由哪条路径完成", ("operation", "path"))
+slo_requests = metrics_registry.counter(
+    "todo_slo_requests_total", "是否在延迟目标内完成", ("operation", "outcome"))
+ai_duplicates = metrics_registry.counter(
+    "todo_ai_duplicates_total", "AI 生成的任务与已有未完成任务重复的次数", ("action",))
+# kind: raw 为压缩前字节数，wire 为实际发送的字节数
+http_compressed_bytes = metrics_registry.counter(
+    "todo_http_compressed_bytes_total", "压缩响应的字节数", ("encoding", "kind"))
+# mode: incremental 为连续的下一天，rebuild 为跳过多天（如进程挂起）后从全部任务重建
+today_rollovers = metrics_registry.counter(
+    "todo_today_rollovers_total", "今日视图跨过午夜的滚动次数", ("mode",))
+ai_job_state_seconds = metrics_registry.histogram(
+    "todo_ai_job_state_duration_seconds", "AI 任务在各状态停留的时间", ("state",))
+ai_jobs_finished = metrics_registry.counter(
+    "todo_ai_jobs_finished_total", "结束的 AI 任务数", ("status",))
+ai_jobs_resumed = metrics_registry.counter(
+    "todo_ai_jobs_resumed_total", "启动时从日志恢复并重新执行的 AI 任务数", ("operation",))
+# kind: task / job
+journal_quarantined = metrics_registry.counter(
+    "todo_journal_quarantined_total", "回放时无法解析、被隔离的日志记录数", ("kind",))
 
-# 配置 OpenAI
-client = OpenAI(
-    api_key="sk-zmyrpclntmuvmufqjclmjczurrexkvzsfcrxthcwzgyffktd",
-    base_url="https://api.siliconflow.cn/v1",
-)
+# ===== 请求剖析 =====
+# 管理员请求携带 X-Profile: 1 头或 ?profile=1 时，采样该请求的调用栈并返回 Server-Timing
+profile_store = ProfileStore()
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(settings.admin_token) and token is not None and hmac.compare_digest(token, settings.admin_token)
+
+def _profiling_requested(scope) -> bool:
+    headers = dict(scope.get("headers") or [])
+    wanted = headers.get(b"x-profile") == b"1" or \
+        parse_qs(scope.get("query_string", b"").decode()).get("profile") == ["1"]
+    if not wanted:
+        return False
+    token = headers.get(b"x-admin-token")
+    return is_admin(token.decode() if token is not None else None)
+
+# ===== 配置 =====
+class Settings(BaseModel):
+    """运行配置，每个字段都可以用同名大写环境变量覆盖（如 LLM_BASE_URL）"""
+    llm_api_key: str = "sk-zmyrpclntmuvmufqjclmjczurrexkvzsfcrxthcwzgyffktd"
+    # 设为 fake:// 使用进程内假 LLM；也可指向 fake_llm.py 启动的本地服务
+    llm_base_url: str = "https://api.siliconflow.cn/v1"
+    llm_model: str = "Qwen/Qwen2.5-7B-Instruct"
+    llm_timeout: float = 60.0  # 单次请求超时（秒）
+    llm_max_retries: int = 2
+    # 管理员令牌（X-Admin-Token），用于请求剖析等调试功能；未设置时这些功能关闭
+    admin_token: Optional[str] = None
+    llm_concurrency: int = 4  # 并发 LLM 调用的上限（所有后台任务共享）
+    llm_schedule_prompt_tokens: int = 2000  # 时间规划每个提示词的 token 预算（估算值）
+    llm_schedule_max_chunks: int = 4  # 时间规划最多分成几次请求，其余任务按规则安排
+    # 时间规划的延迟目标（秒）：到时仍没有模型结果的分块改为按规则安排
+    schedule_slo_seconds: float = 5.0
+    # 对冲请求：模型调用超过 llm_hedge_after 秒未返回时，向备用端点再发一次，先返回的结果胜出；
+    # 未配置备用端点时对冲到主端点；llm_hedge_after 未设置时不对冲（备用端点仍在主端点失败或熔断时使用）
+    llm_hedge_after: Optional[float] = None
+    llm_secondary_base_url: Optional[str] = None  # 未设置时与主端点相同
+    llm_secondary_model: Optional[str] = None  # 未设置时与主模型相同
+    llm_secondary_api_key: Optional[str] = None  # 未设置时与主端点相同
+    llm_breaker_failures: int = 5  # 连续失败（含超时）多少次后熔断，熔断期间直接按规则处理
+    llm_breaker_reset: float = 30.0  # 熔断多少秒后放行一次试探请求
+    # AI 规划生成的任务与未完成任务名称的相似度（字符二元组 Jaccard）达到该值时视为重复
+    dedup_threshold: float = 0.7
+    dedup_mode: str = "merge"  # merge: 不创建，直接使用已有任务；flag: 照常创建并在结果中标出；off: 不检查
+    reminder_lead_minutes: int = 30  # 任务未设置 remind_at 时，在截止前多少分钟提醒
+    reminder_webhook_url: Optional[str] = None  # 设置后提醒事件同时 POST 到该地址
+    # 默认时区（IANA 名称，如 Asia/Shanghai）：无时区的时间按它解释，也是未指定 X-Timezone 时的用户时区；
+    # 未设置时使用系统时区
+    timezone: Optional[str] = None
+    # 持久化：设置 data_dir 后任务写入追加到该目录下的日志，启动时回放
+    data_dir: Optional[str] = None
+    journal_sync: str = "batch"  # always: 写请求等日志落盘后才返回；batch: 每 journal_flush_ms 毫秒落盘一次
+    journal_flush_ms: float = 10.0
+    snapshot_every_mb: int = 64  # 日志增长超过该大小后在后台写一次压缩快照
+    live_queue_size: int = 256  # 实时推送连接最多落后的消息数，超过后只发送 resync，要求客户端重新拉取
+    # 响应压缩（按 Accept-Encoding 选择 br 或 gzip）：小于 compress_min_bytes 的响应不压缩，设为 0 压缩全部
+    compress_min_bytes: int = 1024
+    gzip_level: int = 6
+    brotli_quality: int = 4  # 0-11，动态响应用较低的质量换取 CPU
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        values = {}
+        for name in cls.model_fields:
+            value = os.getenv(name.upper())
+            if value is not None:
+                values[name] = value
+        return cls(**values)
+
+settings = Settings.from_env()
+
+def create_ai_client(settings: Settings):
+    """根据配置创建 LLM 客户端（OpenAI SDK 导入较慢，只在需要时导入）"""
+    if settings.llm_base_url.startswith("fake://"):
+        from fake_llm import FakeLLMClient
+        return FakeLLMClient()
+    from openai import OpenAI
+    return OpenAI(
+        api_key=settings.llm_api_key,
+        base_url=settings.llm_base_url,
+        timeout=settings.llm_timeout,
+        max_retries=settings.llm_max_retries,
+    )
+
+def secondary_settings(settings: Settings) -> Settings:
+    """备用端点的配置：未设置的字段沿用主端点"""
+    return settings.model_copy(update={
+        "llm_base_url": settings.llm_secondary_base_url or settings.llm_base_url,
+        "llm_model": settings.llm_secondary_model or settings.llm_model,
+        "llm_api_key": settings.llm_secondary_api_key or settings.llm_api_key,
+    })
+
+def has_secondary(settings: Settings) -> bool:
+    return bool(settings.llm_secondary_base_url or settings.llm_secondary_model)
+
+# LLM 客户端在第一次调用时创建（见 get_ai_client）；测试和压测可以直接赋值替换
+client = None
+secondary_client = None
+_client_lock = threading.Lock()
+
+def get_ai_client():
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                client = create_ai_client(settings)
+    return client
+
+def get_secondary_client():
+    """备用端点的客户端；与主端点完全相同时直接复用主客户端"""
+    global secondary_client
+    if not (settings.llm_secondary_base_url or settings.llm_secondary_api_key):
+        return get_ai_client()
+    if secondary_client is None:
+        with _client_lock:
+            if secondary_client is None:
+                secondary_client = create_ai_client(secondary_settings(settings))
+    return secondary_client
+
+def create_breakers(settings: Settings) -> Dict[str, CircuitBreaker]:
+    """每个端点一个熔断器"""
+    return {endpoint: CircuitBreaker(settings.llm_breaker_failures, settings.llm_breaker_reset)
+            for endpoint in ("primary", "secondary")}
+
+store_zone = get_zone(settings.timezone)
+clock = Clock()
+llm_breakers = create_breakers(settings)
+
+def configure(new_settings: Settings):
+    """替换运行配置并重置由配置派生的状态；应在写入任务之前调用（已有任务的截止时间按旧时区归一化）"""
+    global settings, store_zone, client, secondary_client, llm_breakers, _llm_semaphore
+    settings = new_settings
+    store_zone = get_zone(settings.timezone)
+    client = None
+    secondary_client = None
+    llm_breakers = create_breakers(settings)
+    _llm_semaphore = None  # 下次使用时按新的 llm_concurrency 重建
+    change_hub.queue_size = settings.live_queue_size
+    today_views.clear()  # 视图按旧的默认时区分桶
+    configure_reminder_sinks()
+
+async def user_zone(x_timezone: Optional[str] = Header(None)):
+    """请求的用户时区（X-Timezone 头），用于计算今天/逾期/日历的日期边界
+
+    定义为协程，避免同步依赖被放到线程池执行
+    """
+    if not x_timezone:
+        return store_zone
+    try:
+        return get_zone(x_timezone)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # ===== 枚举和常量 =====
 class TaskStatus(str, Enum):
@@ -30,6 +236,11 @@ class TaskStatus(str, Enum):
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
 
+class TaskPriority(str, Enum):
+    LOW = "low"
+    MEDIUM = "medium"
+    HIGH = "high"
+
 class AIJobStatus(str, Enum):
     PENDING = "pending"
     PROCESSING = "processing"
@@ -37,6 +248,17 @@ class AIJobStatus(str, Enum):
     FAILED = "failed"
 
 # ===== 数据模型 =====
+# 截止和提醒时间写入时要换算为时间戳，datetime 取值范围两端的时间返回 422
+BoundedDatetime = Annotated[datetime, AfterValidator(check_range)]
+
+class RecurrenceRule(BaseModel):
+    freq: str  # daily / weekly / monthly
+    interval: int = 1  # 每隔几个周期重复一次
+    weekdays: Optional[List[int]] = None  # weekly 时在星期几重复（0=周一），默认与首次相同
+    until: Optional[date] = None  # 最后一次的日期（含）
+    count: Optional[int] = None  # 总次数
+    exdates: List[date] = Field(default_factory=list)  # 被删除（跳过）的日期
+
 class Task(BaseModel):
     id: Optional[str] = None
     name: str
@@ -44,55 +266,466 @@ class Task(BaseModel):
     completed: bool = False
     status: TaskStatus = TaskStatus.PENDING
     created_at: Optional[datetime] = None
-    due_date: Optional[datetime] = None
-    priority: Optional[str] = "medium"  # low, medium, high
+    due_date: Optional[BoundedDatetime] = None
+    priority: TaskPriority = TaskPriority.MEDIUM
     estimated_hours: Optional[float] = None  # 预计所需小时数
     scheduled_date: Optional[date] = None  # 计划执行日期
-    tags: Optional[List[str]] = []
+    tags: List[str] = Field(default_factory=list)
+    version: int = 1  # 每次更新递增，用于 If-Match 乐观并发控制
+    parent_id: Optional[str] = None  # 父任务 ID（子任务）
+    depends_on: List[str] = Field(default_factory=list)  # 前置任务 ID，需先完成
+    recurrence: Optional[RecurrenceRule] = None  # 重复规则；首次日期取 due_date（没有则取 scheduled_date）
+    recurrence_id: Optional[str] = None  # 由重复任务生成的实例所属的重复任务 ID
+    occurrence_date: Optional[date] = None  # 实例对应的日期
+    remind_at: Optional[BoundedDatetime] = None  # 提醒时间；未设置时为截止前 reminder_lead_minutes 分钟
+    # 写入时由 due_date 计算（见 stamp_dates），不出现在接口输出中：
+    # 截止时间的 UTC 时间戳，以及在默认时区中的纪元日序号（1970-01-01 起的天数）
+    due_ts: Optional[float] = Field(None, exclude=True)
+    due_day: Optional[int] = Field(None, exclude=True)
 
 class TaskCreate(BaseModel):
     name: str
     description: Optional[str] = ""
-    due_date: Optional[datetime] = None
-    priority: Optional[str] = "medium"
+    due_date: Optional[BoundedDatetime] = None
+    priority: TaskPriority = TaskPriority.MEDIUM
     estimated_hours: Optional[float] = None
     scheduled_date: Optional[date] = None
-    tags: Optional[List[str]] = []
+    tags: List[str] = Field(default_factory=list)
+    parent_id: Optional[str] = None
+    depends_on: List[str] = Field(default_factory=list)
+    recurrence: Optional[RecurrenceRule] = None
+    remind_at: Optional[BoundedDatetime] = None
 
 class TaskUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     completed: Optional[bool] = None
     status: Optional[TaskStatus] = None
-    due_date: Optional[datetime] = None
-    priority: Optional[str] = None
+    due_date: Optional[BoundedDatetime] = None
+    priority: Optional[TaskPriority] = None
     estimated_hours: Optional[float] = None
     scheduled_date: Optional[date] = None
     tags: Optional[List[str]] = None
+    depends_on: Optional[List[str]] = None
+    recurrence: Optional[RecurrenceRule] = None
+    remind_at: Optional[BoundedDatetime] = None
+
+    # 更新按 model_copy 合并，不会再次校验：这些字段在 Task 中不可为空，可以省略但不能显式传 null
+    @field_validator("name", "completed", "status", "priority", "tags")
+    @classmethod
+    def _not_null(cls, value):
+        if value is None:
+            raise ValueError("不能为 null")
+        return value
 
 class AITaskRequest(BaseModel):
     prompt: str
     max_tasks: int = 3  # 限制生成任务数量
 
+class AISubtaskRequest(BaseModel):
+    task_ids: List[str]
+    max_subtasks: int = 3  # 每个父任务最多生成的子任务数量
+
 class AIScheduleRequest(BaseModel):
     task_ids: Optional[List[str]] = None  # 如果为空，则规划所有未完成任务
+    mode: str = "ai"  # ai: 由模型规划；graph: 按依赖关系和关键路径在本地规划
+
+class DuplicateMatch(BaseModel):
+    name: str  # AI 生成的任务名称
+    task_id: str  # 相似的已有任务
+    similarity: float
+    merged: bool  # True 表示没有创建新任务，结果中使用已有任务
 
 class AIJob(BaseModel):
     job_id: str
     status: AIJobStatus
     created_at: datetime
+    operation: str = "plan"  # plan: 任务规划；subtasks: 子任务分解
+    params: Dict[str, Any] = Field(default_factory=dict)  # 请求参数，重启后按它重新执行
+    idempotency_key: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
     result: Optional[List[Task]] = None
     error: Optional[str] = None
+    errors: Optional[Dict[str, str]] = None  # 批量任务中各输入的失败原因
+    duplicates: Optional[List[DuplicateMatch]] = None  # AI 规划中与已有任务重复的项
+    # 模型返回的规划（已截断到 max_tasks），只持久化不输出；重启后已有规划时不再调用模型
+    plan: Optional[List[Dict[str, Any]]] = Field(None, exclude=True)
+
+class ImportRowError(BaseModel):
+    row: int  # 数据行号（从 1 开始，不含 CSV 表头）
+    error: str
+
+class ImportJob(BaseModel):
+    job_id: str
+    status: AIJobStatus
+    created_at: datetime
+    format: str
+    total_rows: int = 0
+    imported: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = Field(default_factory=list)
+    error: Optional[str] = None
+
+# 预编译的序列化器，直接输出 JSON 字节（model_dump_json 先生成 str，还要再编码一次）
+TASK_ADAPTER = TypeAdapter(Task)
 
 # ===== 内存存储 =====
 tasks_db: Dict[str, Task] = {}
 ai_jobs_db: Dict[str, AIJob] = {}
+ai_job_keys: Dict[str, str] = {}  # Idempotency-Key -> job_id
+import_jobs_db: Dict[str, ImportJob] = {}
+
+# ===== 快速序列化 =====
+# 设置 TODO_FAST_JSON=0 可退回 FastAPI 默认的 response_model 校验 + jsonable_encoder 路径
+FAST_JSON = os.getenv("TODO_FAST_JSON", "1") != "0"
+
+try:
+    import orjson  # 可选依赖，用于标量/普通字典的编码
+except ImportError:
+    orjson = None
+
+# 每个任务预编码后的 JSON 字节，任务被修改或删除时失效
+# 同时保存任务对象本身，命中时校验是同一个对象，避免把新版本的字节用于旧快照
+_task_json_cache: Dict[str, tuple] = {}
+# 紧凑 JSON、MessagePack 等其他表示形式的预编码字节，键为 (任务 ID, 表示形式)
+_task_variant_cache: Dict[tuple, tuple] = {}
+_TASK_VARIANTS = (JSON_COMPACT, MSGPACK, MSGPACK_COMPACT)
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def encode_task(task: Task, fmt: str = JSON) -> bytes:
+    """返回任务按 fmt 编码的字节（默认 JSON），命中缓存时不再重复序列化"""
+    if fmt != JSON:
+        return _encode_task_variant(task, fmt)
+    cached = _task_json_cache.get(task.id)
+    if cached is not None and cached[0] is task:
+        return cached[1]
+    data = TASK_ADAPTER.dump_json(task)
+    if tasks_db.get(task.id) is task:
+        _task_json_cache[task.id] = (task, data)
+    return data
+
+def _encode_task_variant(task: Task, fmt: str) -> bytes:
+    key = (task.id, fmt)
+    cached = _task_variant_cache.get(key)
+    if cached is not None and cached[0] is task:
+        return cached[1]
+    if fmt == JSON_COMPACT:
+        data = TASK_ADAPTER.dump_json(task, exclude_none=True)
+    else:
+        # 时间仍编码为 ISO 字符串，与 JSON 表示保持同样的字段和值
+        data = msgpack.packb(TASK_ADAPTER.dump_python(task, mode="json", exclude_none=fmt == MSGPACK_COMPACT))
+    if tasks_db.get(task.id) is task:
+        _task_variant_cache[key] = (task, data)
+    return data
+
+def invalidate_task_cache(task_id: str):
+    """任务变更后清除其预编码缓存"""
+    _task_json_cache.pop(task_id, None)
+    for fmt in _TASK_VARIANTS:
+        _task_variant_cache.pop((task_id, fmt), None)
+
+def _encode(obj: Any, fmt: str = JSON) -> bytes:
+    if isinstance(obj, Task):
+        return encode_task(obj, fmt)
+    if isinstance(obj, (list, tuple)):
+        # 任务列表是最常见的情况，直接调用 encode_task，省去每个元素一次递归
+        return b"[" + b",".join([encode_task(item, fmt) if item.__class__ is Task else _encode(item, fmt)
+                                 for item in obj]) + b"]"
+    if isinstance(obj, dict):
+        if fmt == JSON_COMPACT:
+            return b"{" + b",".join(_dumps(str(k)) + b":" + _encode(v, fmt) for k, v in obj.items()
+                                    if v is not None) + b"}"
+        return b"{" + b",".join(_dumps(str(k)) + b":" + _encode(v, fmt) for k, v in obj.items()) + b"}"
+    return _dumps(obj)
+
+def _msgpack_default(obj: Any):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"无法编码为 MessagePack: {type(obj).__name__}")
+
+def _msgpack_header(size: int, small: int, short: int, long: int) -> bytes:
+    if size < 16:
+        return bytes((small | size,))
+    if size < 0x10000:
+        return bytes((short,)) + size.to_bytes(2, "big")
+    return bytes((long,)) + size.to_bytes(4, "big")
+
+def _encode_msgpack(obj: Any, fmt: str) -> bytes:
+    """与 _encode 相同的拼接方式：任务直接使用预编码字节，容器只写入 MessagePack 的长度头"""
+    if isinstance(obj, Task):
+        return encode_task(obj, fmt)
+    if isinstance(obj, (list, tuple)):
+        return _msgpack_header(len(obj), 0x90, 0xdc, 0xdd) + b"".join(
+            [encode_task(item, fmt) if item.__class__ is Task else _encode_msgpack(item, fmt) for item in obj])
+    if isinstance(obj, dict):
+        items = [(k, v) for k, v in obj.items() if v is not None or fmt != MSGPACK_COMPACT]
+        return _msgpack_header(len(items), 0x80, 0xde, 0xdf) + b"".join(
+            msgpack.packb(str(k)) + _encode_msgpack(v, fmt) for k, v in items)
+    return msgpack.packb(obj, default=_msgpack_default)
+
+# 非默认表示形式的 ETag 后缀：同一版本的不同表示形式字节不同，ETag 也不能相同
+ETAG_SUFFIXES = {JSON_COMPACT: "-c", MSGPACK: "-mp", MSGPACK_COMPACT: "-mpc"}
+
+class TaskJSONResponse(Response):
+    """直接拼接任务缓存字节的 JSON 响应，跳过 response_model 的再次校验
+
+    表示形式取自 FormatMiddleware 协商的结果（紧凑 JSON 或 MessagePack）；
+    响应内容随 Accept、X-Compact 变化，写入 Vary，ETag 按表示形式加后缀
+    """
+    media_type = "application/json"
+
+    def __init__(self, content: Any, *args, **kwargs):
+        self.wire_format = current_format()
+        if self.wire_format in (MSGPACK, MSGPACK_COMPACT):
+            self.media_type = MSGPACK_MEDIA_TYPE
+        super().__init__(content, *args, **kwargs)
+        self.headers.add_vary_header("Accept")
+        self.headers.add_vary_header("X-Compact")
+        etag = self.headers.get("etag")
+        if etag is not None and self.wire_format in ETAG_SUFFIXES:
+            self.headers["etag"] = etag[:-1] + ETAG_SUFFIXES[self.wire_format] + '"'
+
+    def render(self, content: Any) -> bytes:
+        if self.media_type == MSGPACK_MEDIA_TYPE:
+            return _encode_msgpack(content, self.wire_format)
+        return _encode(content, self.wire_format)
+
+def fast_response(content: Any, headers: Optional[Dict[str, str]] = None, response: Optional[Response] = None):
+    """开启快速序列化时包装为 TaskJSONResponse，否则原样返回交给 FastAPI 处理
+
+    默认路径下 headers 写入 FastAPI 注入的 response 对象
+    """
+    if FAST_JSON:
+        with span("serialize"):
+            return TaskJSONResponse(content, headers=headers)
+    if headers and response is not None:
+        response.headers.update(headers)
+    return content
+
+# ===== 存储操作 =====
+# 每次写入都会递增，用于导出等需要一致快照的场景
+store_version = 0
+
+# 写锁：所有写入（及其索引维护）串行执行。读取不加锁——已发布的任务对象
+# 不再原地修改，读到的总是某个完整版本
+store_lock = threading.RLock()
+
+# 任务变更监听器 listener(old, new)：新增时 old 为 None，删除时 new 为 None
+# 各类索引在这里登记，随每次写入增量维护
+task_listeners: List[Callable[[Optional[Task], Optional[Task]], None]] = []
+
+def stamp_dates(task: Task):
+    """计算归一化的截止时间字段；只对尚未发布的任务对象调用"""
+    if task.due_date is None:
+        task.due_ts = task.due_day = None
+    else:
+        task.due_ts = to_timestamp(task.due_date, store_zone)
+        task.due_day = epoch_day(task.due_ts, store_zone)
+
+def save_task(task: Task):
+    """写入（新增或替换）任务。任务对象写入后不再原地修改，更新时整体替换"""
+    global store_version
+    stamp_dates(task)
+    with store_lock:
+        old = tasks_db.get(task.id)
+        tasks_db[task.id] = task
+        store_version += 1
+        invalidate_task_cache(task.id)
+        for listener in task_listeners:
+            listener(old, task)
+
+def remove_task(task_id: str):
+    """删除任务"""
+    global store_version
+    with store_lock:
+        old = tasks_db.pop(task_id)
+        store_version += 1
+        invalidate_task_cache(task_id)
+        for listener in task_listeners:
+            listener(old, None)
+
+def apply_task_update(task_id: str, update_data: dict, expected_version: Optional[int] = None) -> Task:
+    """比较并替换：在写锁内基于当前版本生成新任务对象
+
+    expected_version 与当前版本不一致时抛出 412，任务不存在时抛出 404
+    """
+    with store_lock:
+        current = tasks_db.get(task_id)
+        if current is None:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        if expected_version is not None and current.version != expected_version:
+            raise HTTPException(status_code=412, detail="任务已被修改，请刷新后重试")
+
+        if "depends_on" in update_data:
+            update_data = {**update_data, "depends_on": update_data["depends_on"] or []}
+            check_dependencies_or_400(task_id, update_data["depends_on"])
+
+        task = current.model_copy(update={**update_data, "version": current.version + 1})
+        # 如果标记为完成，自动更新状态
+        if task.completed and task.status != TaskStatus.COMPLETED:
+            task.status = TaskStatus.COMPLETED
+        if "recurrence" in update_data:
+            check_recurrence_or_400(task)
+        if update_data.keys() & {"remind_at", "due_date", "recurrence"}:
+            check_reminder_or_400(task)
+        save_task(task)
+        return task
+
+def task_etag(task: Task) -> str:
+    return f'"{task.version}"'
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """解析 If-Match 头（支持 3、"3"、W/"3"，以及带表示形式后缀的 "3-mp"），* 或缺省表示不校验版本"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"').split("-", 1)[0])
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match 格式错误")
+
+def snapshot_tasks():
+    """返回 (版本号, 任务列表) 的一致快照，只复制引用而不复制任务内容"""
+    return store_version, list(tasks_db.values())
+
+# ===== 持久化 =====
+# 启用后每次写入由监听器追加到日志（后台线程组提交 fsync），日志增长到一定大小后在后台写压缩快照；
+# 启动时先读快照再回放其后的日志。AI 任务以 "job:<job_id>" 为 key 写入同一个日志
+journal: Optional[Journal] = None
+JOB_KEY_PREFIX = "job:"
+QUARANTINE_FILE = "quarantine.ndjson"
+
+def encode_job(job: AIJob) -> bytes:
+    return _dumps({**job.model_dump(mode="json"), "plan": job.plan})
+
+def persist_job(job: AIJob):
+    """AI 任务创建和每次状态变化后写入日志；未启用持久化时不做任何事
+
+    在写锁内追加：take_snapshot 在同一把锁内取任务列表并切换分段，记录不会落进快照之后被删除的旧分段
+    """
+    if journal is not None:
+        with store_lock:
+            journal.append_put(JOB_KEY_PREFIX + job.job_id, encode_job(job))
+
+def _journal_task(old: Optional[Task], new: Optional[Task]):
+    if new is not None:
+        journal.append_put(new.id, encode_task(new))
+    else:
+        journal.append_delete(old.id)
+
+def take_snapshot() -> int:
+    """在写锁内确定快照内容和日志切换点，锁外序列化写盘；返回快照中的任务数"""
+    with store_lock:
+        _, tasks = snapshot_tasks()
+        jobs = list(ai_jobs_db.values())
+        first_segment = journal.rotate()
+    journal.write_snapshot(first_segment, itertools.chain(
+        ((task.id, encode_task(task)) for task in tasks),
+        ((JOB_KEY_PREFIX + job.job_id, encode_job(job)) for job in jobs)))
+    return len(tasks)
+
+def parse_priority(value) -> TaskPriority:
+    """不在取值范围内（或为空）的优先级按 medium 处理，用于模型生成的数据和旧版本写入的日志"""
+    try:
+        return TaskPriority(value)
+    except ValueError:
+        return TaskPriority.MEDIUM
+
+def decode_task(data: bytes) -> Task:
+    """从日志记录恢复任务；早期版本的优先级是任意字符串，校验失败时修正后重试"""
+    try:
+        return Task.model_validate_json(data)
+    except ValidationError:
+        fields = json.loads(data)
+        fields["priority"] = parse_priority(fields.get("priority"))
+        return Task.model_validate(fields)
+
+def quarantine_record(directory: str, key: str, data: bytes):
+    """把无法解析的日志记录追加到 quarantine.ndjson（每行 {"key", "value"}），供人工修复后重新导入"""
+    line = _dumps({"key": key, "value": bytes(data).decode("utf-8", "replace")})
+    with open(os.path.join(directory, QUARANTINE_FILE), "ab") as f:
+        f.write(line + b"\n")
+
+def _snapshot_in_background():
+    threading.Thread(target=take_snapshot, name="journal-snapshot", daemon=True).start()
+
+def open_journal(directory: str) -> int:
+    """从快照和日志恢复任务和 AI 任务，然后开始记录新的写入；返回恢复的任务数
+
+    未完成的 AI 任务由 resume_ai_jobs 在事件循环中重新执行
+    """
+    global journal
+    journal = Journal(
+        directory,
+        sync=settings.journal_sync,
+        flush_interval=settings.journal_flush_ms / 1000,
+        snapshot_bytes=settings.snapshot_every_mb * 1024 * 1024,
+        on_snapshot_due=_snapshot_in_background,
+    )
+    state = journal.recover()
+    restored = 0
+    for key, data in state.items():
+        kind = "job" if key.startswith(JOB_KEY_PREFIX) else "task"
+        try:
+            if kind == "job":
+                job = AIJob.model_validate_json(data)
+            else:
+                task = decode_task(data)
+        except (ValueError, ValidationError) as e:
+            # 一条坏记录不应阻止启动：原样写入隔离文件后跳过
+            quarantine_record(directory, key, data)
+            journal_quarantined.inc(kind)
+            logger.warning("日志记录 %s 无法解析，已隔离: %s", key, e)
+            continue
+        if kind == "job":
+            ai_jobs_db[job.job_id] = job
+            if job.idempotency_key is not None:
+                ai_job_keys[job.idempotency_key] = job.job_id
+        else:
+            save_task(task)
+            restored += 1
+    journal.open()
+    task_listeners.append(_journal_task)
+    return restored
+
+def close_journal():
+    """写完剩余日志后关闭"""
+    global journal
+    if journal is not None:
+        task_listeners.remove(_journal_task)
+        journal.close()
+        journal = None
+
+async def journal_barrier():
+    """journal_sync=always 时等待之前的写入全部落盘（并发请求共享同一次 fsync）
+
+    日志写入失败（如磁盘已满）后写入不再持久化，返回 503
+    """
+    if journal is None:
+        return
+    try:
+        if journal.sync == "always":
+            await journal.durable()
+        else:
+            journal.check()
+    except JournalError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 # ===== 基础任务操作 =====
-@app.post("/tasks", response_model=Task)
-async def create_task(task: TaskCreate):
-    """创建新任务"""
-    new_task = Task(
+def build_task(task: TaskCreate) -> Task:
+    """根据创建请求生成新任务"""
+    return Task(
         id=str(uuid.uuid4()),
         name=task.name,
         description=task.description,
@@ -102,138 +735,1029 @@ async def create_task(task: TaskCreate):
         estimated_hours=task.estimated_hours,
         scheduled_date=task.scheduled_date,
         tags=task.tags,
+        parent_id=task.parent_id,
+        depends_on=task.depends_on,
+        recurrence=task.recurrence,
+        remind_at=task.remind_at,
     )
-    tasks_db[new_task.id] = new_task
-    return new_task
 
-@app.get("/tasks", response_model=List[Task])
+@router.post("/tasks", response_model=Task)
+async def create_task(task: TaskCreate):
+    """创建新任务"""
+    if task.parent_id is not None and task.parent_id not in tasks_db:
+        raise HTTPException(status_code=400, detail="父任务不存在")
+    new_task = build_task(task)
+    check_recurrence_or_400(new_task)
+    check_reminder_or_400(new_task)
+    with store_lock:
+        check_dependencies_or_400(new_task.id, new_task.depends_on)
+        save_task(new_task)
+    await journal_barrier()
+    return fast_response(new_task)
+
+@router.get("/tasks", response_model=List[Task])
 async def get_all_tasks():
     """获取所有任务"""
-    return list(tasks_db.values())
+    return fast_response(list(tasks_db.values()))
 
-@app.get("/tasks/{task_id}", response_model=Task)
-async def get_task(task_id: str):
-    """获取单个任务"""
-    if task_id not in tasks_db:
-        raise HTTPException(status_code=404, detail="任务不存在")
-    return tasks_db[task_id]
+# ===== 导出 =====
+EXPORT_CHUNK_SIZE = 500  # 每次向客户端写出的行数
+EXPORT_FIELDS = [name for name, field in Task.model_fields.items() if not field.exclude]
 
-@app.put("/tasks/{task_id}", response_model=Task)
-async def update_task(task_id: str, task_update: TaskUpdate):
-    """更新任务"""
-    if task_id not in tasks_db:
-        raise HTTPException(status_code=404, detail="任务不存在")
+def _match_filters(task: Task, completed, status, priority, tag, due_after_ts, due_before_ts) -> bool:
+    """due_after_ts/due_before_ts 为时间戳，与 task.due_ts 比较（截止时间可以带时区也可以不带）"""
+    if completed is not None and task.completed != completed:
+        return False
+    if status is not None and task.status != status:
+        return False
+    if priority is not None and task.priority != priority:
+        return False
+    if tag is not None and tag not in (task.tags or []):
+        return False
+    if due_after_ts is not None and (task.due_ts is None or task.due_ts < due_after_ts):
+        return False
+    if due_before_ts is not None and (task.due_ts is None or task.due_ts > due_before_ts):
+        return False
+    return True
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, list):
+        return ";".join(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump_json()
+    return value
+
+def _csv_line(values) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue().encode("utf-8")
+
+def _export_rows(tasks: List[Task], fmt: str, filters: tuple):
+    """逐块生成导出内容，内存占用只与块大小有关"""
+    chunk = []
+    if fmt == "csv":
+        chunk.append(_csv_line(EXPORT_FIELDS))
+    for task in tasks:
+        if not _match_filters(task, *filters):
+            continue
+        if fmt == "csv":
+            chunk.append(_csv_line([_csv_value(getattr(task, f)) for f in EXPORT_FIELDS]))
+        else:
+            chunk.append(encode_task(task) + b"\n")
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield b"".join(chunk)
+            chunk = []
+    if chunk:
+        yield b"".join(chunk)
+
+@router.get("/tasks/export")
+async def export_tasks(
+    format: str = "ndjson",
+    completed: Optional[bool] = None,
+    status: Optional[TaskStatus] = None,
+    priority: Optional[TaskPriority] = None,
+    tag: Optional[str] = None,
+    due_after: Optional[BoundedDatetime] = None,
+    due_before: Optional[BoundedDatetime] = None,
+):
+    """流式导出任务（NDJSON 或 CSV），导出内容对应同一个存储版本"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format 只支持 ndjson 或 csv")
+
+    version, tasks = snapshot_tasks()
+    filters = (completed, status, priority, tag,
+               to_timestamp(due_after, store_zone) if due_after is not None else None,
+               to_timestamp(due_before, store_zone) if due_before is not None else None)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        _export_rows(tasks, format, filters),
+        media_type=media_type,
+        headers={
+            "X-Snapshot-Version": str(version),
+            "Content-Disposition": f"attachment; filename=tasks-{version}.{format}",
+        },
+    )
+
+# ===== 批量导入 =====
+IMPORT_QUEUE_SIZE = 8  # 上传与处理之间最多积压的数据块数，超过时上传端等待
+IMPORT_MAX_ERRORS = 1000  # 每个导入任务最多记录的行错误数
+_import_workers = set()  # 持有后台任务引用，防止被回收
+
+class _ImportParser:
+    """把按行切分好的上传内容切分为 (行号, 原始记录)
 
-    task = tasks_db[task_id]
-    update_data = task_update.dict(exclude_unset=True)
+    解码和字段解析放在 fields() 中，由调用方在逐行的 try 内调用：一行无效的 UTF-8 或 JSON 只记为该行的错误
+    """
 
-    for field, value in update_data.items():
-        setattr(task, field, value)
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.header = None
+        self.pending = []  # CSV 中跨行的带引号字段
+        self.row = 0
+
+    def feed(self, lines: List[bytes]):
+        for raw in lines:
+            if self.fmt != "csv":
+                if raw.strip():
+                    self.row += 1
+                    yield self.row, raw  # NDJSON 行保持为字节，由 pydantic-core 直接解析
+                continue
+            # 无效的 UTF-8 字节先保留为代理字符，拼接多行记录只需要识别引号
+            self.pending.append(raw.decode("utf-8", "surrogateescape").rstrip("\r"))
+            record = "\n".join(self.pending)
+            if record.count('"') % 2:
+                continue  # 引号未闭合，等待下一行
+            self.pending = []
+            if not record.strip():
+                continue
+            if self.header is None:
+                self.header = next(csv.reader([_strict_utf8(record)]))
+                continue
+            self.row += 1
+            yield self.row, record
+
+    def fields(self, record):
+        """NDJSON 原样返回；CSV 按表头解析为字段字典"""
+        if self.fmt != "csv":
+            return record
+        values = next(csv.reader([_strict_utf8(record)]))
+        fields = {}
+        for key, value in zip(self.header, values):
+            if value == "":
+                continue
+            if key in ("tags", "depends_on"):
+                fields[key] = value.split(";")
+            elif key == "recurrence":
+                try:
+                    fields[key] = json.loads(value)
+                except ValueError as e:
+                    raise ValueError(f"recurrence 不是有效的 JSON: {e}")
+            else:
+                fields[key] = value
+        return fields
 
-    # 如果标记为完成，自动更新状态
-    if task.completed and task.status != TaskStatus.COMPLETED:
-        task.status = TaskStatus.COMPLETED
+def _strict_utf8(text: str) -> str:
+    """还原 surrogateescape 保留的原始字节并严格解码，无效的 UTF-8 在这里抛出 UnicodeDecodeError"""
+    return text.encode("utf-8", "surrogateescape").decode("utf-8")
 
+def _parse_import_row(fmt: str, row) -> TaskCreate:
+    # NDJSON 行直接由 pydantic-core 解析校验，不经过 json.loads 生成中间字典
+    task = TaskCreate.model_validate(row) if fmt == "csv" else TaskCreate.model_validate_json(row)
+    # 与 create_task 相同：父任务必须已经存在
+    if task.parent_id is not None and task.parent_id not in tasks_db:
+        raise ValueError("父任务不存在")
+    # 新任务没有后继，不会形成环，只需检查前置任务是否存在
+    check_dependencies(None, task.depends_on)
+    check_recurrence(task)
+    check_reminder(task)
     return task
 
-@app.delete("/tasks/{task_id}")
-async def delete_task(task_id: str):
-    """删除任务"""
-    if task_id not in tasks_db:
+async def process_import(job_id: str, fmt: str, queue: asyncio.Queue):
+    """后台消费上传的数据块：逐块校验并批量写入存储"""
+    job = import_jobs_db[job_id]
+    job.status = AIJobStatus.PROCESSING
+    parser = _ImportParser(fmt)
+
+    while True:
+        lines = await queue.get()
+        if lines is None:
+            break
+        if job.status == AIJobStatus.FAILED:
+            continue  # 已失败，丢弃剩余数据直到上传结束
+
+        try:
+            batch = []
+            for row, record in parser.feed(lines):
+                job.total_rows += 1
+                try:
+                    batch.append(build_task(_parse_import_row(fmt, parser.fields(record))))
+                except (ValueError, ValidationError, csv.Error) as e:
+                    job.failed += 1
+                    if len(job.errors) < IMPORT_MAX_ERRORS:
+                        job.errors.append(ImportRowError(row=row, error=str(e)))
+
+            for task in batch:
+                save_task(task)
+            job.imported += len(batch)
+        except Exception as e:
+            job.status = AIJobStatus.FAILED
+            job.error = str(e)
+
+        # 每批之后让出事件循环，避免大批量导入阻塞其他请求
+        await asyncio.sleep(0)
+
+    if job.status != AIJobStatus.FAILED:
+        job.status = AIJobStatus.COMPLETED
+
+@router.post("/tasks/import")
+async def import_tasks(request: Request, format: str = "ndjson"):
+    """流式批量导入任务（NDJSON 或 CSV），返回可轮询的导入任务 ID"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format 只支持 ndjson 或 csv")
+
+    job_id = str(uuid.uuid4())
+    import_jobs_db[job_id] = ImportJob(
+        job_id=job_id,
+        status=AIJobStatus.PENDING,
+        created_at=datetime.now(),
+        format=format,
+    )
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=IMPORT_QUEUE_SIZE)
+    worker = asyncio.create_task(process_import(job_id, format, queue))
+    _import_workers.add(worker)
+    worker.add_done_callback(_import_workers.discard)
+
+    # 只保留最后一个不完整的行，其余按块交给后台处理
+    remainder = b""
+    try:
+        async for chunk in request.stream():
+            lines = (remainder + chunk).split(b"\n")
+            remainder = lines.pop()
+            if lines:
+                await queue.put(lines)
+        if remainder:
+            await queue.put([remainder])
+    except ClientDisconnect:
+        job = import_jobs_db[job_id]
+        job.status = AIJobStatus.FAILED
+        job.error = "上传中断"
+    finally:
+        await queue.put(None)
+
+    return {"job_id": job_id, "status": import_jobs_db[job_id].status}
+
+@router.get("/tasks/import/{job_id}", response_model=ImportJob)
+async def get_import_job(job_id: str):
+    """获取导入任务进度与逐行错误"""
+    if job_id not in import_jobs_db:
         raise HTTPException(status_code=404, detail="任务不存在")
-    del tasks_db[task_id]
-    return {"message": "任务已删除"}
+    return import_jobs_db[job_id]
 
 # ===== 日历视图 =====
-@app.get("/tasks/calendar/{year}/{month}")
-async def get_calendar_tasks(year: int, month: int):
-    """获取指定月份的任务日历数据"""
-    calendar_data = {}
-    
-    for task in tasks_db.values():
-        if task.completed:
+CALENDAR_MAX_DAYS = 731  # 单次范围查询最多覆盖的天数
+
+# 按天预先分桶的未完成任务：day -> {"due": {task_id: None}, "scheduled": {...}}
+# 用 dict 代替 set 以保持插入顺序
+calendar_index: Dict[date, Dict[str, Dict[str, None]]] = {}
+
+def _calendar_entries(task: Optional[Task]):
+    """任务在日历中所占的 (日期, 类型) 列表"""
+    if task is None or task.completed or task.recurrence is not None:
+        return []  # 重复任务在查询时按区间展开，不进入按天分桶的索引
+    entries = []
+    if task.due_day is not None:
+        entries.append((from_epoch_day(task.due_day), "due"))
+    if task.scheduled_date:
+        entries.append((task.scheduled_date, "scheduled"))
+    return entries
+
+def _update_calendar_index(old: Optional[Task], new: Optional[Task]):
+    old_entries = _calendar_entries(old)
+    new_entries = _calendar_entries(new)
+    if old_entries == new_entries:
+        return
+    for day, kind in old_entries:
+        bucket = calendar_index.get(day)
+        if bucket is None:
             continue
-            
-        # 检查截止日期
-        if task.due_date:
-            due_date = task.due_date.date()
-            if due_date.year == year and due_date.month == month:
-                date_str = due_date.isoformat()
-                if date_str not in calendar_data:
-                    calendar_data[date_str] = {"due": [], "scheduled": []}
-                calendar_data[date_str]["due"].append(task)
-        
-        # 检查计划日期
-        if task.scheduled_date:
-            if task.scheduled_date.year == year and task.scheduled_date.month == month:
-                date_str = task.scheduled_date.isoformat()
-                if date_str not in calendar_data:
-                    calendar_data[date_str] = {"due": [], "scheduled": []}
-                calendar_data[date_str]["scheduled"].append(task)
-    
+        bucket[kind].pop(old.id, None)
+        if not bucket["due"] and not bucket["scheduled"]:
+            del calendar_index[day]
+    for day, kind in new_entries:
+        bucket = calendar_index.setdefault(day, {"due": {}, "scheduled": {}})
+        bucket[kind][new.id] = None
+
+task_listeners.append(_update_calendar_index)
+
+def _lookup_tasks(task_ids) -> List[Task]:
+    # 读取不加锁：先整体复制 id 列表，再跳过期间被删除的任务
+    tasks = []
+    for task_id in list(task_ids):
+        task = tasks_db.get(task_id)
+        if task is not None:
+            tasks.append(task)
+    return tasks
+
+def _due_in_zone(start: date, end: date, zone) -> Dict[date, List[Task]]:
+    """按用户时区重新划分截止任务所在的日期
+
+    索引按默认时区分桶，两个时区的日期最多相差两天，因此多取两侧各两天的桶再按时间戳过滤
+    """
+    first, last = day_start(start, zone), day_start(end + timedelta(days=1), zone)
+    due_by_day: Dict[date, List[Task]] = {}
+    day = start - timedelta(days=2)
+    while day <= end + timedelta(days=2):
+        bucket = calendar_index.get(day)
+        if bucket is not None:
+            for task in _lookup_tasks(bucket["due"]):
+                if first <= task.due_ts < last:
+                    due_by_day.setdefault(from_epoch_day(epoch_day(task.due_ts, zone)), []).append(task)
+        day += timedelta(days=1)
+    return due_by_day
+
+def calendar_range(start: date, end: date, counts_only: bool = False, zone=None) -> dict:
+    """按天返回 [start, end] 区间内的日历数据，只访问区间内的桶；zone 为用户时区"""
+    zone = zone if zone is not None else store_zone
+    start, end = max(start, MIN_DAY), min(end, MAX_DAY)  # 更靠近 date 取值范围两端的日期无法换算时区
+    if end < start:
+        return {}
+    due_by_day = _due_in_zone(start, end, zone) if zone is not store_zone else None
+
+    # 重复任务只展开查询区间内的实例（截止类按用户时区中的截止日期，计划类按计划日期）
+    occurrences: Dict[date, Dict[str, List[Task]]] = {}
+    for day, kind, occurrence in expand_occurrences(start, end, zone):
+        day_entries = occurrences.setdefault(day, {"due": [], "scheduled": []})
+        day_entries[kind].append(occurrence)
+
+    calendar_data = {}
+    day = start
+    while day <= end:
+        bucket = calendar_index.get(day)
+        extra = occurrences.get(day)
+        zone_due = due_by_day.get(day) if due_by_day is not None else None
+        if bucket is not None or extra is not None or zone_due is not None:
+            if due_by_day is not None:
+                due = list(zone_due or [])
+            else:
+                due = _lookup_tasks(bucket["due"]) if bucket else []
+            scheduled = _lookup_tasks(bucket["scheduled"]) if bucket else []
+            if extra:
+                due += extra["due"]
+                scheduled += extra["scheduled"]
+            if not due and not scheduled:
+                pass  # 该桶的截止任务在用户时区中都落在了其他日期
+            elif counts_only:
+                calendar_data[day.isoformat()] = {"due": len(due), "scheduled": len(scheduled)}
+            else:
+                calendar_data[day.isoformat()] = {"due": due, "scheduled": scheduled}
+        day += timedelta(days=1)
     return calendar_data
 
-# ===== 异步 AI 功能 =====
-async def process_ai_planning(job_id: str, prompt: str, max_tasks: int):
-    """后台处理 AI 任务规划"""
+@router.get("/tasks/calendar")
+async def get_calendar_range(start: date, end: date, mode: str = "tasks", zone=Depends(user_zone)):
+    """获取任意日期区间的日历数据；mode=counts 时只返回每天的数量（热力图）"""
+    if mode not in ("tasks", "counts"):
+        raise HTTPException(status_code=400, detail="mode 只支持 tasks 或 counts")
+    if end < start:
+        raise HTTPException(status_code=400, detail="end 不能早于 start")
+    if (end - start).days >= CALENDAR_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"日期范围不能超过 {CALENDAR_MAX_DAYS} 天")
+    with span("store"):
+        calendar_data = calendar_range(start, end, counts_only=(mode == "counts"), zone=zone)
+    return fast_response(calendar_data)
+
+@router.get("/tasks/calendar/{year}/{month}")
+async def get_calendar_tasks(year: int, month: int, zone=Depends(user_zone)):
+    """获取指定月份的任务日历数据"""
+    if not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail="月份必须在 1-12 之间")
+    if not MINYEAR <= year <= MAXYEAR:
+        raise HTTPException(status_code=400, detail=f"年份必须在 {MINYEAR}-{MAXYEAR} 之间")
+    start = date(year, month, 1)
+    end = date(year, month, calendar.monthrange(year, month)[1])
+    with span("store"):
+        calendar_data = calendar_range(start, end, zone=zone)
+    return fast_response(calendar_data)
+
+# ===== 任务依赖 =====
+DAILY_HOURS = 8  # 每天可安排的工作时长
+DEFAULT_TASK_HOURS = 2  # 未填写预计时长的任务按 2 小时计
+PRIORITY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+dependency_graph = DependencyGraph()
+
+def _update_dependency_graph(old: Optional[Task], new: Optional[Task]):
+    if new is None:
+        dependency_graph.remove_node(old.id)
+    elif old is None or old.depends_on != new.depends_on:
+        dependency_graph.set_dependencies(new.id, new.depends_on or [])
+
+task_listeners.append(_update_dependency_graph)
+
+def check_dependencies(task_id: Optional[str], depends_on: Optional[List[str]]):
+    """校验前置任务存在且不会形成环；task_id 为 None 表示尚未保存的新任务"""
+    for dep in depends_on or []:
+        if dep not in tasks_db:
+            raise ValueError(f"前置任务不存在: {dep}")
+    if task_id is not None and task_id in tasks_db and depends_on:
+        try:
+            dependency_graph.check(task_id, depends_on)
+        except CycleError:
+            raise ValueError("依赖关系形成环")
+
+def check_dependencies_or_400(task_id: str, depends_on: Optional[List[str]]):
     try:
-        # 获取当前时间信息
-        now = datetime.now()
-        current_date_str = now.strftime("%Y年%m月%d日 %H:%M")
-        weekday_names = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
-        current_weekday = weekday_names[now.weekday()]
-        
-        response = client.chat.completions.create(
-            model="Qwen/Qwen2.5-7B-Instruct",
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"""你是一个任务规划助手。根据用户的描述，将其分解为具体的任务步骤。
-                    
-                    当前时间：{current_date_str} {current_weekday}
-                    
-                    限制：最多生成 {max_tasks} 个任务。
-                    
-                    每个任务应该包含：
-                    - name: 任务名称（简短明确）
-                    - description: 任务描述（详细说明）
-                    - priority: 优先级（high/medium/low）
-                    - estimated_hours: 预计所需小时数
-                    - due_date: 截止时间（ISO格式，如：2024-12-25T15:00:00）
-                    
-                    重要规则：
-                    1. 根据任务的紧急程度和依赖关系设置合理的截止时间
-                    2. 如果用户提到"明天"、"后天"等相对时间，要转换为具体日期
-                    3. 考虑任务的先后顺序，前置任务的截止时间要早于后续任务
-                    4. 紧急任务设置为high优先级，截止时间更近
-                    5. 所有时间都基于当前时间计算
-                    
-                    请以JSON数组格式返回，确保返回的是有效的JSON。
-                    """,
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-            max_tokens=500,
-        )
+        check_dependencies(task_id, depends_on)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _is_open(task_id: str) -> bool:
+    task = tasks_db.get(task_id)
+    return task is not None and not task.completed
+
+def _hours(task: Task) -> float:
+    return task.estimated_hours or DEFAULT_TASK_HOURS
+
+def _task_hours(task_id: str) -> float:
+    return _hours(tasks_db[task_id])
+
+def schedule_by_dependencies(tasks: List[Task], now: Optional[float] = None) -> Dict[str, List[Task]]:
+    """按依赖关系安排任务：前置任务总是排在前面，同时可开始的任务中
+    优先安排有效截止时间（自身与所有后续任务中最早的截止时间）更早、关键路径更长的任务
+
+    会自动带上未完成的前置任务；复杂度 O((V + E) log V)
+    """
+    now = now or clock.now()
+    nodes = dependency_graph.ancestors([t.id for t in tasks], include=_is_open)
+    order = dependency_graph.topo_sorted(nodes)
+    tails = dependency_graph.longest_tails(nodes, _task_hours)
+
+    # 有效截止时间（时间戳）沿依赖链向前传递
+    effective_due: Dict[str, float] = {}
+    for n in reversed(order):
+        due = tasks_db[n].due_ts if tasks_db[n].due_ts is not None else math.inf
+        for s in dependency_graph.succ[n]:
+            if s in nodes and effective_due[s] < due:
+                due = effective_due[s]
+        effective_due[n] = due
+
+    waiting = {n: sum(1 for p in dependency_graph.pred[n] if p in nodes) for n in nodes}
+    ready = []
+    for n in order:
+        if not waiting[n]:
+            heapq.heappush(ready, (effective_due[n], -tails[n], PRIORITY_RANK.get(tasks_db[n].priority, 1),
+                                   dependency_graph.ord[n], n))
+
+    periods = ["today", "tomorrow"] + ["this_week"] * 5
+    result = {"today": [], "tomorrow": [], "this_week": [], "later": []}
+    day, used = 0, 0.0
+    while ready:
+        due, _, _, _, n = heapq.heappop(ready)
+        hours = _task_hours(n)
+        # 当天已排满则顺延到下一天；已逾期的任务无论如何放在今天
+        if used and used + hours > DAILY_HOURS and not (day == 0 and due < now):
+            day, used = day + 1, 0.0
+        used += hours
+        result[periods[day] if day < len(periods) else "later"].append(tasks_db[n])
+
+        for s in dependency_graph.succ[n]:
+            if s in nodes:
+                waiting[s] -= 1
+                if not waiting[s]:
+                    heapq.heappush(ready, (effective_due[s], -tails[s], PRIORITY_RANK.get(tasks_db[s].priority, 1),
+                                           dependency_graph.ord[s], s))
+
+    result["critical_path"] = [tasks_db[n] for n in dependency_graph.critical_path(nodes, _task_hours)]
+    return result
+
+@router.get("/tasks/critical-path")
+async def get_critical_path():
+    """未完成任务中最长的依赖链（按预计时长加权）"""
+    nodes = {task_id for task_id in list(tasks_db) if _is_open(task_id)}
+    path = dependency_graph.critical_path(nodes, _task_hours)
+    return fast_response({
+        "hours": sum(_task_hours(n) for n in path),
+        "tasks": [tasks_db[n] for n in path],
+    })
+
+# ===== 重复任务 =====
+# 重复任务本身作为“模板”保存一次；各次实例只在查询时按区间展开（虚拟任务，ID 为 "<模板ID>@<日期>"），
+# 只有在实例被修改或完成时才物化为真实任务，之后展开时跳过该日期
+OCCURRENCE_SEP = "@"
+OCCURRENCE_CACHE_SIZE = 10000
+
+recurring_index: Dict[str, None] = {}  # 未完成的重复任务 ID
+_occurrence_cache: Dict[str, tuple] = {}  # 实例 ID -> (模板对象, 实例)，模板被替换后自动失效
+
+def _update_recurring_index(old: Optional[Task], new: Optional[Task]):
+    if new is not None and new.recurrence is not None and not new.completed:
+        recurring_index[new.id] = None
+    elif old is not None:
+        recurring_index.pop(old.id, None)
+
+task_listeners.append(_update_recurring_index)
+
+def _series_anchor(series: Task):
+    """重复任务首次实例的日期及其在日历中的类型"""
+    if series.due_date:
+        return series.due_date.date(), "due"
+    return series.scheduled_date, "scheduled"
+
+def check_recurrence(task):
+    rule = task.recurrence
+    if rule is None:
+        return
+    if rule.freq not in FREQUENCIES:
+        raise ValueError(f"freq 只支持 {'/'.join(FREQUENCIES)}")
+    if rule.interval < 1:
+        raise ValueError("interval 必须大于 0")
+    if rule.count is not None and rule.count < 1:
+        raise ValueError("count 必须大于 0")
+    if rule.weekdays and any(not 0 <= wd <= 6 for wd in rule.weekdays):
+        raise ValueError("weekdays 取值范围为 0-6")
+    if not task.due_date and not task.scheduled_date:
+        raise ValueError("重复任务需要设置 due_date 或 scheduled_date 作为首次日期")
+
+def check_recurrence_or_400(task):
+    try:
+        check_recurrence(task)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def series_dates(series: Task, start: date, end: date):
+    rule = series.recurrence
+    anchor, _ = _series_anchor(series)
+    return occurrence_dates(rule.freq, rule.interval, anchor, start, end, weekdays=rule.weekdays,
+                            until=rule.until, count=rule.count, exdates=set(rule.exdates))
+
+def build_occurrence(series: Task, day: date) -> Task:
+    """生成（或从缓存取出）某一天的虚拟实例"""
+    occurrence_id = f"{series.id}{OCCURRENCE_SEP}{day.isoformat()}"
+    cached = _occurrence_cache.get(occurrence_id)
+    if cached is not None and cached[0] is series:
+        return cached[1]
+
+    _, kind = _series_anchor(series)
+    occurrence = series.model_copy(update={
+        "id": occurrence_id,
+        "version": series.version,  # 虚拟实例的内容随模板变化，ETag 取模板的版本
+        "recurrence": None,
+        "recurrence_id": series.id,
+        "occurrence_date": day,
+        "depends_on": [],
+        "due_date": datetime.combine(day, series.due_date.timetz()) if kind == "due" else series.due_date,
+        "scheduled_date": day if kind == "scheduled" else series.scheduled_date,
+    })
+    stamp_dates(occurrence)
+    if len(_occurrence_cache) >= OCCURRENCE_CACHE_SIZE:
+        _occurrence_cache.clear()
+    _occurrence_cache[occurrence_id] = (series, occurrence)
+    return occurrence
+
+def occurrence_day(kind: str, occurrence: Task, zone) -> date:
+    """实例在用户时区中所在的日期：截止类按截止时间换算（与一次性任务相同），计划类就是计划日期"""
+    if kind == "due":
+        return from_epoch_day(epoch_day(occurrence.due_ts, zone))
+    return occurrence.occurrence_date
+
+def series_occurrences(series: Task, start: date, end: date, zone):
+    """重复任务在用户时区 [start, end] 内未物化的实例，产出 (日期, 日历类型, 实例)
+
+    截止时间换算到用户时区后与实例日期最多相差两天（同 _due_in_zone），截止类多展开两侧各两天再过滤
+    """
+    _, kind = _series_anchor(series)
+    margin = timedelta(days=2) if kind == "due" else timedelta(0)
+    for occurrence_date in series_dates(series, start - margin, end + margin):
+        occurrence = build_occurrence(series, occurrence_date)
+        if occurrence.id in tasks_db:
+            continue
+        day = occurrence_day(kind, occurrence, zone)
+        if start <= day <= end:
+            yield day, kind, occurrence
+
+def expand_occurrences(start: date, end: date, zone):
+    """展开用户时区 [start, end] 内所有未物化的实例，产出 (日期, 日历类型, 实例)"""
+    for series_id in list(recurring_index):
+        series = tasks_db.get(series_id)
+        if series is None or series.recurrence is None:
+            continue
+        yield from series_occurrences(series, start, end, zone)
+
+def get_occurrence(task_id: str) -> Optional[Task]:
+    """解析 "<模板ID>@<日期>" 形式的虚拟实例 ID；日期不是有效实例时返回 None"""
+    series_id, sep, day_str = task_id.rpartition(OCCURRENCE_SEP)
+    if not sep:
+        return None
+    series = tasks_db.get(series_id)
+    if series is None or series.recurrence is None:
+        return None
+    try:
+        day = date.fromisoformat(day_str)
+    except ValueError:
+        return None
+    if day not in set(series_dates(series, day, day)):
+        return None
+    return build_occurrence(series, day)
+
+def lookup_task(task_id: str) -> Optional[Task]:
+    """按 ID 查找真实任务或虚拟实例"""
+    task = tasks_db.get(task_id)
+    return task if task is not None else get_occurrence(task_id)
 
-        # 解析 AI 返回的内容
-        content = response.choices[0].message.content
-        # 尝试提取 JSON 部分
-        start_idx = content.find('[')
-        end_idx = content.rfind(']') + 1
-        if start_idx != -1 and end_idx > start_idx:
-            json_content = content[start_idx:end_idx]
-            ai_tasks = json.loads(json_content)
+def materialize_occurrence(task_id: str) -> Optional[Task]:
+    """把虚拟实例保存为真实任务（已物化时直接返回）"""
+    with store_lock:
+        task = tasks_db.get(task_id)
+        if task is not None:
+            return task
+        occurrence = get_occurrence(task_id)
+        if occurrence is None:
+            return None
+        occurrence = occurrence.model_copy(update={"created_at": datetime.now()})
+        save_task(occurrence)
+        return occurrence
+
+def skip_occurrence(occurrence: Task):
+    """删除实例（虚拟的或已物化的）：把日期加入模板的 exdates；模板已删除或不再重复时不做任何事"""
+    series = tasks_db.get(occurrence.recurrence_id)
+    if series is None or series.recurrence is None:
+        return
+    rule = series.recurrence.model_copy(update={
+        "exdates": sorted(set(series.recurrence.exdates) | {occurrence.occurrence_date}),
+    })
+    apply_task_update(series.id, {"recurrence": rule})
+
+# ===== 今日视图 =====
+# GET /tasks/today 的数据按用户时区物化：第一次请求某个时区时构建，之后随写入增量维护，
+# 每天零点由后台协程滚动（请求先于后台协程看到新的一天时在请求中滚动）
+TODAY_VIEW_MAX_ZONES = 16
+TODAY_ROLLOVER_CHECK = 60.0  # 后台协程最长的检查间隔（秒），用于接管新建的视图
+
+today_views: Dict[Any, TodayView] = {}  # 时区 -> 视图，按创建顺序淘汰
+
+def _series_today(series_id: str, day: date, zone) -> list:
+    """重复任务在用户时区 day 当天未物化的实例，返回 [(日历类型, 实例)]"""
+    series = tasks_db.get(series_id)
+    if series_id not in recurring_index or series is None:
+        return []
+    return [(kind, occurrence) for _, kind, occurrence in series_occurrences(series, day, day, zone)]
+
+def _today_occurrences(day: date, zone) -> Dict[str, list]:
+    occurrences = {}
+    for series_id in list(recurring_index):
+        items = _series_today(series_id, day, zone)
+        if items:
+            occurrences[series_id] = items
+    return occurrences
+
+def _arriving_today(window, zone) -> List[Task]:
+    """新一天到期或计划的未完成任务，从日历索引中取出"""
+    bucket = calendar_index.get(window.day)
+    if zone is store_zone:
+        due = _lookup_tasks(bucket["due"]) if bucket else []
+    else:
+        due = _due_in_zone(window.day, window.day, zone).get(window.day, [])
+    return due + (_lookup_tasks(bucket["scheduled"]) if bucket else [])
+
+def _update_today_views(old: Optional[Task], new: Optional[Task]):
+    if not today_views:
+        return
+    task = new if new is not None else old
+    # 模板变化或实例物化/删除时重新计算该重复任务今天的实例
+    if task.recurrence is not None or (old is not None and old.recurrence is not None):
+        series_id = task.id
+    else:
+        series_id = task.recurrence_id
+    for view in today_views.values():
+        view.apply(old, new)
+        if series_id is not None:
+            view.set_occurrences(series_id, _series_today(series_id, view.window.day, view.zone))
+
+task_listeners.append(_update_today_views)
+
+def roll_today_view(view: TodayView, window):
+    """把视图滚动到 window 所在的一天"""
+    with store_lock:
+        if view.window == window:
+            return
+        if window.day == view.window.day + timedelta(days=1):
+            view.roll(window, _arriving_today(window, view.zone), _today_occurrences(window.day, view.zone))
+            mode = "incremental"
         else:
-            ai_tasks = json.loads(content)
+            view.reset(window, list(tasks_db.values()), _today_occurrences(window.day, view.zone))
+            mode = "rebuild"
+    today_rollovers.inc(mode)
+
+def today_view(zone) -> TodayView:
+    window = clock.today(zone)
+    view = today_views.get(zone)
+    if view is None:
+        with store_lock:
+            view = today_views.get(zone)
+            if view is None:
+                view = TodayView(zone, window)
+                view.reset(window, list(tasks_db.values()), _today_occurrences(window.day, view.zone))
+                if len(today_views) >= TODAY_VIEW_MAX_ZONES:
+                    del today_views[next(iter(today_views))]
+                today_views[zone] = view
+    if view.window != window:
+        roll_today_view(view, window)
+    return view
+
+async def roll_today_views():
+    """后台协程：到最早一个视图的次日零点时滚动所有已经过期的视图"""
+    while True:
+        views = list(today_views.values())
+        delay = min((view.window.end for view in views), default=math.inf) - clock.now()
+        await asyncio.sleep(min(max(delay, 0.0), TODAY_ROLLOVER_CHECK))
+        for view in views:
+            if clock.now() >= view.window.end:
+                roll_today_view(view, clock.today(view.zone))
+
+@router.get("/tasks/today")
+async def get_today(limit: int = 100, zone=Depends(user_zone)):
+    """今日视图：逾期、今天到期、今天计划的未完成任务（含重复任务今天的实例），按用户时区计算
+
+    每组最多返回 limit 个（逾期和到期按截止时间排序），counts 为各组的完整数量
+    """
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit 必须大于 0")
+    with span("store"):
+        snapshot = today_view(zone).snapshot()
+        if any(len(snapshot[name]) > limit for name in TODAY_SECTIONS):
+            snapshot = {**snapshot, **{name: snapshot[name][:limit] for name in TODAY_SECTIONS}}
+    return fast_response(snapshot)
+
+# ===== 下一步任务 =====
+# GET /tasks/next：未完成任务按 (优先级, 最晚开始时间, 预计时长, 创建时间) 排序，最晚开始时间 = 截止时间 - 预计时长。
+# 它与截止前的余量（截止时间 - 现在 - 预计时长）只差一个对所有任务相同的常数，排序结果不随时间变化，
+# 因此排序键可以在写入时计算并维护在堆中
+work_queue = WorkQueue()
+
+def next_key(task: Task) -> Optional[tuple]:
+    """任务在工作队列中的排序键；已完成的任务和重复任务模板不进入队列"""
+    if task.completed or task.recurrence is not None:
+        return None
+    hours = _hours(task)
+    latest_start = task.due_ts - hours * 3600 if task.due_ts is not None else math.inf
+    created = task.created_at.timestamp() if task.created_at is not None else 0.0
+    return PRIORITY_RANK.get(task.priority, 1), latest_start, hours, created
+
+def _update_work_queue(old: Optional[Task], new: Optional[Task]):
+    if new is None:
+        work_queue.update(old.id, None)
+    else:
+        work_queue.update(new.id, next_key(new))
+
+task_listeners.append(_update_work_queue)
+
+@router.get("/tasks/next", response_model=List[Task])
+async def get_next_tasks(n: int = 10, include_blocked: bool = False):
+    """接下来应该做的 n 个任务；默认跳过还有未完成前置任务的任务"""
+    if n < 1:
+        raise HTTPException(status_code=400, detail="n 必须大于 0")
+    result = []
+    with span("store"), store_lock:
+        for task_id in work_queue.iter_smallest():
+            task = tasks_db[task_id]
+            if not include_blocked and any(_is_open(dep) for dep in task.depends_on):
+                continue
+            result.append(task)
+            if len(result) >= n:
+                break
+    return fast_response(result)
+
+@router.get("/tasks/{task_id}", response_model=Task)
+async def get_task(task_id: str, response: Response):
+    """获取单个任务（也可以是重复任务的实例）"""
+    task = lookup_task(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return fast_response(task, {"ETag": task_etag(task)}, response)
+
+@router.put("/tasks/{task_id}", response_model=Task)
+async def update_task(task_id: str, task_update: TaskUpdate, response: Response,
+                      if_match: Optional[str] = Header(None)):
+    """更新任务；携带 If-Match 时只有版本一致才会写入"""
+    # 直接取字段值而不是 model_dump()：嵌套模型（如 recurrence）保持为模型对象
+    update_data = {name: getattr(task_update, name) for name in task_update.model_fields_set}
+    expected_version = parse_if_match(if_match)
+    with store_lock:
+        # 修改重复任务的某次实例时先将其物化
+        if task_id not in tasks_db:
+            materialize_occurrence(task_id)
+        # 复制后修改再整体替换，正在进行的导出/读取仍看到旧对象
+        task = apply_task_update(task_id, update_data, expected_version)
+    await journal_barrier()
+    return fast_response(task, {"ETag": task_etag(task)}, response)
+
+@router.delete("/tasks/{task_id}")
+async def delete_task(task_id: str, if_match: Optional[str] = Header(None)):
+    """删除任务"""
+    expected_version = parse_if_match(if_match)
+    with store_lock:
+        if task_id not in tasks_db:
+            occurrence = get_occurrence(task_id)
+            if occurrence is None:
+                raise HTTPException(status_code=404, detail="任务不存在")
+            if expected_version is not None and occurrence.version != expected_version:
+                raise HTTPException(status_code=412, detail="任务已被修改，请刷新后重试")
+            skip_occurrence(occurrence)
+        else:
+            task = tasks_db[task_id]
+            if expected_version is not None and task.version != expected_version:
+                raise HTTPException(status_code=412, detail="任务已被修改，请刷新后重试")
+            remove_task(task_id)
+            # 已物化的实例：同时跳过该日期，否则展开时会作为虚拟实例再次出现
+            if task.recurrence_id is not None:
+                skip_occurrence(task)
+    await journal_barrier()
+    return {"message": "任务已删除"}
+
+# ===== 异步 AI 功能 =====
+def call_llm(operation: str, endpoint: str = "primary", **kwargs):
+    """调用 LLM（endpoint 为 primary 或 secondary），并记录耗时、结果和 token 用量"""
+    if endpoint == "secondary":
+        llm_client, model = get_secondary_client(), settings.llm_secondary_model or settings.llm_model
+    else:
+        llm_client, model = get_ai_client(), settings.llm_model
+    start = time.perf_counter()
+    try:
+        with span("llm"):
+            response = llm_client.chat.completions.create(model=model, **kwargs)
+    except Exception:
+        llm_latency.observe(time.perf_counter() - start, operation)
+        llm_calls.inc(operation, "error")
+        raise
+    llm_latency.observe(time.perf_counter() - start, operation)
+    llm_calls.inc(operation, "ok")
+
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        llm_tokens.inc(operation, "prompt", amount=usage.prompt_tokens or 0)
+        llm_tokens.inc(operation, "completion", amount=usage.completion_tokens or 0)
+    return response
+
+async def guarded_llm(operation: str, deadline: float, **kwargs):
+    """带截止时间、对冲和熔断的 LLM 调用（同步 SDK 调用在线程中执行）
+
+    失败、超时或所有端点熔断时抛出异常，由调用方改用本地规则；各路径的次数记录在 todo_llm_served_total
+    """
+    attempts = [Attempt("primary", lambda: call_llm(operation, **kwargs), llm_breakers["primary"])]
+    if has_secondary(settings):
+        attempts.append(Attempt("secondary", lambda: call_llm(operation, "secondary", **kwargs),
+                                llm_breakers["secondary"]))
+    elif settings.llm_hedge_after is not None:
+        # 没有备用端点时对冲到主端点本身，共用同一个熔断器
+        attempts.append(Attempt("hedge", attempts[0].call, llm_breakers["primary"]))
+    try:
+        response, path = await hedged_call(attempts, deadline, settings.llm_hedge_after)
+    except CircuitOpenError:
+        llm_served.inc(operation, "circuit_open")
+        raise
+    except DeadlineExceeded:
+        llm_served.inc(operation, "timeout")
+        raise
+    except Exception:
+        llm_served.inc(operation, "error")
+        raise
+    llm_served.inc(operation, path)
+    return response
 
-        # 限制任务数量
-        ai_tasks = ai_tasks[:max_tasks]
+# ===== AI 任务去重 =====
+# 未完成任务的名称建立 MinHash/LSH 索引；写入时只记录变化（恢复和批量导入不必计算签名），
+# 去重检查前再把积累的变化应用到索引
+task_dedup_index = MinHashIndex()
+_dedup_pending: Dict[str, Optional[str]] = {}  # 任务 ID -> 新名称（None 表示移出索引）
+_dedup_lock = threading.Lock()
 
-        # 创建任务并保存
+def _update_dedup_index(old: Optional[Task], new: Optional[Task]):
+    if new is not None and not new.completed:
+        if old is None or old.completed or old.name != new.name:
+            _dedup_pending[new.id] = new.name
+    elif old is not None and not old.completed:
+        _dedup_pending[old.id] = None
+
+task_listeners.append(_update_dedup_index)
+
+def refresh_dedup_index():
+    """把积累的任务变化应用到去重索引（首次调用时相当于全量建索引）"""
+    global _dedup_pending
+    with _dedup_lock:
+        with store_lock:
+            pending, _dedup_pending = _dedup_pending, {}
+        for task_id, name in pending.items():
+            if name is None:
+                task_dedup_index.remove(task_id)
+            else:
+                task_dedup_index.add(task_id, name)
+
+def find_duplicate(name: str) -> Optional[DuplicateMatch]:
+    """与 name 最相似且达到 dedup_threshold 的未完成任务"""
+    refresh_dedup_index()
+    for task_id, similarity in task_dedup_index.query(name, settings.dedup_threshold):
+        task = tasks_db.get(task_id)
+        if task is not None and not task.completed:
+            return DuplicateMatch(name=name, task_id=task_id, similarity=round(similarity, 3),
+                                  merged=settings.dedup_mode == "merge")
+    return None
+
+def transition_job(job: AIJob, status: AIJobStatus):
+    """切换 AI 任务状态，并记录上一状态的持续时间"""
+    now = datetime.now()
+    if status == AIJobStatus.PROCESSING:
+        job.started_at = now
+        ai_job_state_seconds.observe((now - job.created_at).total_seconds(), AIJobStatus.PENDING.value)
+    else:
+        job.finished_at = now
+        ai_job_state_seconds.observe((now - (job.started_at or job.created_at)).total_seconds(),
+                                     AIJobStatus.PROCESSING.value)
+        ai_jobs_finished.inc(status.value)
+    job.status = status
+    persist_job(job)
+    if status in (AIJobStatus.COMPLETED, AIJobStatus.FAILED):
+        publish_job(job)
+
+def job_task_id(job_id: str, *parts: str) -> str:
+    """AI 任务生成的第 n 个任务的 ID：由 job_id 确定，重启后重新执行时不会重复创建"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, "/".join(("ai-job", job_id) + parts)))
+
+def request_plan(prompt: str, max_tasks: int) -> List[Dict[str, Any]]:
+    """调用模型把描述分解为任务列表（最多 max_tasks 个）"""
+    # 获取当前时间信息
+    now = datetime.now()
+    current_date_str = now.strftime("%Y年%m月%d日 %H:%M")
+    weekday_names = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
+    current_weekday = weekday_names[now.weekday()]
+    
+    response = call_llm(
+        "plan",
+        messages=[
+            {
+                "role": "system",
+                "content": f"""你是一个任务规划助手。根据用户的描述，将其分解为具体的任务步骤。
+                
+                当前时间：{current_date_str} {current_weekday}
+                
+                限制：最多生成 {max_tasks} 个任务。
+                
+                每个任务应该包含：
+                - name: 任务名称（简短明确）
+                - description: 任务描述（详细说明）
+                - priority: 优先级（high/medium/low）
+                - estimated_hours: 预计所需小时数
+                - due_date: 截止时间（ISO格式，如：2024-12-25T15:00:00）
+                - depends_on: 前置任务在数组中的序号列表（从0开始，只能引用排在前面的任务），没有则为空数组
+                
+                重要规则：
+                1. 根据任务的紧急程度和依赖关系设置合理的截止时间
+                2. 如果用户提到"明天"、"后天"等相对时间，要转换为具体日期
+                3. 考虑任务的先后顺序，前置任务的截止时间要早于后续任务
+                4. 紧急任务设置为high优先级，截止时间更近
+                5. 所有时间都基于当前时间计算
+                
+                请以JSON数组格式返回，确保返回的是有效的JSON。
+                """,
+            },
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.7,
+        max_tokens=500,
+    )
+
+    # 解析 AI 返回的内容
+    content = response.choices[0].message.content
+    # 尝试提取 JSON 部分
+    start_idx = content.find('[')
+    end_idx = content.rfind(']') + 1
+    if start_idx != -1 and end_idx > start_idx:
+        json_content = content[start_idx:end_idx]
+        ai_tasks = json.loads(json_content)
+    else:
+        ai_tasks = json.loads(content)
+    return ai_tasks[:max_tasks]
+
+async def process_ai_planning(job_id: str, prompt: str, max_tasks: int):
+    """后台处理 AI 任务规划；重启后重新执行时复用已记录的规划和已创建的任务"""
+    job = ai_jobs_db[job_id]
+    transition_job(job, AIJobStatus.PROCESSING)
+    try:
+        if job.plan is None:
+            async with llm_semaphore():
+                job.plan = await asyncio.to_thread(request_plan, prompt, max_tasks)
+            persist_job(job)
+        ai_tasks = job.plan
+
+        # 创建任务并保存；与未完成任务（包括本批中已创建的）重复的按 dedup_mode 合并或标出
+        if settings.dedup_mode != "off":
+            await asyncio.to_thread(refresh_dedup_index)
         created_tasks = []
-        for task_data in ai_tasks:
+        duplicates = []
+        for index, task_data in enumerate(ai_tasks):
+            task_id = job_task_id(job_id, str(index))
+            existing = tasks_db.get(task_id)
+            if existing is not None:
+                created_tasks.append(existing)  # 重启前已经创建
+                continue
+            name = task_data.get("name", "未命名任务")
+            duplicate = find_duplicate(name) if settings.dedup_mode != "off" else None
+            if duplicate is not None:
+                duplicates.append(duplicate)
+                ai_duplicates.inc("merged" if duplicate.merged else "flagged")
+                existing = tasks_db.get(duplicate.task_id)
+                if duplicate.merged and existing is not None:
+                    # 后续任务的 depends_on 序号仍指向这里，改为依赖已有任务
+                    created_tasks.append(existing)
+                    continue
             # 处理due_date，确保是有效的ISO格式
             due_date_str = task_data.get("due_date")
             due_date = None
@@ -255,215 +1779,708 @@ async def process_ai_planning(job_id: str, prompt: str, max_tasks: int):
                             due_date = datetime.now() + timedelta(days=7)
             
             new_task = Task(
-                id=str(uuid.uuid4()),
-                name=task_data.get("name", "未命名任务"),
+                id=task_id,
+                name=name,
                 description=task_data.get("description", ""),
                 created_at=datetime.now(),
-                priority=task_data.get("priority", "medium"),
+                priority=parse_priority(task_data.get("priority")),
                 estimated_hours=task_data.get("estimated_hours"),
                 due_date=due_date,
+                # 只接受指向前面任务的序号，保证不会形成环
+                depends_on=[
+                    created_tasks[i].id for i in task_data.get("depends_on") or []
+                    if isinstance(i, int) and 0 <= i < index
+                ],
             )
-            tasks_db[new_task.id] = new_task
+            save_task(new_task)
             created_tasks.append(new_task)
 
         # 更新任务状态
-        ai_jobs_db[job_id].status = AIJobStatus.COMPLETED
-        ai_jobs_db[job_id].result = created_tasks
+        job.result = created_tasks
+        job.duplicates = duplicates
+        transition_job(job, AIJobStatus.COMPLETED)
 
     except Exception as e:
-        ai_jobs_db[job_id].status = AIJobStatus.FAILED
-        ai_jobs_db[job_id].error = str(e)
+        job.error = str(e)
+        transition_job(job, AIJobStatus.FAILED)
 
-@app.post("/ai/plan-tasks/async")
-async def ai_plan_tasks_async(request: AITaskRequest, background_tasks: BackgroundTasks):
-    """异步 AI 任务规划"""
-    job_id = str(uuid.uuid4())
+def create_ai_job(operation: str, params: Dict[str, Any], idempotency_key: Optional[str]):
+    """创建并持久化 AI 任务，返回 (任务, 是否新建)
+
+    同一个 Idempotency-Key 再次提交时返回已有的任务，不会重复调用模型；参数不同时返回 409
+    """
+    if idempotency_key is not None:
+        job = ai_jobs_db.get(ai_job_keys.get(idempotency_key, ""))
+        if job is not None:
+            if job.operation != operation or job.params != params:
+                raise HTTPException(status_code=409, detail="Idempotency-Key 已用于不同的请求")
+            return job, False
     job = AIJob(
-        job_id=job_id,
+        job_id=str(uuid.uuid4()),
         status=AIJobStatus.PENDING,
-        created_at=datetime.now()
+        created_at=datetime.now(),
+        operation=operation,
+        params=params,
+        idempotency_key=idempotency_key,
     )
-    ai_jobs_db[job_id] = job
-    
+    with store_lock:
+        ai_jobs_db[job.job_id] = job
+        if idempotency_key is not None:
+            ai_job_keys[idempotency_key] = job.job_id
+        persist_job(job)
+    return job, True
+
+async def run_ai_job(job: AIJob):
+    """按记录的参数执行 AI 任务（也用于重启后重新执行）"""
+    params = job.params
+    if job.operation == "subtasks":
+        await process_ai_subtasks(job.job_id, params["task_ids"], params["max_subtasks"])
+    else:
+        await process_ai_planning(job.job_id, params["prompt"], params["max_tasks"])
+
+_resumed_jobs: set = set()  # 保存引用，避免后台协程被回收
+
+def resume_ai_jobs() -> int:
+    """重新执行日志中未完成（pending/processing）的 AI 任务；在事件循环中调用，返回任务数"""
+    count = 0
+    for job in list(ai_jobs_db.values()):
+        if job.status in (AIJobStatus.PENDING, AIJobStatus.PROCESSING):
+            task = asyncio.create_task(run_ai_job(job))
+            _resumed_jobs.add(task)
+            task.add_done_callback(_resumed_jobs.discard)
+            ai_jobs_resumed.inc(job.operation)
+            count += 1
+    return count
+
+@router.post("/ai/plan-tasks/async")
+async def ai_plan_tasks_async(request: AITaskRequest, background_tasks: BackgroundTasks,
+                              idempotency_key: Optional[str] = Header(None)):
+    """异步 AI 任务规划；客户端重试时带上相同的 Idempotency-Key 头，返回同一个任务"""
+    job, created = create_ai_job("plan", {"prompt": request.prompt, "max_tasks": request.max_tasks},
+                                 idempotency_key)
+    if not created:
+        return {"job_id": job.job_id, "status": job.status.value}
+    await journal_barrier()
+
     # 添加后台任务
-    background_tasks.add_task(process_ai_planning, job_id, request.prompt, request.max_tasks)
+    background_tasks.add_task(run_ai_job, job)
     
-    return {"job_id": job_id, "status": "processing"}
+    return {"job_id": job.job_id, "status": "processing"}
 
-@app.get("/ai/jobs/{job_id}")
+@router.get("/ai/jobs/{job_id}")
 async def get_ai_job_status(job_id: str):
     """获取 AI 任务状态"""
     if job_id not in ai_jobs_db:
         raise HTTPException(status_code=404, detail="任务不存在")
     return ai_jobs_db[job_id]
 
-@app.post("/ai/schedule-tasks", response_model=Dict[str, List[Task]])
-async def ai_schedule_tasks(request: AIScheduleRequest):
-    """AI 根据优先级和截止日期智能安排任务"""
-    # 获取需要规划的任务
-    tasks_to_schedule = []
-    if request.task_ids:
-        for task_id in request.task_ids:
-            if task_id in tasks_db and not tasks_db[task_id].completed:
-                tasks_to_schedule.append(tasks_db[task_id])
-    else:
-        tasks_to_schedule = [t for t in tasks_db.values() if not t.completed]
-    
-    if not tasks_to_schedule:
-        return {"today": [], "tomorrow": [], "this_week": [], "later": []}
-    
-    try:
-        # 获取当前时间信息
-        now = datetime.now()
-        today = now.date()
-        tomorrow = today + timedelta(days=1)
-        week_end = today + timedelta(days=7)
-        
-        # 准备任务信息
-        tasks_info = []
-        for task in tasks_to_schedule:
-            task_info = {
-                "id": task.id,
-                "name": task.name,
-                "priority": task.priority,
-                "due_date": task.due_date.isoformat() if task.due_date else None,
-                "estimated_hours": task.estimated_hours,
-                "is_overdue": task.due_date and task.due_date < now if task.due_date else False
-            }
-            tasks_info.append(task_info)
-        
-        response = client.chat.completions.create(
-            model="Qwen/Qwen2.5-7B-Instruct",
+# ===== AI 子任务分解 =====
+# 子任务索引：parent_id -> {child_id: None}
+children_index: Dict[str, Dict[str, None]] = {}
+
+def _update_children_index(old: Optional[Task], new: Optional[Task]):
+    old_parent = old.parent_id if old is not None else None
+    new_parent = new.parent_id if new is not None else None
+    if old_parent == new_parent:
+        return
+    if old_parent is not None:
+        siblings = children_index.get(old_parent)
+        if siblings is not None:
+            siblings.pop(old.id, None)
+            if not siblings:
+                del children_index[old_parent]
+    if new_parent is not None:
+        children_index.setdefault(new_parent, {})[new.id] = None
+
+task_listeners.append(_update_children_index)
+
+_llm_semaphore: Optional[asyncio.Semaphore] = None
+
+def llm_semaphore() -> asyncio.Semaphore:
+    """所有后台任务共享的 LLM 并发限制"""
+    global _llm_semaphore
+    if _llm_semaphore is None:
+        _llm_semaphore = asyncio.Semaphore(settings.llm_concurrency)
+    return _llm_semaphore
+
+def parse_json_block(content: str, open_char: str, close_char: str):
+    """从模型回复中截取第一个 open_char 到最后一个 close_char 之间的 JSON"""
+    start_idx = content.find(open_char)
+    end_idx = content.rfind(close_char) + 1
+    if start_idx != -1 and end_idx > start_idx:
+        return json.loads(content[start_idx:end_idx])
+    return json.loads(content)
+
+async def suggest_subtasks(parent: Task, max_subtasks: int) -> List[Task]:
+    """为单个父任务调用 LLM 生成子任务（同步 SDK 调用放到线程中执行）"""
+    async with llm_semaphore():
+        response = await asyncio.to_thread(
+            call_llm,
+            "subtasks",
             messages=[
                 {
                     "role": "system",
-                    "content": f"""你是一个任务时间规划助手。根据任务的优先级、截止日期和预计时长，
-                    合理安排任务的执行时间。
-                    
-                    当前时间：{now.strftime("%Y-%m-%d %H:%M")}
-                    今天：{today}
-                    明天：{tomorrow}
-                    本周结束：{week_end}
-                    
-                    将任务分配到以下时间段：
-                    - today: 今天应该完成的任务（紧急或即将到期）
-                    - tomorrow: 明天应该完成的任务
-                    - this_week: 本周内应该完成的任务
-                    - later: 之后再做的任务
-                    
-                    考虑因素：
-                    1. 已过期的任务必须放在today
-                    2. 高优先级任务优先安排
-                    3. 截止日期临近的任务优先
-                    4. 每天工作时间不超过8小时
-                    5. 考虑任务的预计时长，合理分配
-                    
-                    返回JSON格式：
-                    {{
-                        "today": ["task_id1", "task_id2"],
-                        "tomorrow": ["task_id3"],
-                        "this_week": ["task_id4"],
-                        "later": ["task_id5"]
-                    }}
-                    """
+                    "content": f"""你是一个任务分解助手。将给定的任务分解为更小的可执行步骤。
+
+                    限制：最多 {max_subtasks} 个子任务。
+
+                    每个子任务包含：
+                    - name: 子任务名称（简短明确）
+                    - description: 子任务描述
+                    - estimated_hours: 预计所需小时数
+
+                    请以JSON数组格式返回，确保返回的是有效的JSON。
+                    """,
                 },
                 {
                     "role": "user",
-                    "content": f"请为以下任务安排执行时间：\n{json.dumps(tasks_info, ensure_ascii=False)}"
-                }
+                    "content": f"请将以下任务分解为子任务：\n任务名称：{parent.name}\n任务描述：{parent.description}",
+                },
             ],
             temperature=0.7,
-            max_tokens=500
+            max_tokens=300,
         )
-        
-        # 解析响应
-        content = response.choices[0].message.content
-        # 提取JSON部分
-        start_idx = content.find('{')
-        end_idx = content.rfind('}') + 1
-        if start_idx != -1 and end_idx > start_idx:
-            json_content = content[start_idx:end_idx]
-            schedule = json.loads(json_content)
+
+    with span("parse"):
+        items = parse_json_block(response.choices[0].message.content, "[", "]")
+    if not isinstance(items, list):
+        raise ValueError("AI 返回的不是任务列表")
+
+    subtasks = []
+    for item in items[:max_subtasks]:
+        subtasks.append(Task(
+            id=str(uuid.uuid4()),
+            name=item.get("name", "未命名子任务"),
+            description=item.get("description", ""),
+            created_at=datetime.now(),
+            priority=parent.priority,
+            estimated_hours=item.get("estimated_hours"),
+            due_date=parent.due_date,
+            parent_id=parent.id,
+        ))
+    return subtasks
+
+def existing_job_tasks(job_id: str, *parts: str) -> List[Task]:
+    """重启前 AI 任务已经创建的任务（ID 为 job_task_id(job_id, *parts, 序号)）"""
+    tasks = []
+    while True:
+        task = tasks_db.get(job_task_id(job_id, *parts, str(len(tasks))))
+        if task is None:
+            return tasks
+        tasks.append(task)
+
+async def process_ai_subtasks(job_id: str, task_ids: List[str], max_subtasks: int):
+    """后台并发为多个任务生成子任务，单个任务失败不影响其他任务
+
+    重启后重新执行时，已经生成过子任务的父任务直接使用已有的子任务
+    """
+    job = ai_jobs_db[job_id]
+    transition_job(job, AIJobStatus.PROCESSING)
+
+    parents = [parent for parent in (tasks_db.get(task_id) for task_id in task_ids) if parent is not None]
+    done = {parent.id: existing_job_tasks(job_id, parent.id) for parent in parents}
+    pending = [parent for parent in parents if not done[parent.id]]
+    results = await asyncio.gather(
+        *(suggest_subtasks(parent, max_subtasks) for parent in pending),
+        return_exceptions=True,
+    )
+    results = dict(zip([parent.id for parent in pending], results))
+
+    created, errors = [], {}
+    for task_id in task_ids:
+        if tasks_db.get(task_id) is None:
+            errors[task_id] = "任务不存在"
+    for parent in parents:
+        if done[parent.id]:
+            created.extend(done[parent.id])
+            continue
+        result = results[parent.id]
+        if isinstance(result, Exception):
+            errors[parent.id] = str(result)
+            continue
+        for index, subtask in enumerate(result):
+            subtask.id = job_task_id(job_id, parent.id, str(index))
+            save_task(subtask)
+            created.append(subtask)
+
+    job.result = created
+    job.errors = errors or None
+    if created or not errors:
+        transition_job(job, AIJobStatus.COMPLETED)
+    else:
+        job.error = "所有子任务生成均失败"
+        transition_job(job, AIJobStatus.FAILED)
+
+@router.post("/ai/suggest-subtasks/async")
+async def ai_suggest_subtasks_async(request: AISubtaskRequest, background_tasks: BackgroundTasks,
+                                    idempotency_key: Optional[str] = Header(None)):
+    """异步为一个或多个任务生成子任务，通过 /ai/jobs/{job_id} 查询结果；支持 Idempotency-Key 头"""
+    if not request.task_ids:
+        raise HTTPException(status_code=400, detail="task_ids 不能为空")
+    # 去重并保持顺序
+    task_ids = list(dict.fromkeys(request.task_ids))
+    job, created = create_ai_job("subtasks", {"task_ids": task_ids, "max_subtasks": request.max_subtasks},
+                                 idempotency_key)
+    if not created:
+        return {"job_id": job.job_id, "status": job.status.value}
+    await journal_barrier()
+    background_tasks.add_task(run_ai_job, job)
+    return {"job_id": job.job_id, "status": "processing"}
+
+@router.get("/tasks/{task_id}/subtasks", response_model=List[Task])
+async def get_subtasks(task_id: str, recursive: bool = False):
+    """获取子任务；recursive=true 时按层级顺序返回整棵子树"""
+    if task_id not in tasks_db:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    result = []
+    seen = {task_id}
+    queue = deque([task_id])
+    while queue:
+        parent_id = queue.popleft()
+        for child_id in list(children_index.get(parent_id, ())):
+            child = tasks_db.get(child_id)
+            if child is None or child_id in seen:
+                continue
+            seen.add(child_id)
+            result.append(child)
+            if recursive:
+                queue.append(child_id)
+    return fast_response(result)
+
+def expand_for_schedule(tasks: List[Task], today: date, days: int = 7) -> List[Task]:
+    """把重复任务模板替换为未来 days 天内的实例"""
+    expanded = []
+    for task in tasks:
+        if task.recurrence is None:
+            expanded.append(task)
+            continue
+        for day in series_dates(task, today, today + timedelta(days=days)):
+            occurrence = lookup_task(build_occurrence(task, day).id)
+            if occurrence is not None and not occurrence.completed:
+                expanded.append(occurrence)
+    return expanded
+
+@router.post("/ai/schedule-tasks", response_model=Dict[str, List[Task]])
+async def ai_schedule_tasks(request: AIScheduleRequest, zone=Depends(user_zone)):
+    """AI 根据优先级和截止日期智能安排任务（按用户时区划分今天/明天/本周）"""
+    if request.mode not in ("ai", "graph"):
+        raise HTTPException(status_code=400, detail="mode 只支持 ai 或 graph")
+    started = time.perf_counter()
+    window = clock.today(zone)
+    today = window.day
+    # 获取需要规划的任务
+    tasks_to_schedule = []
+    with span("store"):
+        if request.task_ids:
+            for task_id in request.task_ids:
+                task = lookup_task(task_id)
+                if task is not None and not task.completed:
+                    tasks_to_schedule.append(task)
         else:
-            schedule = json.loads(content)
-        
-        # 构建返回结果
-        result = {
-            "today": [],
-            "tomorrow": [],
-            "this_week": [],
-            "later": []
-        }
-        
+            tasks_to_schedule = [t for t in tasks_db.values() if not t.completed]
+        tasks_to_schedule = expand_for_schedule(tasks_to_schedule, today)
+    
+    if not tasks_to_schedule:
+        return {"today": [], "tomorrow": [], "this_week": [], "later": []}
+
+    if request.mode == "graph":
+        with store_lock:
+            # 虚拟实例不在依赖图中，按各自日期直接归入对应时间段
+            result = schedule_by_dependencies([t for t in tasks_to_schedule if t.recurrence_id is None
+                                               or t.id in tasks_db])
+            for task in tasks_to_schedule:
+                if task.id not in tasks_db:
+                    days = (task.occurrence_date - today).days
+                    period = "today" if days <= 0 else "tomorrow" if days == 1 else \
+                        "this_week" if days <= 7 else "later"
+                    result[period].append(task)
+        return fast_response(result)
+    
+    # 已逾期和今天到期的任务直接放在今天，只把需要权衡的任务交给模型；
+    # 任务太多时按重要性分块并发请求，超出分块上限的部分按规则安排
+    now = datetime.fromtimestamp(clock.now(), zone)
+    fixed_today, ambiguous = prebucket(tasks_to_schedule, window.end)
+    ambiguous.sort(key=lambda t: (PRIORITY_RANK.get(t.priority, 1), t.due_ts if t.due_ts is not None else math.inf))
+    prompts, _ = build_prompts(
+        ambiguous, now, zone,
+        fixed_today_hours=sum(_hours(t) for t in fixed_today),
+        daily_hours=DAILY_HOURS,
+        budget_tokens=settings.llm_schedule_prompt_tokens,
+        max_chunks=settings.llm_schedule_max_chunks,
+    )
+    # 模型在延迟目标内没有返回的分块按规则安排（留出 10% 给规则安排和序列化）；熔断时不发请求，直接按规则安排
+    if llm_available():
+        budget = settings.schedule_slo_seconds * 0.9 - (time.perf_counter() - started)
+        deadline_at = asyncio.get_running_loop().time() + budget
+        schedules = await asyncio.gather(*(schedule_chunk(prompt, deadline_at) for prompt in prompts),
+                                         return_exceptions=True)
+    else:
+        schedules = []
+        if prompts:
+            llm_served.inc("schedule", "circuit_open", amount=len(prompts))
+
+    result = {"today": list(fixed_today), "tomorrow": [], "this_week": [], "later": []}
+    by_id = {task.id: task for task in ambiguous}
+    assigned = set()
+    for schedule in schedules:
+        if isinstance(schedule, Exception):
+            continue  # 该块的任务按规则安排
         for period, task_ids in schedule.items():
-            if period in result:
-                for task_id in task_ids:
-                    if task_id in tasks_db:
-                        result[period].append(tasks_db[task_id])
-        
-        return result
-        
-    except Exception as e:
-        # 如果AI失败，使用简单的规则进行调度
-        result = {
-            "today": [],
-            "tomorrow": [],
-            "this_week": [],
-            "later": []
-        }
-        
-        # 按优先级和截止日期排序
-        sorted_tasks = sorted(tasks_to_schedule, 
-                            key=lambda t: (
-                                t.priority != "high",  # 高优先级优先
-                                t.due_date or datetime.max,  # 有截止日期的优先
-                                t.created_at
-                            ))
-        
-        today_hours = 0
-        tomorrow_hours = 0
-        
-        for task in sorted_tasks:
-            task_hours = task.estimated_hours or 2  # 默认2小时
-            
-            # 已过期或今天到期的任务
-            if task.due_date and task.due_date.date() <= today:
-                result["today"].append(task)
-                today_hours += task_hours
-            # 明天到期的任务
-            elif task.due_date and task.due_date.date() == tomorrow:
-                result["tomorrow"].append(task)
-                tomorrow_hours += task_hours
-            # 本周内到期的任务
-            elif task.due_date and task.due_date.date() <= week_end:
-                result["this_week"].append(task)
-            # 根据工作负荷分配
-            elif today_hours < 8:
-                result["today"].append(task)
-                today_hours += task_hours
-            elif tomorrow_hours < 8:
-                result["tomorrow"].append(task)
-                tomorrow_hours += task_hours
-            else:
-                result["later"].append(task)
-        
-        return result
+            for task_id in task_ids:
+                if task_id not in assigned:
+                    assigned.add(task_id)
+                    result[period].append(by_id[task_id])
+
+    # 模型遗漏、调用失败或超出分块上限的任务
+    leftover = [task for task in ambiguous if task.id not in assigned]
+    if leftover:
+        for period, tasks in rule_based_schedule(leftover, window, zone).items():
+            result[period].extend(tasks)
+    response = fast_response(result)
+    elapsed = time.perf_counter() - started
+    slo_requests.inc("schedule", "met" if elapsed <= settings.schedule_slo_seconds else "missed")
+    return response
+
+def llm_available() -> bool:
+    """是否至少有一个端点没有熔断（不占用半开状态的试探名额）"""
+    if llm_breakers["primary"].state != "open":
+        return True
+    return has_secondary(settings) and llm_breakers["secondary"].state != "open"
+
+async def schedule_chunk(prompt: SchedulePrompt, deadline_at: float) -> Dict[str, List[str]]:
+    """用一个分块的提示词调用 LLM，返回 {时间段: [任务 ID]}；等待并发名额的时间也计入截止时间"""
+    loop = asyncio.get_running_loop()
+    semaphore = llm_semaphore()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline_at - loop.time()))
+    except asyncio.TimeoutError:
+        llm_served.inc("schedule", "timeout")
+        raise DeadlineExceeded("等待 LLM 并发名额超时")
+    try:
+        response = await guarded_llm(
+            "schedule",
+            max(0.0, deadline_at - loop.time()),
+            messages=prompt.messages,
+            temperature=0.7,
+            max_tokens=prompt.max_tokens,
+        )
+    finally:
+        semaphore.release()
+    with span("parse"):
+        return parse_schedule(response.choices[0].message.content, prompt.ids)
+
+def rule_based_schedule(tasks: List[Task], window, zone) -> Dict[str, List[Task]]:
+    """不依赖 AI 的简单规则：按截止时间归入时间段，没有截止时间的按每天工作量填充"""
+    result = {
+        "today": [],
+        "tomorrow": [],
+        "this_week": [],
+        "later": []
+    }
+
+    # 按优先级和截止日期排序（比较时间戳，带时区与不带时区的截止时间可以混合排序）
+    sorted_tasks = sorted(tasks, 
+                        key=lambda t: (
+                            t.priority != "high",  # 高优先级优先
+                            t.due_ts if t.due_ts is not None else math.inf,  # 有截止日期的优先
+                            t.created_at
+                        ))
+    # 各时间段的结束时间（用户时区的零点）
+    today_end = window.end
+    tomorrow_end = day_start(window.day + timedelta(days=2), zone)
+    week_end_ts = day_start(window.day + timedelta(days=8), zone)
+
+    today_hours = 0
+    tomorrow_hours = 0
+
+    for task in sorted_tasks:
+        task_hours = _hours(task)
+        due = task.due_ts if task.due_ts is not None else math.inf
+        # 已过期或今天到期的任务
+        if due < today_end:
+            result["today"].append(task)
+            today_hours += task_hours
+        # 明天到期的任务
+        elif due < tomorrow_end:
+            result["tomorrow"].append(task)
+            tomorrow_hours += task_hours
+        # 本周内到期的任务
+        elif due < week_end_ts:
+            result["this_week"].append(task)
+        # 根据工作负荷分配
+        elif today_hours < DAILY_HOURS:
+            result["today"].append(task)
+            today_hours += task_hours
+        elif tomorrow_hours < DAILY_HOURS:
+            result["tomorrow"].append(task)
+            tomorrow_hours += task_hours
+        else:
+            result["later"].append(task)
+
+    return result
+
+# ===== 截止提醒 =====
+# 待提醒的任务放在按提醒时间排序的堆里，任务变更时由监听器增量更新，后台协程睡到最早的提醒时间再分发；
+# 重复任务只排下一次实例的提醒，触发后再排下一次
+REMINDER_HORIZON_DAYS = 366  # 重复任务向后查找下一次实例的范围
+
+reminders_fired = metrics_registry.counter(
+    "todo_reminders_delivered_total", "提醒事件分发次数", ("sink", "outcome"))
+
+memory_sink = MemorySink()
+sse_sink = SSESink()
+reminder_sinks: list = []
+
+def configure_reminder_sinks():
+    reminder_sinks[:] = [memory_sink, sse_sink]
+    if settings.reminder_webhook_url:
+        reminder_sinks.append(WebhookSink(settings.reminder_webhook_url))
+
+configure_reminder_sinks()
+
+def _reminder_time(task: Task, due: datetime) -> datetime:
+    if task.remind_at is None:
+        return due - timedelta(minutes=settings.reminder_lead_minutes)
+    if task.recurrence is not None:
+        # 每次实例保持相同的提前量；按时间戳相减，截止时间和提醒时间可以一个带时区一个不带
+        lead = to_timestamp(task.due_date, store_zone) - to_timestamp(task.remind_at, store_zone)
+        return due - timedelta(seconds=lead)
+    return task.remind_at
+
+def check_reminder(task):
+    """提醒时间能否换算；在写入前调用，避免 _update_reminders 监听器中途失败导致其余监听器没有执行"""
+    if task.remind_at is None or task.due_date is None:
+        return
+    try:
+        to_timestamp(_reminder_time(task, task.due_date), store_zone)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("remind_at 无效")
+
+def check_reminder_or_400(task):
+    try:
+        check_reminder(task)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _reminder_event(task: Task, due: datetime, remind_at: datetime) -> dict:
+    return {
+        "event": "reminder",
+        "task_id": task.id,
+        "name": task.name,
+        "due_date": due.isoformat(),
+        "remind_at": remind_at.isoformat(),
+    }
+
+def next_reminder(task: Task, now: float):
+    """任务下一次需要发出的提醒，返回 (触发时间, 事件内容)；不需要提醒时返回 None"""
+    if task.completed or task.due_date is None:
+        return None
+    if task.recurrence is None:
+        if task.due_ts <= now:
+            return None  # 已经逾期的任务不再提醒
+        remind_at = _reminder_time(task, task.due_date)
+        return to_timestamp(remind_at, store_zone), _reminder_event(task, task.due_date, remind_at)
+
+    today = datetime.fromtimestamp(now, store_zone).date()
+    for day in series_dates(task, today, today + timedelta(days=REMINDER_HORIZON_DAYS)):
+        occurrence = build_occurrence(task, day)
+        if occurrence.id in tasks_db:
+            continue  # 已物化的实例有自己的提醒
+        remind_at = _reminder_time(task, occurrence.due_date)
+        remind_ts = to_timestamp(remind_at, store_zone)
+        if remind_ts > now:
+            return remind_ts, _reminder_event(occurrence, occurrence.due_date, remind_at)
+    return None
+
+def _update_reminders(old: Optional[Task], new: Optional[Task]):
+    reminder = next_reminder(new, reminder_engine.clock()) if new is not None else None
+    if reminder is None:
+        if old is not None:
+            reminder_engine.cancel(old.id)
+        return
+    reminder_engine.schedule(new.id, *reminder)
+
+def _reschedule_series(task_id: str):
+    task = tasks_db.get(task_id)
+    if task is not None and task.recurrence is not None:
+        _update_reminders(task, task)
+
+reminder_engine = ReminderEngine(
+    reminder_sinks,
+    on_fired=_reschedule_series,
+    on_delivery=lambda sink, ok: reminders_fired.inc(sink, "ok" if ok else "error"),
+)
+task_listeners.append(_update_reminders)
+
+@router.get("/reminders/stream")
+async def stream_reminders(request: Request):
+    """以 Server-Sent Events 推送提醒事件"""
+    queue = sse_sink.subscribe()
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"  # 心跳，防止代理断开空闲连接
+                    continue
+                yield f"event: reminder\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            sse_sink.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@router.get("/reminders/recent")
+async def get_recent_reminders():
+    """最近发出的提醒（本地调试用）"""
+    return {"pending": len(reminder_engine.queue), "events": list(memory_sink.events)}
+
+# ===== 实时推送 =====
+# 客户端连接 /tasks/live 后收到每次任务变更（JSON 文本消息）：
+#   {"type":"put","version":存储版本,"task":{...}}      新增或更新
+#   {"type":"delete","version":存储版本,"id":"..."}     删除
+#   {"type":"job","job_id":"...","status":"completed","task_ids":[...]}  AI 任务结束（规划生成的任务另有 put 消息）
+#   {"type":"resync"}                                  积压溢出，丢失了消息，应重新拉取 GET /tasks
+# 消息在写入时编码一次，所有连接共享；任务 JSON 复用 encode_task 的缓存。
+# 发布只追加到共享的消息环（live_queue_size 条），不随连接数增长，慢连接不会拖慢写入
+change_hub = ChangeHub(settings.live_queue_size)
+
+def _publish_task_change(old: Optional[Task], new: Optional[Task]):
+    if not len(change_hub):
+        return
+    if new is not None:
+        message = f'{{"type":"put","version":{store_version},"task":{encode_task(new).decode("utf-8")}}}'
+    else:
+        message = f'{{"type":"delete","version":{store_version},"id":{_dumps(old.id).decode("utf-8")}}}'
+    change_hub.publish(message)
+
+task_listeners.append(_publish_task_change)
+
+def publish_job(job: AIJob):
+    if not len(change_hub):
+        return
+    change_hub.publish(_dumps({
+        "type": "job",
+        "job_id": job.job_id,
+        "status": job.status.value,
+        "task_ids": [task.id for task in job.result or []],
+    }).decode("utf-8"))
+
+@router.websocket("/tasks/live")
+async def live_tasks(websocket: WebSocket):
+    """推送任务变更；客户端发送的消息被忽略"""
+    await websocket.accept()
+    subscription = change_hub.subscribe()
+
+    async def pump():
+        while True:
+            for message in await subscription.get():
+                await websocket.send_text(message)
+
+    sender = asyncio.create_task(pump())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        sender.cancel()
+        change_hub.unsubscribe(subscription)
+
+# ===== 监控指标 =====
+def _count_by_status(jobs) -> dict:
+    counts = {(status.value,): 0 for status in AIJobStatus}
+    for job in list(jobs):
+        counts[(job.status.value,)] += 1
+    return counts
+
+metrics_registry.gauge(
+    "todo_ai_jobs", "各状态的 AI 任务数（pending + processing 即队列深度）", ("status",),
+    collect=lambda: _count_by_status(ai_jobs_db.values()))
+metrics_registry.gauge(
+    "todo_import_jobs", "各状态的导入任务数", ("status",),
+    collect=lambda: _count_by_status(import_jobs_db.values()))
+metrics_registry.gauge(
+    "todo_store_size", "内存存储中的条目数", ("store",),
+    collect=lambda: {
+        ("tasks",): len(tasks_db),
+        ("ai_jobs",): len(ai_jobs_db),
+        ("import_jobs",): len(import_jobs_db),
+        ("calendar_days",): len(calendar_index),
+        ("task_json_cache",): len(_task_json_cache),
+        ("task_variant_cache",): len(_task_variant_cache),
+        ("today_views",): len(today_views),
+        ("work_queue",): len(work_queue),
+        ("reminders",): len(reminder_engine.queue),
+    })
+metrics_registry.gauge(
+    "todo_journal_pending_records", "已写入内存但尚未落盘的日志记录数",
+    collect=lambda: {(): journal.last_seq - journal.durable_seq} if journal is not None else {})
+metrics_registry.gauge(
+    "todo_live_connections", "实时推送连接数",
+    collect=lambda: {(): len(change_hub)})
+metrics_registry.gauge(
+    "todo_live_overflows", "实时推送连接积压溢出（要求重新拉取）的累计次数",
+    collect=lambda: {(): change_hub.overflows})
+metrics_registry.gauge(
+    "todo_store_version", "存储版本号（写入次数）",
+    collect=lambda: {(): store_version})
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus 文本格式的监控指标"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# ===== 调试 =====
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+
+@router.get("/debug/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """最近的请求剖析记录"""
+    return profile_store.summaries()
+
+@router.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str, format: str = "folded"):
+    """获取剖析结果；format=folded 返回折叠栈文本（flamegraph.pl / speedscope 可直接读取）"""
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="剖析记录不存在")
+    if format == "folded":
+        return PlainTextResponse(profile["stacks"])
+    return profile
+
+@router.post("/debug/snapshot", dependencies=[Depends(require_admin)])
+async def create_snapshot():
+    """立即写一次快照并清理已包含在快照中的日志分段"""
+    if journal is None:
+        raise HTTPException(status_code=400, detail="未启用持久化")
+    try:
+        count = await asyncio.to_thread(take_snapshot)
+    except JournalError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"tasks": count, "segment": journal.segment}
 
 # ===== 统计信息 =====
-@app.get("/stats")
-async def get_stats():
-    """获取任务统计信息"""
+@router.get("/stats")
+async def get_stats(zone=Depends(user_zone)):
+    """获取任务统计信息（今日到期/逾期按用户时区计算）"""
     all_tasks = list(tasks_db.values())
     completed = sum(1 for t in all_tasks if t.completed)
     
-    # 计算今日到期任务
-    today = date.today()
+    # 计算今日到期任务（重复任务模板不按自身日期计数，而是计入今天的实例）
+    today = clock.today(zone)
     due_today = sum(1 for t in all_tasks 
-                    if t.due_date and t.due_date.date() == today and not t.completed)
+                    if t.due_ts is not None and today.start <= t.due_ts < today.end
+                    and not t.completed and t.recurrence is None)
+    due_today += sum(1 for _, kind, _ in expand_occurrences(today.day, today.day, zone) if kind == "due")
     
-    # 计算逾期任务
+    # 计算逾期任务（重复任务过去未处理的实例视为错过，不计入逾期）
     overdue = sum(1 for t in all_tasks 
-                  if t.due_date and t.due_date.date() < today and not t.completed)
+                  if t.due_ts is not None and t.due_ts < today.start and not t.completed and t.recurrence is None)
 
     return {
         "total": len(all_tasks),
@@ -483,6 +2500,54 @@ async def get_stats():
         }
     }
 
+# ===== 应用工厂 =====
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.data_dir:
+        open_journal(settings.data_dir)
+        resume_ai_jobs()
+    reminder_engine.start()
+    today_roller = asyncio.create_task(roll_today_views())
+    yield
+    today_roller.cancel()
+    await reminder_engine.stop()
+    close_journal()
+
+def _record_compression(encoding: str, raw: int, wire: int):
+    http_compressed_bytes.inc(encoding, "raw", amount=raw)
+    http_compressed_bytes.inc(encoding, "wire", amount=wire)
+
+def create_app(app_settings: Optional[Settings] = None) -> FastAPI:
+    """组装 ASGI 应用；传入 app_settings 时先替换运行配置
+
+    启动时只做路由和中间件注册，AI 客户端等较重的资源在第一次使用时才初始化
+    """
+    if app_settings is not None:
+        configure(app_settings)
+    application = FastAPI(lifespan=lifespan)
+    # 配置跨域
+    application.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # 压缩在指标中间件内侧，压缩耗时计入请求耗时
+    application.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compress_min_bytes,
+        gzip_level=settings.gzip_level,
+        brotli_quality=settings.brotli_quality,
+        on_compress=_record_compression,
+    )
+    application.add_middleware(FormatMiddleware)
+    application.add_middleware(MetricsMiddleware, requests=http_requests, latency=http_latency)
+    application.add_middleware(ProfilingMiddleware, store=profile_store, is_enabled=_profiling_requested)
+    application.include_router(router)
+    return application
+
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
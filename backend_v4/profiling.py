@@ -0,0 +1,133 @@
+# profiling.py - 按需请求剖析：采样调用栈（折叠格式，可直接生成火焰图）+ Server-Timing 分段计时
+import contextvars
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional
+
+# 当前请求的分段计时；未开启剖析时为 None，span() 直接返回空上下文
+_current_spans: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("spans", default=None)
+
+_NOOP = nullcontext()  # 未开启剖析时 span() 只多一次 ContextVar.get
+
+@contextmanager
+def _timed(spans: Dict[str, float], name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans[name] = spans.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+def span(name: str):
+    """记录一段代码的耗时（毫秒），同名分段累加；只在剖析模式下生效"""
+    spans = _current_spans.get()
+    if spans is None:
+        return _NOOP
+    return _timed(spans, name)
+
+def server_timing(spans: Dict[str, float], total_ms: float) -> str:
+    parts = [f"{name};dur={duration:.2f}" for name, duration in spans.items()]
+    parts.append(f"total;dur={total_ms:.2f}")
+    return ", ".join(parts)
+
+class StackSampler:
+    """后台线程定时采样目标线程的调用栈
+
+    结果为折叠栈格式（"a;b;c 次数"），可直接交给 flamegraph.pl / speedscope
+    注意：事件循环线程上同时运行的其他请求也会被采到
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+class ProfileStore:
+    """保留最近若干次剖析结果"""
+
+    def __init__(self, limit: int = 20):
+        self.limit = limit
+        self.profiles: "OrderedDict[str, dict]" = OrderedDict()
+
+    def add(self, profile_id: str, profile: dict):
+        self.profiles[profile_id] = profile
+        while len(self.profiles) > self.limit:
+            self.profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        return self.profiles.get(profile_id)
+
+    def summaries(self) -> List[dict]:
+        return [{k: v for k, v in p.items() if k != "stacks"} for p in reversed(self.profiles.values())]
+
+class ProfilingMiddleware:
+    """纯 ASGI 中间件：is_enabled(scope) 为真时对该请求采样并附加 Server-Timing / X-Profile-Id 头"""
+
+    def __init__(self, app, store: ProfileStore, is_enabled: Callable[[dict], bool], interval: float = 0.001):
+        self.app = app
+        self.store = store
+        self.is_enabled = is_enabled
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.is_enabled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        spans: Dict[str, float] = {}
+        token = _current_spans.set(spans)
+        sampler = StackSampler(threading.get_ident(), self.interval).start()
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - start) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(spans, total_ms).encode()))
+                headers.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_spans.reset(token)
+            stacks = sampler.stop()
+            route = scope.get("route")
+            self.store.add(profile_id, {
+                "profile_id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", None),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                "spans_ms": {k: round(v, 3) for k, v in spans.items()},
+                "samples": sum(sampler.samples.values()),
+                "stacks": stacks,
+            })
@@ -0,0 +1,71 @@
+# recurrence.py - 重复规则的日期计算：直接跳到查询区间，只展开区间内的实例
+import calendar
+from datetime import date, timedelta
+from typing import Iterator, List, Optional
+
+FREQUENCIES = ("daily", "weekly", "monthly")
+
+def _add_months(anchor: date, months: int) -> date:
+    """anchor 之后 months 个月的同一天；该月没有这一天时取月末"""
+    month_index = anchor.month - 1 + months
+    year, month = anchor.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(anchor.day, calendar.monthrange(year, month)[1]))
+
+def _daily(anchor: date, interval: int, start: date) -> Iterator[tuple]:
+    k = max(0, -(-(start - anchor).days // interval))  # 向上取整
+    while True:
+        yield k, anchor + timedelta(days=k * interval)
+        k += 1
+
+def _weekly(anchor: date, interval: int, weekdays: List[int], start: date) -> Iterator[tuple]:
+    weekdays = sorted(set(weekdays))
+    anchor_week = anchor - timedelta(days=anchor.weekday())
+    first_week = [wd for wd in weekdays if wd >= anchor.weekday()]
+    # 跳到 start 所在周之前最近的一个周期
+    step = max(0, ((start - anchor_week).days // 7) // interval)
+    while True:
+        week_start = anchor_week + timedelta(weeks=step * interval)
+        for position, wd in enumerate(first_week if step == 0 else weekdays):
+            index = position if step == 0 else len(first_week) + (step - 1) * len(weekdays) + position
+            yield index, week_start + timedelta(days=wd)
+        step += 1
+
+def _monthly(anchor: date, interval: int, start: date) -> Iterator[tuple]:
+    months = (start.year - anchor.year) * 12 + start.month - anchor.month
+    k = max(0, months // interval)
+    while True:
+        yield k, _add_months(anchor, k * interval)
+        k += 1
+
+def occurrence_dates(freq: str, interval: int, anchor: date, start: date, end: date,
+                     weekdays: Optional[List[int]] = None, until: Optional[date] = None,
+                     count: Optional[int] = None, exdates=()) -> Iterator[date]:
+    """[start, end] 区间内的所有实例日期（按时间顺序）
+
+    anchor 为第一个实例的日期；count 限制总实例数（从 anchor 开始计），
+    exdates 中的日期被跳过（但仍计入 count）
+    """
+    interval = max(1, interval)
+    if until is not None and until < end:
+        end = until
+    start = max(start, anchor)
+    if end < start:
+        return
+
+    if freq == "daily":
+        candidates = _daily(anchor, interval, start)
+    elif freq == "weekly":
+        candidates = _weekly(anchor, interval, weekdays or [anchor.weekday()], start)
+    elif freq == "monthly":
+        candidates = _monthly(anchor, interval, start)
+    else:
+        raise ValueError(f"不支持的重复频率: {freq}")
+
+    try:
+        for index, day in candidates:
+            if day > end or (count is not None and index >= count):
+                return
+            if day >= start and day not in exdates:
+                yield day
+    except (OverflowError, ValueError):
+        return  # 下一个候选日期超出了 date 的取值范围
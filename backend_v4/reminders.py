@@ -0,0 +1,196 @@
+# reminders.py - 截止提醒：按提醒时间排序的最小堆（惰性删除），任务变更时 O(log n) 更新，
+# 到期事件分发给可插拔的 sink（内存、SSE、Webhook）
+import asyncio
+import heapq
+import itertools
+import json
+import threading
+import time
+import urllib.request
+from collections import deque
+from typing import Callable, Dict, List, Optional, Set
+
+class ReminderQueue:
+    """每个 key 最多一条待触发提醒
+
+    更新/取消只在字典中替换当前条目，堆里的旧条目在弹出时按序号识别并丢弃；
+    过期条目过多时整体重建，避免频繁修改的任务让堆无限增长
+    """
+
+    def __init__(self):
+        self._heap: List[tuple] = []  # (触发时间, 序号, key)
+        self._entries: Dict[str, tuple] = {}  # key -> (触发时间, 序号, 事件内容)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, key: str, fire_at: float, payload: dict) -> bool:
+        """添加或替换 key 的提醒，返回它是否成为最早的一条"""
+        with self._lock:
+            seq = next(self._seq)
+            self._entries[key] = (fire_at, seq, payload)
+            heapq.heappush(self._heap, (fire_at, seq, key))
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._heap = [(f, s, k) for k, (f, s, _) in self._entries.items()]
+                heapq.heapify(self._heap)
+            return self._heap[0][1] == seq
+
+    def cancel(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _drop_stale(self):
+        while self._heap:
+            fire_at, seq, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == seq:
+                return
+            heapq.heappop(self._heap)
+
+    def next_time(self) -> Optional[float]:
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[tuple]:
+        """取出所有触发时间不晚于 now 的提醒，返回 [(key, 触发时间, 事件内容)]"""
+        due = []
+        with self._lock:
+            self._drop_stale()
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, _, key = heapq.heappop(self._heap)
+                due.append((key, fire_at, self._entries.pop(key)[2]))
+                self._drop_stale()
+        return due
+
+# ===== Sink =====
+class MemorySink:
+    """保留最近的事件，用于本地调试和测试"""
+    name = "memory"
+
+    def __init__(self, limit: int = 100):
+        self.events = deque(maxlen=limit)
+
+    async def send(self, event: dict):
+        self.events.append(event)
+
+class SSESink:
+    """把事件广播给所有 SSE 订阅者；订阅者的队列满时丢弃该订阅者的新事件，不阻塞分发"""
+    name = "sse"
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    async def send(self, event: dict):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+class WebhookSink:
+    """把事件以 JSON POST 到指定 URL（在线程中发送，不阻塞事件循环）"""
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def _post(self, event: dict):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(event, ensure_ascii=False, default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    async def send(self, event: dict):
+        await asyncio.to_thread(self._post, event)
+
+# ===== 调度 =====
+class ReminderEngine:
+    """后台协程：睡到最早的提醒时间，把到期提醒分发给各 sink
+
+    schedule/cancel 可以在任意线程调用；插入更早的提醒时唤醒后台协程重新计算等待时间。
+    已触发过的 (key, 触发时间) 会被记住，任务的其他字段变化不会导致重复提醒
+    """
+
+    def __init__(self, sinks: list, clock: Callable[[], float] = time.time,
+                 on_fired: Optional[Callable[[str], None]] = None,
+                 on_delivery: Optional[Callable[[str, bool], None]] = None):
+        self.queue = ReminderQueue()
+        self.sinks = sinks
+        self.clock = clock
+        self.on_fired = on_fired  # 提醒触发后回调（例如为重复任务安排下一次）
+        self.on_delivery = on_delivery  # (sink 名称, 是否成功)
+        self._fired: Dict[str, float] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, key: str, fire_at: float, payload: dict):
+        if self._fired.get(key) == fire_at:
+            return
+        if self.queue.schedule(key, fire_at, payload):
+            self._notify()
+
+    def cancel(self, key: str):
+        self.queue.cancel(key)
+        self._fired.pop(key, None)
+
+    def _notify(self):
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def fire_due(self) -> int:
+        """分发所有已到期的提醒，返回分发的数量"""
+        due = self.queue.pop_due(self.clock())
+        for key, fire_at, payload in due:
+            self._fired[key] = fire_at
+            event = {**payload, "fired_at": self.clock()}
+            for sink in self.sinks:
+                try:
+                    await sink.send(event)
+                    ok = True
+                except Exception:
+                    ok = False
+                if self.on_delivery:
+                    self.on_delivery(sink.name, ok)
+            if self.on_fired:
+                self.on_fired(key)
+        return len(due)
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            await self.fire_due()
+            next_time = self.queue.next_time()
+            timeout = None if next_time is None else max(0.0, next_time - self.clock())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = self._loop = self._wake = None
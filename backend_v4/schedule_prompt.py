@@ -0,0 +1,132 @@
+# schedule_prompt.py - 时间规划提示词：估算 token、压缩任务信息、本地预分配明确的任务、超出预算时分块
+import json
+import math
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Tuple
+
+PERIODS = ("today", "tomorrow", "this_week", "later")
+PRIORITY_CODES = {"high": "h", "medium": "m", "low": "l"}
+
+SYSTEM_PROMPT = """你是一个任务时间规划助手。根据任务的优先级、截止日期和预计时长，合理安排任务的执行时间。
+
+当前时间：{now}
+今天：{today}
+明天：{tomorrow}
+本周结束：{week_end}
+今天已安排：{today_hours} 小时（已逾期和今天到期的任务）
+
+任务字段：i=编号，n=名称，p=优先级（h 高/m 中/l 低），d=截止时间（MM-DD HH:MM），h=预计小时数；没有的字段表示未设置
+
+将任务分配到以下时间段：
+- today: 今天应该完成的任务
+- tomorrow: 明天应该完成的任务
+- this_week: 本周内应该完成的任务
+- later: 之后再做的任务
+
+考虑因素：
+1. 高优先级任务优先安排
+2. 截止日期临近的任务优先
+3. 每天工作时间不超过{daily_hours}小时（包括今天已安排的部分）
+4. 考虑任务的预计时长，合理分配
+
+只返回JSON，值为任务编号列表：
+{{"today": ["t1"], "tomorrow": ["t2"], "this_week": ["t3"], "later": ["t4"]}}"""
+
+class SchedulePrompt(NamedTuple):
+    messages: List[dict]
+    max_tokens: int
+    ids: Dict[str, str]  # 短编号 -> 任务 ID
+    prompt_tokens: int  # 估算值
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 个字符 1 个 token，其他字符约 4 个字符 1 个 token"""
+    wide = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return wide + math.ceil((len(text) - wide) / 4)
+
+def compact_task(short_id: str, task, zone) -> dict:
+    """只保留规划需要的字段，并去掉空值"""
+    info = {"i": short_id, "n": task.name}
+    priority = PRIORITY_CODES.get(task.priority)
+    if priority and priority != "m":
+        info["p"] = priority
+    if task.due_ts is not None:
+        info["d"] = datetime.fromtimestamp(task.due_ts, zone).strftime("%m-%d %H:%M")
+    if task.estimated_hours:
+        hours = task.estimated_hours
+        info["h"] = int(hours) if float(hours).is_integer() else hours
+    return info
+
+def prebucket(tasks: list, today_end: float) -> Tuple[List, List]:
+    """已逾期或今天到期的任务一定放在今天，无需交给模型；返回 (今天的任务, 需要模型规划的任务)"""
+    today, ambiguous = [], []
+    for task in tasks:
+        (today if task.due_ts is not None and task.due_ts < today_end else ambiguous).append(task)
+    return today, ambiguous
+
+def build_prompts(tasks: list, now: datetime, zone, fixed_today_hours: float, daily_hours: float,
+                  budget_tokens: int, max_chunks: int) -> Tuple[List[SchedulePrompt], List]:
+    """把任务按顺序分块成若干个不超过 budget_tokens 的提示词
+
+    tasks 应按重要性排好序：超过 max_chunks 的部分不发给模型，返回给调用方按规则处理。
+    返回 (提示词列表, 未发送的任务)
+    """
+    today = now.date()
+    system = SYSTEM_PROMPT.format(
+        now=now.strftime("%Y-%m-%d %H:%M"),
+        today=today,
+        tomorrow=today.fromordinal(today.toordinal() + 1),
+        week_end=today.fromordinal(today.toordinal() + 7),
+        today_hours=round(fixed_today_hours, 1),
+        daily_hours=daily_hours,
+    )
+    header = "请为以下任务安排执行时间：\n"
+    base_tokens = estimate_tokens(system) + estimate_tokens(header) + 2
+
+    prompts: List[SchedulePrompt] = []
+    lines: List[str] = []
+    ids: Dict[str, str] = {}
+    used = base_tokens
+
+    def flush():
+        content = header + "[" + ",".join(lines) + "]"
+        prompts.append(SchedulePrompt(
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": content}],
+            # 回复只包含编号：每个编号连同引号和逗号约 4 个 token
+            max_tokens=32 + 4 * len(lines),
+            ids=dict(ids),
+            prompt_tokens=used,
+        ))
+
+    for index, task in enumerate(tasks):
+        short_id = f"t{len(ids) + 1}"
+        line = json.dumps(compact_task(short_id, task, zone), ensure_ascii=False, separators=(",", ":"))
+        cost = estimate_tokens(line) + 1
+        if lines and used + cost > budget_tokens:
+            flush()
+            lines, ids, used = [], {}, base_tokens
+            if len(prompts) >= max_chunks:
+                return prompts, tasks[index:]
+            short_id = "t1"
+            line = json.dumps(compact_task(short_id, task, zone), ensure_ascii=False, separators=(",", ":"))
+        lines.append(line)
+        ids[short_id] = task.id
+        used += cost
+    if lines:
+        flush()
+    return prompts, []
+
+def parse_schedule(content: str, ids: Dict[str, str]) -> Dict[str, List[str]]:
+    """解析模型回复并把短编号映射回任务 ID；未知编号和重复出现的编号被忽略"""
+    start, end = content.find("{"), content.rfind("}") + 1
+    schedule = json.loads(content[start:end] if start != -1 and end > start else content)
+    result: Dict[str, List[str]] = {period: [] for period in PERIODS}
+    seen = set()
+    for period, short_ids in schedule.items():
+        if period not in result or not isinstance(short_ids, list):
+            continue
+        for short_id in short_ids:
+            task_id = ids.get(short_id) if isinstance(short_id, str) else None
+            if task_id is not None and task_id not in seen:
+                seen.add(task_id)
+                result[period].append(task_id)
+    return result
@@ -0,0 +1,22 @@
+# test_calendar.py - 月历接口在 date 取值范围两端不出错：年份越界返回 400，边界月份正常返回
+from fastapi.testclient import TestClient
+
+import main
+
+def test_month_at_date_bounds():
+    client = TestClient(main.app)
+    client.post("/tasks", json={"name": "远期重复", "scheduled_date": "9999-12-20",
+                                "recurrence": {"freq": "daily", "interval": 3}})
+    for zone in (None, "Asia/Tokyo", "America/Los_Angeles"):
+        headers = {"X-Timezone": zone} if zone else {}
+        for path in ("/tasks/calendar/9999/12", "/tasks/calendar/1/1",
+                     "/tasks/calendar?start=9999-12-01&end=9999-12-31"):
+            response = client.get(path, headers=headers)
+            assert response.status_code == 200, (path, zone, response.text)
+        assert "9999-12-26" in client.get("/tasks/calendar/9999/12", headers=headers).json()
+    for year in (0, 10000):
+        assert client.get(f"/tasks/calendar/{year}/1").status_code == 400
+
+if __name__ == "__main__":
+    test_month_at_date_bounds()
+    print("✓ 日历测试通过")
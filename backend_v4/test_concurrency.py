@@ -0,0 +1,100 @@
+# test_concurrency.py - 并发写入压力测试：验证 If-Match 乐观并发控制不会丢失更新
+import threading
+
+from fastapi.testclient import TestClient
+
+import main
+
+WRITERS = 8
+INCREMENTS = 25
+
+def _increment(task_id, stats):
+    """读取-修改-写入循环，版本冲突（412）时重试"""
+    client = TestClient(main.app)
+    done = 0
+    while done < INCREMENTS:
+        task = client.get(f"/tasks/{task_id}")
+        hours = task.json()["estimated_hours"]
+        response = client.put(
+            f"/tasks/{task_id}",
+            json={"estimated_hours": hours + 1},
+            headers={"If-Match": task.headers["ETag"]},
+        )
+        if response.status_code == 412:
+            stats["conflicts"] += 1
+            continue
+        assert response.status_code == 200, response.text
+        done += 1
+
+def _read_loop(stop, errors):
+    """并发读取列表、导出和日历，读取不应因写入而出错"""
+    client = TestClient(main.app)
+    while not stop.is_set():
+        for path in ("/tasks", "/tasks/export", "/tasks/calendar?start=2026-01-01&end=2026-12-31"):
+            response = client.get(path)
+            if response.status_code != 200:
+                errors.append(f"{path}: {response.status_code}")
+
+def test_concurrent_writers_no_lost_updates():
+    client = TestClient(main.app)
+    task = client.post("/tasks", json={
+        "name": "并发计数",
+        "estimated_hours": 0,
+        "due_date": "2026-06-01T10:00:00",
+    }).json()
+
+    stats = {"conflicts": 0}
+    errors = []
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_loop, args=(stop, errors))
+    reader.start()
+    writers = [threading.Thread(target=_increment, args=(task["id"], stats)) for _ in range(WRITERS)]
+    for t in writers:
+        t.start()
+    for t in writers:
+        t.join()
+    stop.set()
+    reader.join()
+
+    final = client.get(f"/tasks/{task['id']}").json()
+    assert final["estimated_hours"] == WRITERS * INCREMENTS
+    assert final["version"] == 1 + WRITERS * INCREMENTS
+    assert not errors, errors
+
+def test_stale_version_rejected():
+    client = TestClient(main.app)
+    task = client.post("/tasks", json={"name": "旧版本"}).json()
+
+    response = client.put(f"/tasks/{task['id']}", json={"name": "新名称"}, headers={"If-Match": '"1"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"2"'
+
+    # 使用旧版本号的更新和删除都应被拒绝
+    response = client.put(f"/tasks/{task['id']}", json={"name": "覆盖"}, headers={"If-Match": '"1"'})
+    assert response.status_code == 412
+    response = client.delete(f"/tasks/{task['id']}", headers={"If-Match": '"1"'})
+    assert response.status_code == 412
+    assert client.get(f"/tasks/{task['id']}").json()["name"] == "新名称"
+
+def test_stale_version_rejected_for_occurrences():
+    client = TestClient(main.app)
+    series = client.post("/tasks", json={"name": "每周例会", "due_date": "2026-04-06T10:00:00",
+                                         "recurrence": {"freq": "weekly"}}).json()
+    occurrence_id = f"{series['id']}@2026-04-13"
+    etag = client.get(f"/tasks/{occurrence_id}").headers["ETag"]
+
+    # 模板修改后，虚拟实例的 ETag 随之变化，旧 ETag 的删除被拒绝
+    assert client.put(f"/tasks/{series['id']}", json={"name": "每周例会（改）"}).status_code == 200
+    response = client.delete(f"/tasks/{occurrence_id}", headers={"If-Match": etag})
+    assert response.status_code == 412
+    assert client.get(f"/tasks/{occurrence_id}").status_code == 200
+
+    etag = client.get(f"/tasks/{occurrence_id}").headers["ETag"]
+    assert client.delete(f"/tasks/{occurrence_id}", headers={"If-Match": etag}).status_code == 200
+    assert client.get(f"/tasks/{occurrence_id}").status_code == 404
+
+if __name__ == "__main__":
+    test_concurrent_writers_no_lost_updates()
+    test_stale_version_rejected()
+    test_stale_version_rejected_for_occurrences()
+    print("✓ 并发测试通过")
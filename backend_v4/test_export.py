@@ -0,0 +1,29 @@
+# test_export.py - 导出过滤的回归测试：截止时间带时区与不带时区的任务混在一起时按时间戳比较
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+
+def _export_names(client, query: str):
+    response = client.get(f"/tasks/export?{query}")
+    assert response.status_code == 200, response.text
+    return {json.loads(line)["name"] for line in response.text.splitlines()}
+
+def test_due_filters_mix_naive_and_aware():
+    client = TestClient(main.app)
+    tag = "export-due-filter"
+    # AI 规划生成的截止时间带 +00:00，手动创建的通常不带时区
+    for name, due in (("naive-early", "2025-12-31T08:00:00"), ("naive-late", "2026-03-01T08:00:00"),
+                      ("aware-early", "2025-12-30T08:00:00+00:00"), ("aware-late", "2026-02-01T08:00:00+00:00")):
+        assert client.post("/tasks", json={"name": name, "due_date": due, "tags": [tag]}).status_code == 200
+    client.post("/tasks", json={"name": "no-due", "tags": [tag]})
+
+    after = _export_names(client, f"tag={tag}&due_after=2026-01-01T00:00:00Z")
+    assert after == {"naive-late", "aware-late"}
+    before = _export_names(client, f"tag={tag}&due_before=2026-01-01T00:00:00")
+    assert before == {"naive-early", "aware-early"}
+
+if __name__ == "__main__":
+    test_due_filters_mix_naive_and_aware()
+    print("✓ 导出测试通过")
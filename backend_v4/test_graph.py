@@ -0,0 +1,91 @@
+# test_graph.py - 增量拓扑排序：随机增删依赖后，环的判断、拓扑序号和关键路径应与全量重新计算的结果一致
+import random
+
+import pytest
+
+from graph import CycleError, DependencyGraph
+
+def _reaches(edges, start, target) -> bool:
+    """全量 DFS：start 能否沿依赖边到达 target"""
+    stack, seen = [start], {start}
+    while stack:
+        n = stack.pop()
+        if n == target:
+            return True
+        for u, v in edges:
+            if u == n and v not in seen:
+                seen.add(v)
+                stack.append(v)
+    return False
+
+def _longest_tails(nodes, edges, weight):
+    tails = {}
+
+    def tail(n):
+        if n not in tails:
+            tails[n] = weight(n) + max((tail(v) for u, v in edges if u == n), default=0.0)
+        return tails[n]
+    return {n: tail(n) for n in nodes}
+
+def test_matches_full_recompute():
+    rng = random.Random(36)
+    for _ in range(100):
+        graph = DependencyGraph()
+        nodes = [f"t{i}" for i in range(rng.randint(2, 15))]
+        for n in nodes:
+            graph.add_node(n)
+        deps = {n: set() for n in nodes}
+        for _ in range(60):
+            if rng.random() < 0.1:
+                # 删除任务后重新加入（新的序号排在最后）
+                node = rng.choice(nodes)
+                graph.remove_node(node)
+                deps[node] = set()
+                for other in deps.values():
+                    other.discard(node)
+                graph.add_node(node)
+                continue
+            node = rng.choice(nodes)
+            new_deps = set(rng.sample(nodes, rng.randint(0, min(3, len(nodes)))))
+            edges = {(d, n) for n, ds in deps.items() if n != node for d in ds}
+            cycle = any(d == node or _reaches(edges, node, d) for d in new_deps)
+            before = dict(graph.ord)
+            if cycle:
+                with pytest.raises(CycleError):
+                    graph.set_dependencies(node, new_deps)
+                assert graph.pred[node] == deps[node]
+            else:
+                graph.set_dependencies(node, new_deps)
+                deps[node] = new_deps
+
+            edges = {(d, n) for n, ds in deps.items() for d in ds}
+            assert {(d, n) for n in nodes for d in graph.pred[n]} == edges
+            assert {(n, s) for n in nodes for s in graph.succ[n]} == edges
+            assert len(set(graph.ord.values())) == len(nodes)
+            assert all(graph.ord[u] < graph.ord[v] for u, v in edges), (before, graph.ord, edges)
+
+        edges = {(d, n) for n, ds in deps.items() for d in ds}
+        weight = lambda n: float(int(n[1:]) % 4 + 1)
+        subset = set(rng.sample(nodes, rng.randint(1, len(nodes))))
+        sub_edges = {(u, v) for u, v in edges if u in subset and v in subset}
+        assert graph.longest_tails(subset, weight) == _longest_tails(subset, sub_edges, weight)
+        path = graph.critical_path(subset, weight)
+        assert all((u, v) in sub_edges for u, v in zip(path, path[1:]))
+        assert sum(map(weight, path)) == max(_longest_tails(subset, sub_edges, weight).values())
+
+def test_cycle_rejected_without_changes():
+    graph = DependencyGraph()
+    graph.set_dependencies("b", ["a"])
+    graph.set_dependencies("c", ["b"])
+    ord_before = dict(graph.ord)
+    with pytest.raises(CycleError):
+        graph.set_dependencies("a", ["c"])
+    with pytest.raises(CycleError):
+        graph.set_dependencies("a", ["a"])
+    assert graph.ord == ord_before
+    assert graph.pred["a"] == set()
+
+if __name__ == "__main__":
+    test_matches_full_recompute()
+    test_cycle_rejected_without_changes()
+    print("✓ 依赖图测试通过")
@@ -0,0 +1,58 @@
+# test_import.py - 批量导入：逐行校验，无效的行（包括无效的 UTF-8 和 JSON）只记为该行的错误，其余行照常导入
+from fastapi.testclient import TestClient
+
+import main
+
+def _import(client, fmt: str, payload: bytes) -> dict:
+    job_id = client.post(f"/tasks/import?format={fmt}", content=payload).json()["job_id"]
+    for _ in range(1000):
+        job = client.get(f"/tasks/import/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            return job
+    raise AssertionError("导入未完成")
+
+def _names(tag: str):
+    return sorted(task.name for task in main.tasks_db.values() if tag in task.tags)
+
+def test_ndjson_row_errors():
+    payload = b"\n".join([
+        b'{"name": "n1", "tags": ["import-ndjson"]}',
+        b'{"name": "bad \xff utf8", "tags": ["import-ndjson"]}',
+        b'',
+        b'{"name": "n2", "priority": "urgent", "tags": ["import-ndjson"]}',
+        b'{"name": "n3", "parent_id": "missing", "tags": ["import-ndjson"]}',
+        b'{not json',
+        b'{"name": "n4", "tags": ["import-ndjson"]}',
+    ])
+    with TestClient(main.app) as client:
+        job = _import(client, "ndjson", payload)
+    assert job["status"] == "completed", job
+    assert (job["total_rows"], job["imported"], job["failed"]) == (6, 2, 4)
+    assert [error["row"] for error in job["errors"]] == [2, 3, 4, 5]
+    assert "父任务不存在" in job["errors"][2]["error"]
+    assert _names("import-ndjson") == ["n1", "n4"]
+
+def test_csv_row_errors():
+    payload = "\n".join([
+        "name,description,tags,recurrence,scheduled_date",
+        'c1,"两行\n描述",import-csv,,',
+        'c2,,import-csv,{"freq": "daily",2026-01-01',
+        "c3 \udcff,,import-csv,,",
+        'c4,,import-csv,"{""freq"": ""weekly""}",2026-01-05',
+        "c5,,import-csv,,",
+    ]).encode("utf-8", "surrogateescape")
+    with TestClient(main.app) as client:
+        job = _import(client, "csv", payload)
+    assert job["status"] == "completed", job
+    assert (job["total_rows"], job["imported"], job["failed"]) == (5, 3, 2)
+    assert [error["row"] for error in job["errors"]] == [2, 3]
+    assert "recurrence" in job["errors"][0]["error"]
+    assert "utf-8" in job["errors"][1]["error"]
+    assert _names("import-csv") == ["c1", "c4", "c5"]
+    c1 = next(task for task in main.tasks_db.values() if task.name == "c1")
+    assert c1.description == "两行\n描述"
+
+if __name__ == "__main__":
+    test_ndjson_row_errors()
+    test_csv_row_errors()
+    print("✓ 导入测试通过")
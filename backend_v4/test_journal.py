@@ -0,0 +1,206 @@
+# test_journal.py - 日志崩溃恢复测试：截断的尾部记录、快照与分段的交接、残留旧分段的清理、无法解析的记录、写入失败
+import asyncio
+import errno
+import json
+import os
+import shutil
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from journal import Journal, JournalError
+
+def _open(directory) -> tuple:
+    """模拟一次启动：回放后开始写入新分段，返回 (日志, 回放得到的状态)"""
+    journal = Journal(str(directory), sync="always")
+    state = journal.recover()
+    journal.open()
+    return journal, state
+
+def _segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith("journal-"))
+
+def test_replay_puts_and_deletes(tmp_path):
+    journal, state = _open(tmp_path)
+    assert state == {}
+    journal.append_put("a", b"1")
+    journal.append_put("b", b"2")
+    journal.append_put("a", b"3")
+    journal.append_delete("b")
+    journal.close()
+
+    journal, state = _open(tmp_path)
+    journal.close()
+    assert state == {"a": b"3"}
+
+def test_torn_tail_record_is_dropped(tmp_path):
+    journal, _ = _open(tmp_path)
+    journal.append_put("a", b"1")
+    journal.append_put("b", b"2" * 100)
+    journal.close()
+
+    # 模拟写最后一条记录时崩溃：截掉它的末尾几个字节
+    path = os.path.join(tmp_path, _segment_files(tmp_path)[-1])
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 7)
+
+    journal, state = _open(tmp_path)
+    assert state == {"a": b"1"}
+    # 恢复后继续写入新分段，再次回放时截断的分段不影响之后的记录
+    journal.append_put("c", b"3")
+    journal.close()
+    journal, state = _open(tmp_path)
+    journal.close()
+    assert state == {"a": b"1", "c": b"3"}
+
+def test_corrupted_tail_record_is_dropped(tmp_path):
+    journal, _ = _open(tmp_path)
+    journal.append_put("a", b"1")
+    journal.append_put("b", b"2")
+    journal.close()
+
+    # 长度完整但内容损坏：CRC 校验失败，只丢弃这一条
+    path = os.path.join(tmp_path, _segment_files(tmp_path)[-1])
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    journal, state = _open(tmp_path)
+    journal.close()
+    assert state == {"a": b"1"}
+
+def test_snapshot_mid_stream(tmp_path):
+    journal, _ = _open(tmp_path)
+    for i in range(10):
+        journal.append_put(f"k{i}", str(i).encode())
+    journal.append_delete("k0")
+
+    # 与 take_snapshot 相同的顺序：确定快照内容并切换分段，之后的写入进入新分段
+    expected_at_snapshot = {f"k{i}": str(i).encode() for i in range(1, 10)}
+    first_segment = journal.rotate()
+    journal.append_put("k1", b"after")
+    journal.append_delete("k2")
+    journal.append_put("k10", b"10")
+    journal.write_snapshot(first_segment, sorted(expected_at_snapshot.items()))
+    journal.close()
+
+    # 快照之前的分段已经删除
+    assert all(int(name[len("journal-"):-len(".log")]) >= first_segment for name in _segment_files(tmp_path))
+
+    journal, state = _open(tmp_path)
+    journal.close()
+    expected = dict(expected_at_snapshot)
+    expected["k1"] = b"after"
+    del expected["k2"]
+    expected["k10"] = b"10"
+    assert state == expected
+
+def test_stale_segment_before_snapshot_is_removed(tmp_path):
+    journal, _ = _open(tmp_path)
+    journal.append_put("a", b"old")
+    journal.close()
+    old_segment = _segment_files(tmp_path)[-1]
+    shutil.copy(os.path.join(tmp_path, old_segment), os.path.join(tmp_path, "stale.bak"))
+
+    journal, _ = _open(tmp_path)
+    first_segment = journal.rotate()
+    journal.write_snapshot(first_segment, [("a", b"new")])
+    journal.close()
+    assert old_segment not in _segment_files(tmp_path)
+
+    # 模拟写完快照、删除旧分段之前崩溃：旧分段仍在，回放时应被忽略并删除
+    os.replace(os.path.join(tmp_path, "stale.bak"), os.path.join(tmp_path, old_segment))
+    journal, state = _open(tmp_path)
+    journal.close()
+    assert state == {"a": b"new"}
+    assert old_segment not in _segment_files(tmp_path)
+
+def test_bad_records_are_quarantined(tmp_path):
+    journal, _ = _open(tmp_path)
+    journal.append_put("good", b'{"id": "good", "name": "ok"}')
+    journal.append_put("bad", b'{"id": "bad", "name": null}')
+    journal.append_put(main.JOB_KEY_PREFIX + "j1", b'{"job_id": "j1"}')
+    journal.close()
+
+    # 坏记录不阻止启动：其余记录照常恢复，坏记录写入隔离文件
+    restored = main.open_journal(str(tmp_path))
+    try:
+        assert restored == 1
+        assert main.tasks_db["good"].name == "ok"
+        assert "bad" not in main.tasks_db and "j1" not in main.ai_jobs_db
+    finally:
+        main.close_journal()
+        main.remove_task("good")
+    with open(os.path.join(tmp_path, main.QUARANTINE_FILE), encoding="utf-8") as f:
+        assert [json.loads(line)["key"] for line in f] == ["bad", main.JOB_KEY_PREFIX + "j1"]
+
+class _FullDisk:
+    """模拟磁盘已满：写入抛出 ENOSPC"""
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+def test_write_failure_fails_waiters(tmp_path):
+    journal, _ = _open(tmp_path)
+    journal.append_put("a", b"1")
+
+    async def run():
+        await journal.durable()
+        journal._file = _FullDisk(journal._file)
+        journal.append_put("b", b"2")
+        # 等待中的和之后的调用都立即得到错误，而不是一直挂起
+        with pytest.raises(JournalError):
+            await asyncio.wait_for(journal.durable(), 2)
+        journal.append_put("c", b"3")
+        with pytest.raises(JournalError):
+            await asyncio.wait_for(journal.durable(), 2)
+
+    asyncio.run(run())
+    assert journal._pending == []
+    with pytest.raises(JournalError):
+        journal.check()
+    journal._file = journal._file.file
+    journal.close()
+    journal, state = _open(tmp_path)
+    journal.close()
+    assert state == {"a": b"1"}
+
+def test_write_failure_returns_503(tmp_path):
+    main.open_journal(str(tmp_path))
+    try:
+        with TestClient(main.app) as client:
+            assert client.post("/tasks", json={"name": "写入前"}).status_code == 200
+            main.journal._file = _FullDisk(main.journal._file)
+            client.post("/tasks", json={"name": "写入失败"})
+            for _ in range(200):
+                if main.journal.error is not None:
+                    break
+                time.sleep(0.01)
+            response = client.post("/tasks", json={"name": "写入失败之后"})
+            assert response.status_code == 503, response.text
+            assert client.get("/tasks").status_code == 200  # 读取不受影响
+            main.journal._file = main.journal._file.file
+    finally:
+        main.close_journal()
+        for task in [task for task in main.tasks_db.values() if task.name.startswith("写入")]:
+            main.remove_task(task.id)
+
+if __name__ == "__main__":
+    import tempfile
+    for test in (test_replay_puts_and_deletes, test_torn_tail_record_is_dropped, test_corrupted_tail_record_is_dropped,
+                 test_snapshot_mid_stream, test_stale_segment_before_snapshot_is_removed,
+                 test_bad_records_are_quarantined, test_write_failure_fails_waiters,
+                 test_write_failure_returns_503):
+        with tempfile.TemporaryDirectory() as directory:
+            test(directory)
+    print("✓ 日志恢复测试通过")
@@ -0,0 +1,129 @@
+# test_llm_guard.py - LLM 调用保护：熔断器的状态转换，对冲、失败转移和截止时间（用假 LLM 注入延迟、错误和挂起）
+import asyncio
+
+from fake_llm import FakeLLMClient, FakeLLMConfig
+from llm_guard import Attempt, CircuitBreaker, CircuitOpenError, DeadlineExceeded, hedged_call
+
+MESSAGES = [{"role": "system", "content": "任务分解"}, {"role": "user", "content": "任务名称：写报告"}]
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def _attempt(name: str, breaker: CircuitBreaker = None, **config) -> Attempt:
+    client = FakeLLMClient(FakeLLMConfig(seed=43, **config))
+    return Attempt(name, lambda: client.create(model="fake", messages=MESSAGES), breaker or CircuitBreaker())
+
+async def _call(attempts, deadline, hedge_after, settle):
+    loop = asyncio.get_running_loop()
+    begin = loop.time()
+    try:
+        _, path = await hedged_call(attempts, deadline, hedge_after)
+    except Exception as e:
+        path = type(e)
+    elapsed = loop.time() - begin
+    await asyncio.sleep(settle)  # 事件循环继续运行，让被放弃的请求完成并登记结果
+    return path, elapsed
+
+def _run(attempts, deadline=2.0, hedge_after=None, settle=0.0):
+    """返回 (结果端点名称或异常类型, hedged_call 的耗时)"""
+    return asyncio.run(_call(attempts, deadline, hedge_after, settle))
+
+def test_breaker_state_transitions():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_after=10, clock=clock)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    # 半开：只放行一次试探请求，失败后重新熔断并重新计时
+    clock.now = 10
+    assert breaker.state == "half_open"
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now = 19.9
+    assert not breaker.allow()
+
+    # 试探成功后恢复，失败计数清零
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+def test_hedge_wins_over_slow_primary():
+    primary = _attempt("primary", latency=0.5)
+    secondary = _attempt("secondary", latency=0.01)
+    path, elapsed = _run([primary, secondary], hedge_after=0.05)
+    assert path == "secondary"
+    assert elapsed < 0.3
+
+def test_no_hedge_before_threshold():
+    primary = _attempt("primary", latency=0.05)
+    secondary = _attempt("secondary")
+    path, _ = _run([primary, secondary], hedge_after=1.0)
+    assert path == "primary"
+    assert secondary.breaker.state == "closed"
+
+def test_failover_on_error_without_waiting_for_hedge():
+    primary = _attempt("primary", error_rate=1.0)
+    secondary = _attempt("secondary")
+    path, elapsed = _run([primary, secondary], hedge_after=5.0)
+    assert path == "secondary"
+    assert elapsed < 1.0
+    assert primary.breaker.failures == 1
+
+def test_last_error_raised_when_all_fail():
+    attempts = [_attempt("primary", error_rate=1.0), _attempt("secondary", error_rate=1.0)]
+    path, _ = _run(attempts)
+    assert path.__name__ == "FakeLLMError"
+
+def test_deadline_exceeded_counts_as_failure():
+    attempts = [_attempt("primary", hang_rate=1.0, hang_seconds=0.3),
+                _attempt("secondary", hang_rate=1.0, hang_seconds=0.3)]
+    path, elapsed = _run(attempts, deadline=0.1, hedge_after=0.02)
+    assert path is DeadlineExceeded
+    assert elapsed < 0.25  # 截止时间到了就返回，不等线程中的调用结束
+    assert all(attempt.breaker.failures == 1 for attempt in attempts)
+
+def test_open_breakers_are_skipped():
+    clock = FakeClock()
+    open_breaker = CircuitBreaker(failure_threshold=1, reset_after=10, clock=clock)
+    open_breaker.record_failure()
+    primary = _attempt("primary", open_breaker)
+    path, _ = _run([primary, _attempt("secondary")])
+    assert path == "secondary"
+    assert primary.breaker.state == "open"
+
+    other = CircuitBreaker(failure_threshold=1, reset_after=10, clock=clock)
+    other.record_failure()
+    path, _ = _run([primary, _attempt("secondary", other)])
+    assert path is CircuitOpenError
+
+def test_half_open_trial_resolved_after_hedge_wins():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_after=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    primary = _attempt("primary", breaker, latency=0.2)
+    path, _ = _run([primary, _attempt("secondary")], hedge_after=0.02, settle=0.4)
+    assert path == "secondary"
+    # 试探请求在对冲胜出后才完成，仍然要有结论，否则端点会一直停在半开状态
+    assert breaker.state == "closed"
+
+if __name__ == "__main__":
+    for test in (test_breaker_state_transitions, test_hedge_wins_over_slow_primary, test_no_hedge_before_threshold,
+                 test_failover_on_error_without_waiting_for_hedge, test_last_error_raised_when_all_fail,
+                 test_deadline_exceeded_counts_as_failure, test_open_breakers_are_skipped,
+                 test_half_open_trial_resolved_after_hedge_wins):
+        test()
+    print("✓ LLM 调用保护测试通过")
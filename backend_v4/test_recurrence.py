@@ -0,0 +1,78 @@
+# test_recurrence.py - 重复规则的日期计算：跳转到查询区间的结果应与从首次日期逐个展开的结果一致
+import calendar
+import random
+from datetime import date, timedelta
+
+from recurrence import occurrence_dates
+
+def _naive_dates(freq, interval, anchor, weekdays, last):
+    """从 anchor 开始逐个展开到 last（含），不做任何跳转"""
+    if freq == "daily":
+        day = anchor
+        while day <= last:
+            yield day
+            day += timedelta(days=interval)
+    elif freq == "weekly":
+        weekdays = set(weekdays or [anchor.weekday()])
+        anchor_week = anchor - timedelta(days=anchor.weekday())
+        day = anchor
+        while day <= last:
+            if ((day - anchor_week).days // 7) % interval == 0 and day.weekday() in weekdays:
+                yield day
+            day += timedelta(days=1)
+    else:
+        year, month = anchor.year, anchor.month
+        while True:
+            day = date(year, month, min(anchor.day, calendar.monthrange(year, month)[1]))
+            if day > last:
+                return
+            yield day
+            month += interval
+            year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+
+def _expected(freq, interval, anchor, start, end, weekdays=None, until=None, count=None, exdates=()):
+    last = min(end, until) if until is not None else end
+    result = []
+    for index, day in enumerate(_naive_dates(freq, interval, anchor, weekdays, last)):
+        if count is not None and index >= count:
+            break
+        if day >= start and day not in exdates:  # exdates 跳过但仍计入 count
+            result.append(day)
+    return result
+
+def test_matches_naive_expansion():
+    rng = random.Random(37)
+    for _ in range(3000):
+        freq = rng.choice(("daily", "weekly", "monthly"))
+        interval = rng.randint(1, 4)
+        anchor = date(2024, 1, 1) + timedelta(days=rng.randint(0, 800))
+        if freq == "monthly" and rng.random() < 0.3:
+            anchor = anchor.replace(day=calendar.monthrange(anchor.year, anchor.month)[1])  # 月末，检验取月末
+        weekdays = rng.sample(range(7), rng.randint(1, 4)) if freq == "weekly" and rng.random() < 0.7 else None
+        start = anchor + timedelta(days=rng.randint(-60, 500))
+        end = start + timedelta(days=rng.randint(0, 120))
+        until = anchor + timedelta(days=rng.randint(0, 600)) if rng.random() < 0.3 else None
+        count = rng.randint(1, 40) if rng.random() < 0.5 else None
+        candidates = list(_naive_dates(freq, interval, anchor, weekdays, end))
+        exdates = set(rng.sample(candidates, min(len(candidates), rng.randint(0, 5))))
+
+        got = list(occurrence_dates(freq, interval, anchor, start, end, weekdays=weekdays, until=until,
+                                    count=count, exdates=exdates))
+        expected = _expected(freq, interval, anchor, start, end, weekdays, until, count, exdates)
+        assert got == expected, (freq, interval, anchor, start, end, weekdays, until, count, sorted(exdates))
+
+def test_monthly_end_of_month_clamps():
+    got = list(occurrence_dates("monthly", 1, date(2025, 1, 31), date(2025, 1, 1), date(2025, 5, 31)))
+    assert got == [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31), date(2025, 4, 30), date(2025, 5, 31)]
+
+def test_weekly_count_counts_from_anchor():
+    # 每两周的周一、周三，从周三开始：第一周只有周三；count=4 时最后一个实例是第三个周期的周一
+    got = list(occurrence_dates("weekly", 2, date(2025, 1, 1), date(2025, 1, 1), date(2025, 3, 1),
+                                weekdays=[0, 2], count=4, exdates={date(2025, 1, 13)}))
+    assert got == [date(2025, 1, 1), date(2025, 1, 15), date(2025, 1, 27)]
+
+if __name__ == "__main__":
+    test_matches_naive_expansion()
+    test_monthly_end_of_month_clamps()
+    test_weekly_count_counts_from_anchor()
+    print("✓ 重复规则测试通过")
@@ -0,0 +1,49 @@
+# test_series.py - 重复任务的实例：修改后物化、删除后不再出现；无效的重复规则返回 400
+from fastapi.testclient import TestClient
+
+import main
+
+def _series(client, **rule) -> dict:
+    response = client.post("/tasks", json={
+        "name": "每日站会", "due_date": "2026-03-02T09:30:00",
+        "recurrence": {"freq": "daily", **rule},
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def _calendar_ids(client, start: str, end: str) -> set:
+    days = client.get(f"/tasks/calendar?start={start}&end={end}").json()
+    return {task["id"] for day in days.values() for tasks in day.values() for task in tasks}
+
+def test_deleted_materialized_occurrence_stays_deleted():
+    client = TestClient(main.app)
+    series = _series(client)
+    occurrence_id = f"{series['id']}@2026-03-04"
+
+    # 修改实例使其物化，再删除
+    assert client.put(f"/tasks/{occurrence_id}", json={"name": "改期的站会"}).status_code == 200
+    assert occurrence_id in main.tasks_db
+    assert client.delete(f"/tasks/{occurrence_id}").status_code == 200
+
+    assert client.get(f"/tasks/{occurrence_id}").status_code == 404
+    ids = _calendar_ids(client, "2026-03-03", "2026-03-05")
+    assert occurrence_id not in ids
+    assert {f"{series['id']}@2026-03-03", f"{series['id']}@2026-03-05"} <= ids
+    assert client.get(f"/tasks/{series['id']}").json()["recurrence"]["exdates"] == ["2026-03-04"]
+
+def test_non_positive_count_rejected():
+    client = TestClient(main.app)
+    for count in (0, -1):
+        response = client.post("/tasks", json={
+            "name": "无效次数", "due_date": "2026-03-02T09:30:00",
+            "recurrence": {"freq": "daily", "count": count},
+        })
+        assert response.status_code == 400, response.text
+    series = _series(client, count=2)
+    response = client.put(f"/tasks/{series['id']}", json={"recurrence": {"freq": "daily", "count": 0}})
+    assert response.status_code == 400
+
+if __name__ == "__main__":
+    test_deleted_materialized_occurrence_stays_deleted()
+    test_non_positive_count_rejected()
+    print("✓ 重复任务实例测试通过")
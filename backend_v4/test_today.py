@@ -0,0 +1,91 @@
+# test_today.py - 今日视图：随写入增量维护、跨过午夜滚动后的结果应与从全部任务重新构建的结果一致
+import random
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import main
+from dates import Clock, DayWindow
+from today import SECTIONS, TodayView
+
+UTC = timezone.utc
+DAY = 86400
+
+def _window(day: date) -> DayWindow:
+    start = datetime(day.year, day.month, day.day, tzinfo=UTC).timestamp()
+    return DayWindow(day, start, start + DAY)
+
+def _task(rng, task_id: str, first: date):
+    due = None
+    if rng.random() < 0.8:
+        due = _window(first).start + rng.uniform(-5, 15) * DAY
+    scheduled = first + timedelta(days=rng.randint(-3, 12)) if rng.random() < 0.4 else None
+    return SimpleNamespace(id=task_id, completed=rng.random() < 0.15, recurrence=None,
+                           due_ts=due, scheduled_date=scheduled)
+
+def _ids(view: TodayView) -> dict:
+    return {name: set(view.sections[name]) for name in SECTIONS}
+
+def test_roll_matches_rebuild():
+    rng = random.Random(48)
+    first = date(2026, 3, 1)
+    for _ in range(50):
+        tasks = {f"t{i}": _task(rng, f"t{i}", first) for i in range(rng.randint(0, 60))}
+        view = TodayView(UTC, _window(first))
+        view.reset(_window(first), tasks.values(), {})
+        for offset in range(1, 12):
+            # 当天的写入：新增、修改（完成、改期）、删除
+            for _ in range(rng.randint(0, 8)):
+                task_id = f"t{rng.randrange(80)}"
+                old = tasks.get(task_id)
+                new = None if old is not None and rng.random() < 0.3 else _task(rng, task_id, first)
+                if new is None:
+                    del tasks[task_id]
+                else:
+                    tasks[task_id] = new
+                view.apply(old, new)
+
+            window = _window(first + timedelta(days=offset))
+            arriving = [task for task in tasks.values()
+                        if (task.due_ts is not None and window.start <= task.due_ts < window.end)
+                        or task.scheduled_date == window.day]
+            view.roll(window, arriving, {})
+            rebuilt = TodayView(UTC, window)
+            rebuilt.reset(window, tasks.values(), {})
+            assert _ids(view) == _ids(rebuilt), window.day
+            assert view.snapshot()["counts"] == rebuilt.snapshot()["counts"]
+
+def _snapshot_ids(client, zone: str) -> dict:
+    snapshot = client.get("/tasks/today?limit=1000", headers={"X-Timezone": zone}).json()
+    return {name: sorted(task["id"] for task in snapshot[name]) for name in SECTIONS}
+
+def test_endpoint_rollover_matches_rebuild():
+    now = [datetime(2031, 5, 10, 12, tzinfo=UTC).timestamp()]
+    saved_clock = main.clock
+    main.clock = Clock(lambda: now[0])
+    main.today_views.clear()
+    try:
+        client = TestClient(main.app)
+        for i in range(24):
+            client.post("/tasks", json={"name": f"今日 {i}", "due_date": f"2031-05-{10 + i // 4:02d}T{(i * 5) % 24:02d}:30:00"})
+        client.post("/tasks", json={"name": "计划", "scheduled_date": "2031-05-12"})
+        client.post("/tasks", json={"name": "每日", "due_date": "2031-05-01T09:00:00+00:00",
+                                    "recurrence": {"freq": "daily", "until": "2031-06-30"}})
+        zones = ("UTC", "Asia/Tokyo", "America/Los_Angeles")
+        for zone in zones:
+            _snapshot_ids(client, zone)  # 建立视图
+
+        for _ in range(4):
+            now[0] += DAY  # 视图滚动到下一天（增量）
+            incremental = {zone: _snapshot_ids(client, zone) for zone in zones}
+            main.today_views.clear()  # 从全部任务重新构建
+            assert {zone: _snapshot_ids(client, zone) for zone in zones} == incremental
+    finally:
+        main.clock = saved_clock
+        main.today_views.clear()
+
+if __name__ == "__main__":
+    test_roll_matches_rebuild()
+    test_endpoint_rollover_matches_rebuild()
+    print("✓ 今日视图测试通过")
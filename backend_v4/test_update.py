@@ -0,0 +1,42 @@
+# test_update.py - 任务写入的校验：不可为空的字段显式传 null、超出范围的时间返回 422，任务保持不变
+from fastapi.testclient import TestClient
+
+import main
+
+def test_put_null_for_required_field_rejected():
+    client = TestClient(main.app)
+    task = client.post("/tasks", json={"name": "不可为空", "tags": ["a"]}).json()
+
+    for field in ("name", "completed", "status", "priority", "tags"):
+        response = client.put(f"/tasks/{task['id']}", json={field: None})
+        assert response.status_code == 422, (field, response.text)
+        assert response.json()["detail"][0]["loc"] == ["body", field]
+
+    current = client.get(f"/tasks/{task['id']}").json()
+    assert current["version"] == 1
+    assert current["name"] == "不可为空" and current["tags"] == ["a"]
+
+def test_put_null_clears_optional_fields():
+    client = TestClient(main.app)
+    task = client.post("/tasks", json={"name": "可以清空", "due_date": "2026-06-01T10:00:00",
+                                       "depends_on": []}).json()
+
+    response = client.put(f"/tasks/{task['id']}", json={"due_date": None, "depends_on": None})
+    assert response.status_code == 200, response.text
+    assert response.json()["due_date"] is None
+    assert response.json()["depends_on"] == []
+
+def test_out_of_range_dates_rejected():
+    client = TestClient(main.app)
+    for due in ("0001-01-01T00:00:00", "9999-12-31T23:00:00-12:00"):
+        response = client.post("/tasks", json={"name": "越界", "due_date": due})
+        assert response.status_code == 422, (due, response.text)
+    task = client.post("/tasks", json={"name": "范围内", "due_date": "0001-01-03T00:00:00"}).json()
+    response = client.put(f"/tasks/{task['id']}", json={"remind_at": "9999-12-31T00:00:00"})
+    assert response.status_code == 422, response.text
+
+if __name__ == "__main__":
+    test_put_null_for_required_field_rejected()
+    test_put_null_clears_optional_fields()
+    test_out_of_range_dates_rejected()
+    print("✓ 更新校验测试通过")
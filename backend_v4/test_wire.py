@@ -0,0 +1,45 @@
+# test_wire.py - 表示形式协商：响应声明 Vary，各表示形式的 ETag 互不相同，且都可以用于 If-Match
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import wire
+
+FORMATS = {
+    "json": {},
+    "json_compact": {"X-Compact": "1"},
+    "msgpack": {"Accept": "application/msgpack"},
+    "msgpack_compact": {"Accept": "application/msgpack", "X-Compact": "1"},
+}
+
+def test_vary_and_etag_per_format():
+    if wire.msgpack is None:
+        pytest.skip("未安装 msgpack")
+    client = TestClient(main.app)
+    task = client.post("/tasks", json={"name": "表示形式"}).json()
+
+    etags = {}
+    for name, headers in FORMATS.items():
+        response = client.get(f"/tasks/{task['id']}", headers=headers)
+        assert response.status_code == 200
+        vary = {value.strip().lower() for value in response.headers["vary"].split(",")}
+        assert {"accept", "x-compact"} <= vary, (name, response.headers["vary"])
+        etags[name] = response.headers["etag"]
+    assert etags["json"] == '"1"'
+    assert len(set(etags.values())) == len(FORMATS), etags
+
+    # 列表响应同样声明 Vary
+    vary = client.get("/tasks", headers=FORMATS["msgpack"]).headers["vary"].lower()
+    assert "accept" in vary and "x-compact" in vary
+
+    # 任何表示形式的 ETag 都对应同一个版本
+    response = client.put(f"/tasks/{task['id']}", json={"name": "改名"},
+                          headers={"If-Match": etags["msgpack_compact"], **FORMATS["json_compact"]})
+    assert response.status_code == 200, response.text
+    assert response.headers["etag"] == '"2-c"'
+    response = client.put(f"/tasks/{task['id']}", json={"name": "旧版本"}, headers={"If-Match": etags["json_compact"]})
+    assert response.status_code == 412
+
+if __name__ == "__main__":
+    test_vary_and_etag_per_format()
+    print("✓ 表示形式测试通过")
@@ -0,0 +1,70 @@
+# test_workqueue.py - 惰性删除的工作队列：任意次重排、移出之后，遍历顺序应与对存活条目全量排序的结果一致
+import random
+
+from fastapi.testclient import TestClient
+
+import main
+from workqueue import WorkQueue
+
+def test_matches_full_sort():
+    rng = random.Random(50)
+    for _ in range(200):
+        queue = WorkQueue()
+        live = {}  # key -> (排序键, 最后一次实际压入的顺序)
+        pushes = 0
+        for _ in range(rng.randint(1, 400)):
+            key = rng.randrange(60)
+            if rng.random() < 0.25:
+                live.pop(key, None)  # 完成或删除
+                queue.update(key, None)
+                continue
+            sort_key = (rng.randint(0, 2), rng.choice([rng.random(), float("inf")]))
+            if live.get(key, (None,))[0] != sort_key:  # 排序键不变时保留原条目
+                live[key] = (sort_key, pushes)
+                pushes += 1
+            queue.update(key, sort_key)
+
+            expected = sorted(live, key=live.get)
+            assert list(queue.iter_smallest()) == expected
+            assert len(queue) == len(live)
+            # 作废条目不超过一半（堆较小时不压缩）
+            assert len(queue.heap) <= max(64, 2 * len(live)) + 1
+
+def test_take_first_n_stops_early():
+    queue = WorkQueue()
+    for key in range(1000):
+        queue.update(key, (key % 7, key))
+    first = []
+    for key in queue.iter_smallest():
+        first.append(key)
+        if len(first) == 5:
+            break
+    assert first == [0, 7, 14, 21, 28]
+
+def test_next_endpoint_after_updates():
+    client = TestClient(main.app)
+    ids = []
+    for i in range(30):
+        task = client.post("/tasks", json={
+            "name": f"队列 {i}", "priority": ("low", "medium", "high")[i % 3],
+            "due_date": f"2026-07-{1 + i % 28:02d}T12:00:00", "estimated_hours": i % 5,
+        }).json()
+        ids.append(task["id"])
+    for task_id in ids[::4]:
+        client.put(f"/tasks/{task_id}", json={"priority": "high", "estimated_hours": 9})  # 重排
+    for task_id in ids[1::5]:
+        client.put(f"/tasks/{task_id}", json={"completed": True})  # 完成
+    for task_id in ids[2::6]:
+        client.delete(f"/tasks/{task_id}")  # 删除
+
+    live = [task for task in main.tasks_db.values() if main.next_key(task) is not None]
+    result = client.get(f"/tasks/next?n={len(live)}&include_blocked=true").json()
+    assert [main.next_key(main.tasks_db[task["id"]]) for task in result] == sorted(map(main.next_key, live))
+    top = client.get("/tasks/next?n=3&include_blocked=true").json()
+    assert [task["id"] for task in top] == [task["id"] for task in result[:3]]
+
+if __name__ == "__main__":
+    test_matches_full_sort()
+    test_take_first_n_stops_early()
+    test_next_endpoint_after_updates()
+    print("✓ 工作队列测试通过")
@@ -0,0 +1,114 @@
+# today.py - “今天”视图的物化：按时区维护逾期、今天到期、今天计划三组未完成任务
+#
+# 写入时只调整变化的那一个任务；跨过午夜时把“今天到期”并入“逾期”，再由调用方补上新一天的任务，
+# 不需要扫描全部任务。读取时直接返回缓存的结果
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dates import DayWindow
+
+SECTIONS = ("overdue", "due", "scheduled")
+
+def _due_key(task) -> float:
+    return task.due_ts
+
+class TodayView:
+    """一个时区的“今天”视图
+
+    任务按 id -> 任务对象 保存，读取时不需要再查存储；重复任务今天的虚拟实例按模板 ID 单独保存
+    （kind 为 "due" 或 "scheduled"）。apply/set_occurrences/reset/roll 由调用方在写锁内调用
+    """
+
+    def __init__(self, zone, window: DayWindow):
+        self.zone = zone
+        self.window = window
+        self.sections: Dict[str, Dict[str, Any]] = {name: {} for name in SECTIONS}
+        self.occurrences: Dict[str, List[Tuple[str, Any]]] = {}
+        self._snapshot: Optional[dict] = None
+        self._generation = 0  # 每次变更递增，避免并发读取时把旧结果写回缓存
+
+    def sections_of(self, task) -> Tuple[str, ...]:
+        """任务在当前窗口中所属的分组；已完成的任务和重复任务模板不属于任何分组"""
+        if task is None or task.completed or task.recurrence is not None:
+            return ()
+        found = []
+        if task.due_ts is not None:
+            if task.due_ts < self.window.start:
+                found.append("overdue")
+            elif task.due_ts < self.window.end:
+                found.append("due")
+        if task.scheduled_date == self.window.day:
+            found.append("scheduled")
+        return tuple(found)
+
+    def _changed(self):
+        self._generation += 1
+        self._snapshot = None
+
+    def apply(self, old, new):
+        """增量更新：新增时 old 为 None，删除时 new 为 None"""
+        changed = False
+        if old is not None:
+            for section in self.sections.values():
+                if section.pop(old.id, None) is not None:
+                    changed = True
+        if new is not None:
+            for name in self.sections_of(new):
+                self.sections[name][new.id] = new
+                changed = True
+        if changed:
+            self._changed()
+
+    def set_occurrences(self, series_id: str, items: List[Tuple[str, Any]]):
+        if items:
+            self.occurrences[series_id] = items
+        elif self.occurrences.pop(series_id, None) is None:
+            return
+        self._changed()
+
+    def reset(self, window: DayWindow, tasks: Iterable, occurrences: Dict[str, List[Tuple[str, Any]]]):
+        """按 window 从全部任务重新构建"""
+        self.window = window
+        self.sections = {name: {} for name in SECTIONS}
+        for task in tasks:
+            for name in self.sections_of(task):
+                self.sections[name][task.id] = task
+        self.occurrences = occurrences
+        self._changed()
+
+    def roll(self, window: DayWindow, arriving: Iterable, occurrences: Dict[str, List[Tuple[str, Any]]]):
+        """滚动到紧接着的下一天：昨天到期的任务转为逾期，arriving 为新一天到期或计划的任务"""
+        overdue = self.sections["overdue"]
+        overdue.update(self.sections["due"])
+        self.window = window
+        self.sections = {"overdue": overdue, "due": {}, "scheduled": {}}
+        for task in arriving:
+            for name in self.sections_of(task):
+                self.sections[name][task.id] = task
+        self.occurrences = occurrences
+        self._changed()
+
+    def snapshot(self) -> dict:
+        """当前视图；两次变更之间复用同一个结果"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        generation = self._generation
+        # 先整体复制再排序：排序的 key 调用会让出 GIL，其他线程可能同时在写入
+        overdue = list(self.sections["overdue"].values())
+        due = list(self.sections["due"].values())
+        scheduled = list(self.sections["scheduled"].values())
+        for items in list(self.occurrences.values()):
+            for kind, occurrence in items:
+                (due if kind == "due" else scheduled).append(occurrence)
+        overdue.sort(key=_due_key)
+        due.sort(key=_due_key)
+        snapshot = {
+            "date": self.window.day.isoformat(),
+            "counts": {"overdue": len(overdue), "due": len(due), "scheduled": len(scheduled)},
+            "overdue": overdue,
+            "due": due,
+            "scheduled": scheduled,
+        }
+        if generation == self._generation:
+            self._snapshot = snapshot
+        return snapshot
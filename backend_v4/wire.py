@@ -0,0 +1,178 @@
+# wire.py - 响应的传输格式
+#
+# 表示形式（FormatMiddleware 协商，结果放在 ContextVar 中，由响应类读取）：
+#   Accept: application/msgpack          MessagePack（需要安装 msgpack，否则仍返回 JSON）
+#   X-Compact: 1 或 ?compact=1            紧凑模式：省略值为 null 的字段
+# 压缩（CompressionMiddleware 按 Accept-Encoding 协商）：br（需要安装 brotli）优先，其次 gzip；
+# 小于 minimum_size 的响应和 SSE 不压缩，流式响应逐块压缩
+import contextvars
+import zlib
+from typing import Callable, Optional
+from urllib.parse import parse_qs
+
+try:
+    import brotli  # 可选依赖
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack  # 可选依赖
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+JSON_COMPACT = "json-compact"
+MSGPACK = "msgpack"
+MSGPACK_COMPACT = "msgpack-compact"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_MSGPACK_ACCEPT = (b"application/msgpack", b"application/x-msgpack", b"application/vnd.msgpack")
+
+# 可压缩的内容类型（前缀匹配）；text/event-stream 需要立即送达，不压缩
+COMPRESSIBLE_TYPES = (b"application/json", b"application/x-ndjson", b"application/msgpack", b"text/csv",
+                      b"text/plain")
+
+_current_format: contextvars.ContextVar[str] = contextvars.ContextVar("wire_format", default=JSON)
+
+def current_format() -> str:
+    """当前请求协商出的表示形式"""
+    return _current_format.get()
+
+def negotiate_format(headers: dict, query_string: bytes) -> str:
+    packed = msgpack is not None and any(t in headers.get(b"accept", b"") for t in _MSGPACK_ACCEPT)
+    compact = headers.get(b"x-compact") == b"1" or \
+        parse_qs(query_string.decode("latin-1")).get("compact") == ["1"]
+    if packed:
+        return MSGPACK_COMPACT if compact else MSGPACK
+    return JSON_COMPACT if compact else JSON
+
+def negotiate_encoding(accept_encoding: bytes) -> Optional[str]:
+    """从 Accept-Encoding 中选择 br 或 gzip（忽略 q=0 的项）"""
+    accepted = set()
+    for item in accept_encoding.decode("latin-1").lower().split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+class FormatMiddleware:
+    """纯 ASGI 中间件：协商表示形式并写入 ContextVar；只处理 HTTP 请求"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _current_format.set(negotiate_format(dict(scope.get("headers") or []),
+                                                     scope.get("query_string", b"")))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_format.reset(token)
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)  # wbits=31：gzip 格式
+
+    def chunk(self, data: bytes) -> bytes:
+        """压缩一块数据并立即冲刷，保证流式响应的每一块都能被客户端解出"""
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+class CompressionMiddleware:
+    """纯 ASGI 中间件：按 Accept-Encoding 压缩响应
+
+    on_compress(encoding, 原始字节数, 压缩后字节数) 在响应结束时调用，用于指标
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 on_compress: Optional[Callable[[str, int, int], None]] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.on_compress = on_compress
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(dict(scope.get("headers") or []).get(b"accept-encoding", b""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+        sizes = [0, 0]  # 原始字节数, 压缩后字节数
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message  # 等看到第一块内容后再决定是否压缩
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = start_message.get("headers", [])
+                content_type = next((v for k, v in headers if k.lower() == b"content-type"), b"")
+                already_encoded = any(k.lower() == b"content-encoding" for k, _ in headers)
+                if already_encoded or not content_type.startswith(COMPRESSIBLE_TYPES) or \
+                        (not more_body and len(body) < self.minimum_size):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                vary = b", ".join(v for k, v in headers if k.lower() == b"vary")
+                headers = [(k, v) for k, v in headers if k.lower() not in (b"content-length", b"vary")]
+                headers.append((b"content-encoding", encoding.encode()))
+                headers.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+                if not more_body:
+                    data = compressor.chunk(body) + compressor.finish()
+                    headers.append((b"content-length", str(len(data)).encode()))
+                    await send({**start_message, "headers": headers})
+                    await send({"type": "http.response.body", "body": data})
+                    self._record(encoding, len(body), len(data))
+                    return
+                await send({**start_message, "headers": headers})
+
+            data = compressor.chunk(body) if body else b""
+            sizes[0] += len(body)
+            if not more_body:
+                data += compressor.finish()
+            sizes[1] += len(data)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+            if not more_body:
+                self._record(encoding, *sizes)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _record(self, encoding: str, raw: int, wire: int):
+        if self.on_compress is not None:
+            self.on_compress(encoding, raw, wire)
@@ -0,0 +1,53 @@
+# workqueue.py - 按排序键维护的工作队列：二叉堆 + 惰性删除，取前 N 个时既不弹出也不全量排序
+import heapq
+from typing import Any, Dict, Hashable, Iterator, List, Optional
+
+_REMOVED = object()  # 已作废条目的 key
+
+class WorkQueue:
+    """一组 key 及其排序键，按排序键从小到大遍历
+
+    update 压入新条目，旧条目留在堆中标记作废（惰性删除），作废条目超过一半时重建堆。
+    iter_smallest 从堆顶按序遍历：候选小顶堆中只放已取出节点的子节点，取前 N 个为 O(N log N)。
+    不加锁，由调用方保证遍历期间没有写入
+    """
+
+    def __init__(self):
+        self.heap: List[list] = []  # [排序键, 序号, key]；序号唯一，比较时不会比较到 key
+        self.entries: Dict[Hashable, list] = {}
+        self._seq = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, key: Hashable, sort_key: Optional[Any]):
+        """设置 key 的排序键；sort_key 为 None 表示移出队列"""
+        old = self.entries.pop(key, None)
+        if old is not None:
+            if sort_key is not None and old[0] == sort_key:
+                self.entries[key] = old
+                return
+            old[2] = _REMOVED
+        if sort_key is not None:
+            entry = [sort_key, self._seq, key]
+            self._seq += 1
+            self.entries[key] = entry
+            heapq.heappush(self.heap, entry)
+        if len(self.heap) > 64 and len(self.heap) > 2 * len(self.entries):
+            self.heap = list(self.entries.values())
+            heapq.heapify(self.heap)
+
+    def iter_smallest(self) -> Iterator[Hashable]:
+        """按排序键从小到大产出 key"""
+        heap = self.heap
+        if not heap:
+            return
+        candidates = [(heap[0][0], heap[0][1], 0)]
+        while candidates:
+            _, _, index = heapq.heappop(candidates)
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(candidates, (heap[child][0], heap[child][1], child))
+            key = heap[index][2]
+            if key is not _REMOVED:
+                yield key